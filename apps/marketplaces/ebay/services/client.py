@@ -11,6 +11,7 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.conf import settings
+from shoesbot.endpoints import EBAY_API_BASE, EBAY_AUTH_BASE, EBAY_FINDING_URL
 
 # Try to load .env if not already loaded
 try:
@@ -54,6 +55,9 @@ class EbayClient:
         else:
             self.api_base = 'https://api.ebay.com'
             self.oauth_base = 'https://auth.ebay.com'
+        # Local stand-in (tools/mock_gateway) or any other override
+        self.api_base = EBAY_API_BASE or self.api_base
+        self.oauth_base = EBAY_AUTH_BASE or self.oauth_base
 
     def _log_request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
         """
@@ -887,7 +891,7 @@ class EbayClient:
         # Use eBay Finding API - НЕ используем фильтры по UPC/EAN, только keywords
         # Это позволяет находить товары даже если продавцы не заполнили Model
         try:
-            url = 'https://svcs.ebay.com/services/search/FindingService/v1'
+            url = EBAY_FINDING_URL
             params = {
                 'OPERATION-NAME': 'findItemsAdvanced',
                 'SERVICE-VERSION': '1.0.0',
@@ -1153,7 +1157,7 @@ class EbayClient:
             return []
         
         try:
-            url = 'https://svcs.ebay.com/services/search/FindingService/v1'
+            url = EBAY_FINDING_URL
             params = {
                 'OPERATION-NAME': 'findCompletedItems',
                 'SERVICE-VERSION': '1.0.0',
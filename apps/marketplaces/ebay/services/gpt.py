@@ -13,6 +13,7 @@ import sys
 import os
 from typing import List, Dict, Any, Optional
 from django.conf import settings
+from shoesbot.endpoints import OPENAI_CHAT_URL
 
 # Import existing AI helpers
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../../shoessite/photos'))
@@ -207,7 +208,7 @@ Return ONLY valid JSON:
 }}"""
 
                 response = requests.post(
-                    'https://api.openai.com/v1/chat/completions',
+                    OPENAI_CHAT_URL,
                     headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
                     json={
                         'model': 'gpt-4o',
@@ -646,7 +646,7 @@ def ebay_candidate_analyze(request, candidate_id):
                     barcodes.append(barcode.data)
                 # Collect GG labels (допускаем как явный source, так и распознавание по данным)
                 val = (barcode.data or '').upper()
-                if barcode.source == 'gg-label' or 'GG' in val or val.startswith('Q'):
+                if barcode.source.startswith('gg-label') or 'GG' in val or val.startswith('Q'):
                     if barcode.data not in gg_labels:
                         gg_labels.append(barcode.data)
     
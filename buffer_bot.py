@@ -8,6 +8,7 @@ from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
 import aiohttp
 import base64
+from shoesbot.endpoints import OPENAI_CHAT_URL
 
 load_dotenv()
 
@@ -100,7 +101,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             openai_key = os.getenv('OPENAI_API_KEY')
             if openai_key:
                 import requests
-                resp = requests.post('https://api.openai.com/v1/chat/completions',
+                resp = requests.post(OPENAI_CHAT_URL,
                     headers={'Authorization': f'Bearer {openai_key}'},
                     json={
                         'model': 'gpt-4o-mini',
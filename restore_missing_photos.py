@@ -19,6 +19,7 @@ from photos.models import Photo
 import requests
 from django.core.files.base import ContentFile
 from dotenv import load_dotenv
+from shoesbot.endpoints import telegram_file_url, telegram_method_url
 
 load_dotenv()
 
@@ -30,7 +31,7 @@ if not BOT_TOKEN:
 def get_file_from_telegram(file_id):
     """Получить файл из Telegram по file_id."""
     # Получаем информацию о файле
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile"
+    url = telegram_method_url(BOT_TOKEN, "getFile")
     response = requests.get(url, params={'file_id': file_id})
     if not response.ok:
         return None
@@ -42,7 +43,7 @@ def get_file_from_telegram(file_id):
     file_path = file_info['result']['file_path']
     
     # Скачиваем файл
-    download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
+    download_url = telegram_file_url(BOT_TOKEN, file_path)
     file_response = requests.get(download_url)
     if not file_response.ok:
         return None
@@ -0,0 +1,132 @@
+"""Admission control between PhotoBuffer flushes and the decode pipeline.
+
+Albums are queued per chat and admitted round-robin across chats, so one
+operator dumping many albums cannot starve everyone else.  Inside an album,
+downloads, local decoding and paid API calls share global concurrency limits
+so the Telegram connection pool and API quotas are never exhausted.
+"""
+from __future__ import annotations
+import asyncio
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from shoesbot.logging_setup import logger
+
+ALBUM_CONCURRENCY = int(os.getenv("ALBUM_CONCURRENCY", "4"))
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))  # HTTPXRequest pool is 20
+DECODE_CONCURRENCY = int(os.getenv("DECODE_CONCURRENCY", str(os.cpu_count() or 2)))
+PAID_API_CONCURRENCY = int(os.getenv("PAID_API_CONCURRENCY", "6"))
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class ConcurrencyLimits:
+    """Global semaphores for the three kinds of per-photo work."""
+
+    def __init__(self, downloads: int, decode: int, paid_api: int):
+        self.download = asyncio.Semaphore(max(1, downloads))
+        self.decode = asyncio.Semaphore(max(1, decode))
+        self.paid_api = asyncio.Semaphore(max(1, paid_api))
+
+    def for_decoder(self, decoder) -> asyncio.Semaphore:
+        """Paid (network) decoders and local decoders are limited separately."""
+        return self.paid_api if getattr(decoder, "paid", False) else self.decode
+
+
+@dataclass
+class _Job:
+    chat_id: int
+    factory: Callable[[], Awaitable[None]]
+    on_position: Optional[PositionCallback]
+    done: asyncio.Future
+    last_position: int = field(default=-1)
+
+
+class AlbumScheduler:
+    """Round-robin album queue with a global limit on albums in flight."""
+
+    def __init__(self, max_albums: int):
+        self.max_albums = max(1, max_albums)
+        self.queues: Dict[int, Deque[_Job]] = {}
+        self.ring: Deque[int] = deque()  # chats with queued albums, in turn order
+        self.running = 0
+
+    def pending(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    async def run(self, chat_id: int, factory: Callable[[], Awaitable[None]],
+                  on_position: Optional[PositionCallback] = None) -> None:
+        """Queue an album and wait until it has been processed."""
+        job = _Job(chat_id, factory, on_position, asyncio.get_running_loop().create_future())
+        if chat_id not in self.queues:
+            self.queues[chat_id] = deque()
+            self.ring.append(chat_id)
+        self.queues[chat_id].append(job)
+        self._dispatch()
+        self._notify_positions()
+        await job.done
+
+    def _next_job(self) -> Optional[_Job]:
+        if not self.ring:
+            return None
+        chat_id = self.ring.popleft()
+        queue = self.queues[chat_id]
+        job = queue.popleft()
+        if queue:
+            self.ring.append(chat_id)  # back of the line for its next album
+        else:
+            del self.queues[chat_id]
+        return job
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_albums:
+            job = self._next_job()
+            if job is None:
+                return
+            self.running += 1
+            asyncio.get_running_loop().create_task(self._run_job(job))
+
+    async def _run_job(self, job: _Job) -> None:
+        try:
+            await job.factory()
+        except Exception as e:
+            logger.error(f"album_scheduler: job for chat={job.chat_id} failed: {e}", exc_info=True)
+        finally:
+            self.running -= 1
+            if not job.done.done():
+                job.done.set_result(None)
+            self._dispatch()
+            self._notify_positions()
+
+    def positions(self) -> List[Tuple[_Job, int]]:
+        """Queued jobs with their 1-based admission order under round-robin."""
+        order: List[Tuple[_Job, int]] = []
+        queues = [list(self.queues[c]) for c in self.ring]
+        depth = 0
+        while True:
+            row = [q[depth] for q in queues if depth < len(q)]
+            if not row:
+                return order
+            for job in row:
+                order.append((job, len(order) + 1))
+            depth += 1
+
+    def _notify_positions(self) -> None:
+        loop = asyncio.get_running_loop()
+        for job, position in self.positions():
+            if job.on_position and position != job.last_position:
+                job.last_position = position
+                loop.create_task(self._safe_notify(job.on_position, position))
+
+    @staticmethod
+    async def _safe_notify(callback: PositionCallback, position: int) -> None:
+        try:
+            await callback(position)
+        except Exception as e:
+            logger.debug(f"album_scheduler: position callback failed: {e}")
+
+
+# Global instances
+limits = ConcurrencyLimits(DOWNLOAD_CONCURRENCY, DECODE_CONCURRENCY, PAID_API_CONCURRENCY)
+scheduler = AlbumScheduler(ALBUM_CONCURRENCY)
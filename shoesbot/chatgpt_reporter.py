@@ -6,6 +6,7 @@ import os
 import json
 from typing import Optional, Dict, List
 from shoesbot.logging_setup import logger
+from shoesbot.endpoints import OPENAI_CHAT_URL
 
 
 class ChatGPTReporter:
@@ -21,7 +22,7 @@ class ChatGPTReporter:
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.model = model
-        self.base_url = "https://api.openai.com/v1/chat/completions"
+        self.base_url = OPENAI_CHAT_URL
         
         if not self.api_key:
             logger.warning("OpenAI API key not set. Set OPENAI_API_KEY")
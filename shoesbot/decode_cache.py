@@ -0,0 +1,144 @@
+"""Persistent cache of decoder outputs keyed by photo content.
+
+Network decoders are slow and paid, and the same photo comes back often:
+retries, reprocessing from Django, evaluation runs over the archive.  Entries
+are keyed by (sha1 of the photo bytes, decoder name) and keep the codes plus
+the latency and cost of the original call, so replays can still be judged.
+Stored in SQLite, safe to share between processes.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Dict, List, Optional
+from PIL import Image
+from shoesbot.decoders.base import Decoder
+from shoesbot.models import Barcode, barcode_from_payload, barcode_to_payload
+
+DECODE_CACHE_PATH = os.getenv(
+    "DECODE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "decode_cache.db"),
+)
+# Entries older than this are ignored (0 = keep forever)
+DECODE_CACHE_TTL = float(os.getenv("DECODE_CACHE_TTL", "0"))
+
+
+@dataclass(frozen=True)
+class CachedDecode:
+    barcodes: List[Barcode]
+    ms: int
+    cost: float
+    created: float
+
+
+def image_key(image_bytes: bytes) -> str:
+    return hashlib.sha1(image_bytes).hexdigest()
+
+
+class DecodeCache:
+    def __init__(self, path: Optional[str] = None, ttl: float = DECODE_CACHE_TTL):
+        self.path = path or DECODE_CACHE_PATH
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS decodes (
+                        image_sha1 TEXT NOT NULL,
+                        decoder TEXT NOT NULL,
+                        barcodes TEXT NOT NULL,
+                        ms INTEGER NOT NULL,
+                        cost REAL NOT NULL DEFAULT 0,
+                        created REAL NOT NULL,
+                        PRIMARY KEY (image_sha1, decoder)
+                    )
+                """)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # WAL lets evaluation workers and the bot read while one process writes
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, digest: str, decoder: str) -> Optional[CachedDecode]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT barcodes, ms, cost, created FROM decodes WHERE image_sha1 = ? AND decoder = ?",
+                (digest, decoder),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None or (self.ttl and time.time() - row[3] > self.ttl):
+            return None
+        barcodes = [barcode_from_payload(b) for b in json.loads(row[0])]
+        return CachedDecode(barcodes, row[1], row[2], row[3])
+
+    def put(self, digest: str, decoder: str, barcodes: List[Barcode], ms: int, cost: float = 0.0) -> None:
+        # photo_index is not stored: it belongs to the album, not to the image
+        payload = json.dumps([{k: v for k, v in barcode_to_payload(b).items() if k != "photo_index"} for b in barcodes])
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO decodes (image_sha1, decoder, barcodes, ms, cost, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, decoder, payload, int(ms), float(cost), time.time()),
+                )
+        finally:
+            conn.close()
+
+    def __len__(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM decodes").fetchone()[0]
+        finally:
+            conn.close()
+
+
+class CachedDecoder(Decoder):
+    """Decoder wrapper answering repeated photos from the cache.
+
+    Only paid decoders are cached by default: local ones are cheaper to rerun
+    than to look up, and their output improves with every decoder fix.
+    """
+
+    def __init__(self, inner: Decoder, cache: DecodeCache, paid_only: bool = True):
+        self.inner = inner
+        self.cache = cache
+        self.name = inner.name
+        self.max_side = inner.max_side
+        self.paid = inner.paid
+        self.enabled = inner.paid or not paid_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # decode() runs on the service's worker threads
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
+        if not self.enabled or not image_bytes:
+            return self.inner.decode(image, image_bytes)
+        digest = image_key(image_bytes)
+        cached = self.cache.get(digest, self.name)
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is not None:
+            return cached.barcodes
+        t0 = perf_counter()
+        out = self.inner.decode(image, image_bytes)
+        self.cache.put(digest, self.name, out, ms=int((perf_counter() - t0) * 1000))
+        return out
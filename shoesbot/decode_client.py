@@ -0,0 +1,86 @@
+"""Client for the decode daemon (shoesbot.decode_service).
+
+Set DECODE_SERVICE_URL (e.g. http://127.0.0.1:8765) to send decodes there.
+Without it, decode() runs a warm in-process pipeline instead, built once per
+process with the same DecodeCache, so callers such as Django's "reprocess
+photo" behave the same with or without the daemon.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import threading
+from typing import Any, Collection, Dict, List, Optional, Tuple
+import requests
+from shoesbot.logging_setup import logger
+from shoesbot.models import Barcode, barcode_from_payload
+
+DECODE_SERVICE_URL = os.getenv("DECODE_SERVICE_URL", "").rstrip("/")
+DECODE_SERVICE_TIMEOUT = float(os.getenv("DECODE_SERVICE_TIMEOUT", "90"))
+
+
+class DecodeServiceError(Exception):
+    """The daemon is unreachable or answered with an error."""
+
+
+class DecodeClient:
+    def __init__(self, url: str, timeout: float = DECODE_SERVICE_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def decode(self, raw: bytes, mode: str = "parallel", exclude: Collection[str] = (),
+               photo_index: Optional[int] = None) -> Tuple[List[Barcode], List[Dict[str, Any]]]:
+        params: Dict[str, Any] = {"mode": mode}
+        if exclude:
+            params["exclude"] = ",".join(exclude)
+        if photo_index is not None:
+            params["photo_index"] = photo_index
+        try:
+            resp = self.session.post(f"{self.url}/decode", params=params, data=raw, timeout=self.timeout,
+                                     headers={"Content-Type": "application/octet-stream"})
+        except requests.RequestException as e:
+            raise DecodeServiceError(f"decode service unreachable: {e}") from e
+        if not resp.ok:
+            raise DecodeServiceError(f"decode service HTTP {resp.status_code}: {resp.text[:200]}")
+        body = resp.json()
+        return [barcode_from_payload(b) for b in body["barcodes"]], body["timeline"]
+
+    async def decode_async(self, raw: bytes, mode: str = "parallel", exclude: Collection[str] = (),
+                           photo_index: Optional[int] = None) -> Tuple[List[Barcode], List[Dict[str, Any]]]:
+        return await asyncio.to_thread(self.decode, raw, mode, exclude, photo_index)
+
+    def health(self) -> Dict[str, Any]:
+        try:
+            resp = self.session.get(f"{self.url}/health", timeout=5)
+            resp.raise_for_status()
+            return resp.json()
+        except (requests.RequestException, ValueError) as e:
+            raise DecodeServiceError(f"decode service unhealthy: {e}") from e
+
+
+client: Optional[DecodeClient] = DecodeClient(DECODE_SERVICE_URL) if DECODE_SERVICE_URL else None
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def local_service():
+    """In-process DecodeService, created on first use and kept warm."""
+    global _local
+    with _local_lock:
+        if _local is None:
+            from shoesbot.decode_service import DecodeService
+            _local = DecodeService(workers=2)
+        return _local
+
+
+def decode(raw: bytes, mode: str = "parallel", exclude: Collection[str] = (),
+           photo_index: Optional[int] = None) -> Tuple[List[Barcode], List[Dict[str, Any]]]:
+    """Decode through the daemon when configured, else in-process; the result is the same."""
+    if client is not None:
+        try:
+            return client.decode(raw, mode, exclude, photo_index)
+        except DecodeServiceError as e:
+            logger.warning("decode_client: %s, decoding in-process", e)
+    results, timeline, _ = local_service().decode(raw, mode, exclude, photo_index)
+    return results, timeline
@@ -0,0 +1,190 @@
+"""Standalone decode daemon: warm decoders behind a localhost HTTP API.
+
+    python -m shoesbot.decode_service            # DECODE_SERVICE_HOST:DECODE_SERVICE_PORT
+
+The pipeline (ZBar, OpenCV, local GG reader, Vision, GG OCR, OpenAI) is built
+once at startup, paid decoders answer repeated photos from the shared
+DecodeCache, and decodes run on the service's own pool of DECODE_WORKERS
+threads, so decode capacity is sized and measured apart from the bot and the
+web workers.  Both call it through shoesbot.decode_client.
+
+    POST /decode?mode=parallel|smart|sequential&exclude=a,b&photo_index=N
+         body: raw image bytes
+         -> {"barcodes": [...], "timeline": [...], "ms": 123}
+    GET  /health   -> {"ok": true, "decoders": [...]}
+    GET  /metrics  -> request counts, latency percentiles, queue, cache hits
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from typing import Any, Collection, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from shoesbot.decode_cache import CachedDecoder, DecodeCache
+from shoesbot.image_loader import decode_side, load_rgb, open_draft
+from shoesbot.logging_setup import logger
+from shoesbot.models import Barcode, barcode_to_payload
+from shoesbot.pipeline import DecoderPipeline, default_pipeline
+
+DECODE_SERVICE_HOST = os.getenv("DECODE_SERVICE_HOST", "127.0.0.1")
+DECODE_SERVICE_PORT = int(os.getenv("DECODE_SERVICE_PORT", "8765"))
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", str(os.cpu_count() or 2)))
+MAX_IMAGE_BYTES = int(os.getenv("DECODE_MAX_IMAGE_MB", "25")) * 1024 * 1024
+MODES = ("parallel", "smart", "sequential")
+
+
+def cached_pipeline(pipeline: DecoderPipeline, cache: Optional[DecodeCache]) -> DecoderPipeline:
+    """Same pipeline with every decoder going through the cache."""
+    if cache is None:
+        return pipeline
+    return DecoderPipeline([CachedDecoder(d, cache) for d in pipeline.decoders], pipeline.fallbacks)
+
+
+class DecodeService:
+    """Warm pipeline plus a bounded worker pool; safe to call from many threads."""
+
+    def __init__(self, pipeline: Optional[DecoderPipeline] = None, cache: Optional[DecodeCache] = None,
+                 workers: int = DECODE_WORKERS):
+        self.pipeline = pipeline or cached_pipeline(default_pipeline(with_openai=True), cache or DecodeCache())
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.queued = 0
+        self.latencies: Deque[int] = deque(maxlen=1000)
+
+    def decode(self, raw: bytes, mode: str = "parallel", exclude: Collection[str] = (),
+               photo_index: Optional[int] = None) -> Tuple[List[Barcode], List[Dict[str, Any]], int]:
+        """Decode one photo on the worker pool; returns (barcodes, timeline, ms)."""
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}")
+        with self._lock:
+            self.requests += 1
+            self.queued += 1
+        t0 = perf_counter()
+        try:
+            results, timeline = self.pool.submit(self._run, raw, mode, tuple(exclude), photo_index).result()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.queued -= 1
+        ms = int((perf_counter() - t0) * 1000)
+        with self._lock:
+            self.latencies.append(ms)
+        return results, timeline, ms
+
+    def _run(self, raw: bytes, mode: str, exclude: Tuple[str, ...],
+             photo_index: Optional[int]) -> Tuple[List[Barcode], List[Dict[str, Any]]]:
+        img = load_rgb(open_draft(raw, decode_side(self.pipeline.max_side)))
+        try:
+            if mode == "sequential":
+                return self.pipeline.run_debug(img, raw, exclude=exclude, photo_index=photo_index)
+            run = self.pipeline.run_smart_parallel_debug if mode == "smart" else self.pipeline.run_parallel_debug
+            # Each worker thread runs its own short-lived loop; decoders fan out via to_thread
+            return asyncio.run(run(img, raw, exclude=exclude, photo_index=photo_index))
+        finally:
+            img.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            out: Dict[str, Any] = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.queued,
+                "workers": self.workers,
+            }
+        if latencies:
+            out["p50_ms"] = latencies[len(latencies) // 2]
+            out["p95_ms"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        out["cache"] = {
+            d.name: d.stats()
+            for d in self.pipeline.decoders if isinstance(d, CachedDecoder) and d.enabled
+        }
+        return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: DecodeService
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._reply(200, {"ok": True, "decoders": [d.name for d in self.service.pipeline.decoders]})
+        elif path == "/metrics":
+            self._reply(200, self.service.metrics())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        if url.path != "/decode":
+            self._reply(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if not 0 < length <= MAX_IMAGE_BYTES:
+            self._reply(413 if length else 400, {"error": f"body must be 1..{MAX_IMAGE_BYTES} bytes"})
+            return
+        raw = self.rfile.read(length)
+        params = parse_qs(url.query)
+        mode = params.get("mode", ["parallel"])[0]
+        exclude = [n for n in ",".join(params.get("exclude", [])).split(",") if n]
+        photo_index = int(params["photo_index"][0]) if params.get("photo_index") else None
+        try:
+            results, timeline, ms = self.service.decode(raw, mode, exclude, photo_index)
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        except Exception as e:
+            logger.exception("decode_service: decode failed")
+            self._reply(500, {"error": repr(e)})
+            return
+        self._reply(200, {"barcodes": [barcode_to_payload(b) for b in results], "timeline": timeline, "ms": ms})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("decode_service: " + format, *args)
+
+
+def make_server(service: DecodeService, host: str = DECODE_SERVICE_HOST,
+                port: int = DECODE_SERVICE_PORT) -> ThreadingHTTPServer:
+    handler = type("DecodeHandler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    load_dotenv()  # API keys for Vision / OpenAI decoders
+    service = DecodeService()
+    server = make_server(service)
+    logger.info("decode_service: listening on http://%s:%d with %d workers, decoders %s",
+                *server.server_address[:2], service.workers, [d.name for d in service.pipeline.decoders])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
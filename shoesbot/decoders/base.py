@@ -1,10 +1,27 @@
 from __future__ import annotations
-from typing import List
+from typing import Iterable, List, Optional, Sequence, Tuple
 from PIL import Image
 from shoesbot.models import Barcode
 
 class Decoder:
     name: str = "decoder"
+    # Longest image side the decoder needs: None = full resolution,
+    # 0 = pixels unused (the decoder works from image_bytes only)
+    max_side: Optional[int] = None
+    # True for decoders that call a paid network API (Vision, OpenAI)
+    paid: bool = False
 
     def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
         raise NotImplementedError
+
+
+def relative_bbox(points: Iterable[Sequence[float]], width: int, height: int) -> Optional[Tuple[float, float, float, float]]:
+    """Axis-aligned (x, y, w, h) around pixel points, as fractions of the image size."""
+    pts = [(float(x), float(y)) for x, y in points]
+    if not pts or not width or not height:
+        return None
+    x0 = max(0.0, min(x for x, _ in pts))
+    y0 = max(0.0, min(y for _, y in pts))
+    x1 = min(float(width), max(x for x, _ in pts))
+    y1 = min(float(height), max(y for _, y in pts))
+    return (round(x0 / width, 4), round(y0 / height, 4), round((x1 - x0) / width, 4), round((y1 - y0) / height, 4))
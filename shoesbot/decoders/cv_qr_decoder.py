@@ -1,24 +1,26 @@
 from typing import List
 from PIL import Image
 from shoesbot.models import Barcode
-from shoesbot.decoders.base import Decoder
+from shoesbot.decoders.base import Decoder, relative_bbox
+from shoesbot.preprocess import prepare
 
 try:
     import cv2  # type: ignore
-    import numpy as np  # type: ignore
     HAS_CV2 = True
 except Exception:
     HAS_CV2 = False
 
 class OpenCvQrDecoder(Decoder):
     name = "opencv-qr"
+    max_side = 2048
 
     def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
         if not HAS_CV2:
             return []
-        arr = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        arr = prepare(image, image_bytes).array("gray")
         qr = cv2.QRCodeDetector()
         data, points, _ = qr.detectAndDecode(arr)
         if data:
-            return [Barcode(symbology="QRCODE", data=str(data), source=self.name)]
+            bbox = relative_bbox(points.reshape(-1, 2), arr.shape[1], arr.shape[0]) if points is not None else None
+            return [Barcode(symbology="QRCODE", data=str(data), source=self.name, bbox=bbox)]
         return []
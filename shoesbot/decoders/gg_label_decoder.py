@@ -1,11 +1,11 @@
 """Decoder for GG label detection via OCR."""
 from typing import List
 from PIL import Image
-from io import BytesIO
-from PIL import ImageEnhance
 from shoesbot.models import Barcode
 from shoesbot.decoders.base import Decoder
+from shoesbot.endpoints import vision_annotate_url
 from shoesbot.logging_setup import logger
+from shoesbot.preprocess import prepare
 import re
 import os
 import base64
@@ -21,22 +21,15 @@ except Exception:
 
 class GGLabelDecoder(Decoder):
     name = "gg-label"
+    max_side = 1200
+    paid = True
 
     def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
         logger.debug("gg-label: decode called")
         # Preprocess: upscale small images and boost contrast for better OCR
+        # (shared per-photo "ocr" variant: 1200px wide, contrast 1.3)
         try:
-            proc_img = image
-            max_w = 1200  # Reduced from 1600 for speed
-            if image.width < max_w:
-                ratio = max_w / float(image.width)
-                new_size = (int(image.width * ratio), int(image.height * ratio))
-                proc_img = image.resize(new_size, Image.BICUBIC)
-            # Light contrast boost
-            proc_img = ImageEnhance.Contrast(proc_img).enhance(1.3)
-            buf = BytesIO()
-            proc_img.save(buf, format="PNG")
-            proc_bytes = buf.getvalue()
+            proc_bytes = prepare(image, image_bytes).encoded("ocr", "PNG")
         except Exception:
             proc_bytes = image_bytes
         # Try REST API with API key first
@@ -46,7 +39,7 @@ class GGLabelDecoder(Decoder):
             try:
                 import requests
                 img_b64 = base64.b64encode(proc_bytes).decode()
-                url = f"https://vision.googleapis.com/v1/images:annotate?key={api_key}"
+                url = vision_annotate_url(api_key)
                 payload = {
                     "requests": [{
                         "image": {"content": img_b64},
@@ -2,12 +2,13 @@
 Улучшенный декодер для GG label detection.
 Множественные стратегии для надежного чтения.
 """
-from typing import List
-from PIL import Image, ImageEnhance, ImageFilter
-from io import BytesIO
+from typing import List, Tuple
+from PIL import Image
 from shoesbot.models import Barcode
 from shoesbot.decoders.base import Decoder
+from shoesbot.endpoints import vision_annotate_url
 from shoesbot.logging_setup import logger
+from shoesbot.preprocess import PreparedImage, prepare
 import re
 import os
 import base64
@@ -19,149 +20,97 @@ class ImprovedGGLabelDecoder(Decoder):
     1. Множественные версии предобработанных изображений
     2. DOCUMENT_TEXT_DETECTION + TEXT_DETECTION
     3. Разные масштабы и контрасты
-    4. Поиск по более гибким паттернам
+    4. Версии по очереди, до первого уверенного GG/Q
     """
     name = "gg-label-improved"
+    max_side = 2400
+    paid = True
+
+    VARIANTS = ("high_contrast", "high_res", "standard")
 
     def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
         logger.debug("gg-label-improved: decode called")
-        
-        results = []
-        seen = set()
-        
-        # Стратегия 1: Несколько версий изображения с разной обработкой
-        image_variants = self._prepare_image_variants(image, image_bytes)
-        
+
         api_key = os.getenv("GOOGLE_VISION_API_KEY")
         if not api_key:
             logger.warning("gg-label-improved: GOOGLE_VISION_API_KEY not set")
             return []
-        
-        # Пробуем каждую версию изображения
-        for variant_name, variant_bytes in image_variants:
-            logger.debug(f"gg-label-improved: Trying variant: {variant_name}")
-            
-            # Используем оба типа детекции
-            variant_results = self._try_google_vision(variant_bytes, api_key, variant_name)
-            
+
+        # Версии изображения идут по очереди: один запрос к Vision за раз (в слоте
+        # платного API, который держит пайплайн), уверенная находка останавливает перебор
+        prepared = prepare(image, image_bytes)
+        results = []
+        seen = set()
+        for variant_name in self.VARIANTS:
+            variant_results, confident = self._try_variant(prepared, variant_name, api_key)
             for result in variant_results:
-                key = (result.symbology, result.data)
-                if key not in seen:
-                    seen.add(key)
+                if result.data not in seen:
+                    seen.add(result.data)
                     results.append(result)
-            
-            # Если нашли в первой версии - можем вернуться быстрее
-            if results and variant_name == "high_contrast":
-                logger.info(f"gg-label-improved: Found codes early with {variant_name}: {[b.data for b in results]}")
-                return results
-        
+            if confident:
+                logger.info(f"gg-label-improved: Found codes early with {variant_name}: {[b.data for b in variant_results]}")
+                break
+
         logger.info(f"gg-label-improved: Final results: {[b.data for b in results]}")
         return results
-    
-    def _prepare_image_variants(self, image: Image.Image, image_bytes: bytes) -> List[tuple]:
-        """Создает несколько версий изображения с разной обработкой."""
-        variants = []
-        
+
+    def _try_variant(self, prepared: PreparedImage, variant_name: str, api_key: str) -> Tuple[List[Barcode], bool]:
+        """Готовит версию изображения (кэш на фото) и отправляет ее в Vision.
+
+        high_contrast - высокий контраст и резкость (для желтых стикеров),
+        high_res - увеличенное разрешение, standard - легкая обработка (fallback).
+        """
         try:
-            # Вариант 1: Высокий контраст и резкость (для желтых стикеров)
-            proc1 = image.copy()
-            if proc1.width < 2000:
-                ratio = 2000 / float(proc1.width)
-                proc1 = proc1.resize((int(proc1.width * ratio), int(proc1.height * ratio)), Image.LANCZOS)
-            proc1 = ImageEnhance.Contrast(proc1).enhance(2.0)  # Агрессивный контраст
-            proc1 = ImageEnhance.Sharpness(proc1).enhance(1.5)
-            buf1 = BytesIO()
-            proc1.save(buf1, format="PNG")
-            variants.append(("high_contrast", buf1.getvalue()))
-            
-            # Вариант 2: Увеличенное разрешение, умеренный контраст
-            proc2 = image.copy()
-            if proc2.width < 2400:
-                ratio = 2400 / float(proc2.width)
-                proc2 = proc2.resize((int(proc2.width * ratio), int(proc2.height * ratio)), Image.LANCZOS)
-            proc2 = ImageEnhance.Contrast(proc2).enhance(1.5)
-            buf2 = BytesIO()
-            proc2.save(buf2, format="PNG")
-            variants.append(("high_res", buf2.getvalue()))
-            
-            # Вариант 3: Оригинал с легкой обработкой (fallback)
-            proc3 = image.copy()
-            if proc3.width < 1600:
-                ratio = 1600 / float(proc3.width)
-                proc3 = proc3.resize((int(proc3.width * ratio), int(proc3.height * ratio)), Image.BICUBIC)
-            proc3 = ImageEnhance.Contrast(proc3).enhance(1.3)
-            buf3 = BytesIO()
-            proc3.save(buf3, format="PNG")
-            variants.append(("standard", buf3.getvalue()))
-            
+            variant_bytes = prepared.encoded(variant_name, "JPEG")
         except Exception as e:
-            logger.debug(f"gg-label-improved: Error preparing variants: {e}")
-            # Fallback на оригинал
-            variants.append(("original", image_bytes))
-        
-        return variants
-    
-    def _try_google_vision(self, image_bytes: bytes, api_key: str, variant_name: str) -> List[Barcode]:
-        """Пробует Google Vision API с разными типами детекции."""
-        results = []
-        
+            logger.debug(f"gg-label-improved: Error preparing variant {variant_name}: {e}")
+            return [], False
+        logger.debug(f"gg-label-improved: Trying variant: {variant_name} ({len(variant_bytes)} bytes)")
+        return self._try_google_vision(variant_bytes, api_key, variant_name)
+
+    def _try_google_vision(self, image_bytes: bytes, api_key: str, variant_name: str) -> Tuple[List[Barcode], bool]:
+        """Один запрос к Google Vision с DOCUMENT_TEXT_DETECTION + TEXT_DETECTION.
+
+        Возвращает найденные лейблы и признак уверенного совпадения
+        (извлечен GG или Q лейбл, а не только G-номер).
+        """
         try:
             import requests
             img_b64 = base64.b64encode(image_bytes).decode()
-            url = f"https://vision.googleapis.com/v1/images:annotate?key={api_key}"
-            
-            # Пробуем DOCUMENT_TEXT_DETECTION (лучше для документов/стикеров)
-            payload_doc = {
+            url = vision_annotate_url(api_key)
+            payload = {
                 "requests": [{
                     "image": {"content": img_b64},
                     "features": [
-                        {"type": "DOCUMENT_TEXT_DETECTION", "maxResults": 10}
+                        {"type": "DOCUMENT_TEXT_DETECTION", "maxResults": 10},
+                        {"type": "TEXT_DETECTION", "maxResults": 10},
                     ],
                     "imageContext": {
                         "languageHints": ["en"]
                     }
                 }]
             }
-            
-            resp = requests.post(url, json=payload_doc, timeout=12)
-            if resp.ok:
-                data = resp.json()
-                if "responses" in data and data["responses"]:
-                    text = data["responses"][0].get("fullTextAnnotation", {}).get("text", "")
-                    if text:
-                        logger.debug(f"gg-label-improved: DOCUMENT_TEXT_DETECTION ({variant_name}) found {len(text)} chars")
-                        doc_results = self._extract_gg_labels(text, f"{self.name}-doc-{variant_name}")
-                        results.extend(doc_results)
-            
-            # Если не нашли, пробуем TEXT_DETECTION
-            if not results:
-                payload_text = {
-                    "requests": [{
-                        "image": {"content": img_b64},
-                        "features": [
-                            {"type": "TEXT_DETECTION", "maxResults": 10}
-                        ],
-                        "imageContext": {
-                            "languageHints": ["en"]
-                        }
-                    }]
-                }
-                
-                resp = requests.post(url, json=payload_text, timeout=12)
-                if resp.ok:
-                    data = resp.json()
-                    if "responses" in data and data["responses"]:
-                        text = data["responses"][0].get("fullTextAnnotation", {}).get("text", "")
-                        if text:
-                            logger.debug(f"gg-label-improved: TEXT_DETECTION ({variant_name}) found {len(text)} chars")
-                            text_results = self._extract_gg_labels(text, f"{self.name}-text-{variant_name}")
-                            results.extend(text_results)
-            
+            resp = requests.post(url, json=payload, timeout=12)
+            if not resp.ok:
+                logger.debug(f"gg-label-improved: Vision status {resp.status_code} ({variant_name})")
+                return [], False
+            data = resp.json()
+            response = (data.get("responses") or [{}])[0]
+            doc_text = response.get("fullTextAnnotation", {}).get("text", "")
+            annotations = response.get("textAnnotations") or [{}]
+            plain_text = annotations[0].get("description", "")
+            # DOCUMENT_TEXT_DETECTION лучше для стикеров, TEXT_DETECTION - запасной
+            for text in (doc_text, plain_text):
+                if not text:
+                    continue
+                logger.debug(f"gg-label-improved: Vision ({variant_name}) found {len(text)} chars")
+                results = self._extract_gg_labels(text)
+                if results:
+                    return results, any(b.data.startswith(("GG", "Q")) for b in results)
         except Exception as e:
             logger.debug(f"gg-label-improved: Google Vision error ({variant_name}): {e}")
-        
-        return results
-    
+        return [], False
+
     def _extract_gg_labels(self, text: str, source: str = None) -> List[Barcode]:
         """Извлекает GG коды из текста с улучшенными паттернами."""
         if not text:
@@ -170,55 +119,24 @@ class ImprovedGGLabelDecoder(Decoder):
         text = text.strip()
         source = source or self.name
         
-        # Улучшенные паттерны - учитываем ошибки OCR
+        # Те же строгие паттерны, что у GGLabelDecoder: GG с номером, G с 4 цифрами
+        # (G2548) и Q-код со стикера (пара к GG). Замены OCR (OO, 66) не угадываем:
+        # так читаются артикулы и размеры
         patterns = [
-            # Точные совпадения
-            r'\bGG[-.\s]?(\d{2,4})\b',
-            r'\bG(\d{3,4})\b',
-            # Ошибки OCR: O вместо G, 6 вместо G
-            r'\bOO[-.\s]?(\d{2,4})\b',  # OO747 -> GG747
-            r'\b66[-.\s]?(\d{2,4})\b',  # 66747 -> GG747
-            r'\b[GO6]{2}[-.\s]?(\d{2,4})\b',  # Любая комбинация
-            # Просто цифры 747, 752, 753 (типичные GG коды)
-            r'\b(747|752|753|754|755|756|757|758|759|760)\b',
+            ("GG", r'\bGG[-.\s]?(\d{2,7})\b'),
+            ("G", r'\bG(\d{4})\b'),
+            ("Q", r'\bQ[-.\s]?(\d{4,10})\b'),
         ]
         
         out = []
         seen = set()
         
-        # Сначала ищем точные совпадения
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                if isinstance(match, tuple):
-                    num = match[0] if match[0] else ''
-                else:
-                    num = match
-                
-                if num and num.isdigit():
-                    # Определяем формат
-                    if 'OO' in pattern or '66' in pattern or '[GO6]' in pattern:
-                        label = f"GG{num}"
-                    elif 'G(\d' in pattern:
-                        label = f"G{num}"
-                    elif 'GG' in pattern:
-                        label = f"GG{num}"
-                    else:
-                        # Просто цифры - проверяем контекст
-                        # Ищем есть ли G/O/6 рядом
-                        num_pos = text.find(num)
-                        if num_pos > 0:
-                            context = text[max(0, num_pos-3):num_pos+len(num)+3]
-                            if re.search(r'[GO6]{1,2}', context, re.IGNORECASE):
-                                label = f"GG{num}"
-                            else:
-                                continue
-                        else:
-                            continue
-                    
-                    if label not in seen:
-                        seen.add(label)
-                        out.append(Barcode(symbology="CODE39", data=label, source=source))
+        for prefix, pattern in patterns:
+            for num in re.findall(pattern, text, re.IGNORECASE):
+                label = f"{prefix}{num}"
+                if label not in seen:
+                    seen.add(label)
+                    out.append(Barcode(symbology="GG_LABEL", data=label, source=source))
         
         if out:
             logger.debug(f"gg-label-improved: extracted labels: {[b.data for b in out]}")
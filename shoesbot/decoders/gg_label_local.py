@@ -0,0 +1,201 @@
+"""Local (network-free) reader for our yellow GG stickers.
+
+The sticker is a fixed format: a yellow rectangle with a barcode on top and
+large black serif text like "GG727" below it. Steps:
+1. HSV segmentation of the yellow area, largest rectangular blobs first
+2. Deskew: perspective warp of the min-area rectangle, long side horizontal
+3. Otsu ink mask, connected components, the text row is the largest row of
+   glyph-shaped components (barcode bars are too thin)
+4. Each glyph is matched against templates rendered with OpenCV's Hershey
+   fonts; confidence is the worst per-glyph correlation
+Both 0 and 180 degree orientations are tried.  Only readings that fit the
+GG<digits> format with confidence >= GG_LOCAL_MIN_CONFIDENCE are returned,
+otherwise the pipeline falls back to network OCR.
+"""
+from __future__ import annotations
+import os
+import re
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+from shoesbot.models import Barcode
+from shoesbot.decoders.base import Decoder, relative_bbox
+from shoesbot.logging_setup import logger
+from shoesbot.preprocess import prepare
+
+try:
+    import cv2  # type: ignore
+    import numpy as np  # type: ignore
+    HAS_CV2 = True
+except Exception:
+    HAS_CV2 = False
+
+MIN_CONFIDENCE = float(os.getenv("GG_LOCAL_MIN_CONFIDENCE", "0.6"))
+
+SEGMENT_SIDE = 1024  # segmentation resolution, longest side
+YELLOW_LOW = (22, 90, 120)  # OpenCV HSV (H is 0..180)
+YELLOW_HIGH = (45, 255, 255)
+MIN_AREA_SHARE = 0.002
+MIN_FILL = 0.75  # contour area / min-area rectangle area
+ASPECT_RANGE = (1.2, 2.8)  # long side / short side
+MAX_CANDIDATES = 3
+
+GLYPH_SIZE = (24, 32)  # w, h
+CHARS = "G0123456789"
+LABEL_RE = re.compile(r"^GG\d{2,7}$")
+
+
+@dataclass(frozen=True)
+class StickerReading:
+    text: str
+    confidence: float
+    rect: Optional[tuple] = None  # cv2 min-area rectangle of the sticker in the frame
+
+    @property
+    def valid(self) -> bool:
+        return bool(LABEL_RE.match(self.text))
+
+
+def _normalize(mask: "np.ndarray") -> "np.ndarray":
+    """Crop a glyph mask to its ink and resize to GLYPH_SIZE (zero-mean, unit norm)."""
+    ys, xs = np.nonzero(mask)
+    crop = mask[ys.min():ys.max() + 1, xs.min():xs.max() + 1].astype(np.float32)
+    glyph = cv2.resize(crop, GLYPH_SIZE, interpolation=cv2.INTER_AREA)
+    glyph -= glyph.mean()
+    return glyph / (np.linalg.norm(glyph) + 1e-6)
+
+
+@lru_cache(maxsize=1)
+def _templates() -> Dict[str, List["np.ndarray"]]:
+    """Glyph templates in a few serif/sans Hershey fonts and stroke weights."""
+    templates: Dict[str, List[np.ndarray]] = {c: [] for c in CHARS}
+    fonts = (cv2.FONT_HERSHEY_TRIPLEX, cv2.FONT_HERSHEY_COMPLEX, cv2.FONT_HERSHEY_DUPLEX)
+    for font in fonts:
+        for thickness in (3, 5, 7):
+            for char in CHARS:
+                canvas = np.zeros((120, 120), np.uint8)
+                cv2.putText(canvas, char, (15, 95), font, 2.5, 255, thickness, cv2.LINE_AA)
+                templates[char].append(_normalize(canvas > 127))
+    return templates
+
+
+def classify_glyph(mask: "np.ndarray") -> Tuple[str, float]:
+    """Best matching character and its correlation score (-1..1)."""
+    glyph = _normalize(mask)
+    best_char, best_score = "?", -1.0
+    for char, variants in _templates().items():
+        score = max(float((glyph * t).sum()) for t in variants)
+        if score > best_score:
+            best_char, best_score = char, score
+    return best_char, best_score
+
+
+def find_stickers(rgb: "np.ndarray") -> List[tuple]:
+    """Min-area rectangles of sticker-like yellow blobs, largest first."""
+    scale = min(1.0, SEGMENT_SIDE / float(max(rgb.shape[:2])))
+    small = cv2.resize(rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else rgb
+    hsv = cv2.cvtColor(small, cv2.COLOR_RGB2HSV)
+    mask = cv2.inRange(hsv, YELLOW_LOW, YELLOW_HIGH)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((9, 9), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = MIN_AREA_SHARE * mask.shape[0] * mask.shape[1]
+    rects = []
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:MAX_CANDIDATES * 2]:
+        area = cv2.contourArea(contour)
+        if area < min_area:
+            break
+        (cx, cy), (w, h), angle = cv2.minAreaRect(contour)
+        if w * h == 0 or area / (w * h) < MIN_FILL:
+            continue
+        if not ASPECT_RANGE[0] <= max(w, h) / min(w, h) <= ASPECT_RANGE[1]:
+            continue
+        rects.append(((cx / scale, cy / scale), (w / scale, h / scale), angle))
+    return rects[:MAX_CANDIDATES]
+
+
+def deskew(rgb: "np.ndarray", rect: tuple) -> "np.ndarray":
+    """Warp the sticker rectangle upright with its long side horizontal."""
+    pts = cv2.boxPoints(rect)
+    sums, diffs = pts.sum(axis=1), np.diff(pts, axis=1).ravel()
+    src = np.array([pts[np.argmin(sums)], pts[np.argmin(diffs)],
+                    pts[np.argmax(sums)], pts[np.argmax(diffs)]], np.float32)  # tl, tr, br, bl
+    width = int(round(np.linalg.norm(src[1] - src[0])))
+    height = int(round(np.linalg.norm(src[3] - src[0])))
+    dst = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    sticker = cv2.warpPerspective(rgb, cv2.getPerspectiveTransform(src, dst), (width, height))
+    if height > width:
+        sticker = cv2.rotate(sticker, cv2.ROTATE_90_CLOCKWISE)
+    return sticker
+
+
+def read_text_row(sticker: "np.ndarray") -> Optional[StickerReading]:
+    """Segment and recognize the large text row of an upright sticker."""
+    gray = cv2.cvtColor(sticker, cv2.COLOR_RGB2GRAY)
+    H, W = gray.shape
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(ink)
+    glyphs = []
+    for i in range(1, n):
+        x, y, w, h, _ = stats[i]
+        if not 0.15 * H <= h <= 0.6 * H or not 0.25 * h <= w <= 1.3 * h:
+            continue
+        if x == 0 or y == 0 or x + w >= W or y + h >= H:
+            continue
+        glyphs.append((x, y, w, h, i))
+
+    # Text row: components aligned with each other; barcode bars are thin
+    best: list = []
+    for _, y, _, h, _ in glyphs:
+        cy = y + h / 2
+        row = [g for g in glyphs if abs(g[1] + g[3] / 2 - cy) < 0.3 * h and 0.7 < g[3] / h < 1.4]
+        if np.median([g[2] / g[3] for g in row]) < 0.5:
+            continue
+        if len(row) > len(best):
+            best = row
+    if not best:
+        return None
+
+    text, confidence = "", 1.0
+    for x, y, w, h, i in sorted(best):
+        char, score = classify_glyph(labels[y:y + h, x:x + w] == i)
+        text += char
+        confidence = min(confidence, score)
+    return StickerReading(text, confidence)
+
+
+def read_sticker(rgb: "np.ndarray") -> Optional[StickerReading]:
+    """Best GG reading among sticker candidates and both orientations."""
+    best: Optional[StickerReading] = None
+    for rect in find_stickers(rgb):
+        sticker = deskew(rgb, rect)
+        if min(sticker.shape[:2]) < 20:
+            continue
+        for candidate in (sticker, cv2.rotate(sticker, cv2.ROTATE_180)):
+            reading = read_text_row(candidate)
+            if reading and reading.valid and (best is None or reading.confidence > best.confidence):
+                best = replace(reading, rect=rect)
+    return best
+
+
+class LocalGGLabelDecoder(Decoder):
+    name = "gg-label-local"
+    max_side = 2048
+
+    def __init__(self, min_confidence: float = MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+
+    def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
+        if not HAS_CV2:
+            return []
+        rgb = prepare(image, image_bytes).array("rgb")
+        reading = read_sticker(rgb)
+        if reading is None:
+            return []
+        if reading.confidence < self.min_confidence:
+            logger.info(f"gg-label-local: low confidence {reading.text} ({reading.confidence:.2f})")
+            return []
+        logger.info(f"gg-label-local: {reading.text} ({reading.confidence:.2f})")
+        bbox = relative_bbox(cv2.boxPoints(reading.rect), rgb.shape[1], rgb.shape[0]) if reading.rect else None
+        return [Barcode(symbology="GG_LABEL", data=reading.text, source=self.name,
+                        bbox=bbox, confidence=round(max(0.0, reading.confidence), 3))]
@@ -6,10 +6,13 @@ from typing import List
 from PIL import Image
 from shoesbot.models import Barcode
 from shoesbot.decoders.base import Decoder
+from shoesbot.endpoints import OPENAI_CHAT_URL
 
 
 class OpenAIBarcodeDecoder(Decoder):
     name = "openai-barcode"
+    max_side = 0
+    paid = True
     
     def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
         """Использует OpenAI Vision для чтения баркодов на коробках."""
@@ -21,7 +24,7 @@ class OpenAIBarcodeDecoder(Decoder):
             # Конвертим в base64
             img_b64 = base64.b64encode(image_bytes).decode('utf-8')
             
-            url = 'https://api.openai.com/v1/chat/completions'
+            url = OPENAI_CHAT_URL
             headers = {
                 'Authorization': f'Bearer {api_key}',
                 'Content-Type': 'application/json',
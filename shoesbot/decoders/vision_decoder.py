@@ -1,13 +1,16 @@
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import os
 import re
 import base64
 from PIL import Image
 from shoesbot.models import Barcode
-from shoesbot.decoders.base import Decoder
+from shoesbot.decoders.base import Decoder, relative_bbox
+from shoesbot.endpoints import vision_annotate_url
 
 class VisionDecoder(Decoder):
     name = "vision-ocr"
+    max_side = 0
+    paid = True
 
     def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
         # Try REST API with API key first
@@ -16,7 +19,7 @@ class VisionDecoder(Decoder):
             try:
                 import requests
                 img_b64 = base64.b64encode(image_bytes).decode()
-                url = f"https://vision.googleapis.com/v1/images:annotate?key={api_key}"
+                url = vision_annotate_url(api_key)
                 payload = {
                     "requests": [{
                         "image": {"content": img_b64},
@@ -27,8 +30,9 @@ class VisionDecoder(Decoder):
                 if resp.ok:
                     data = resp.json()
                     if "responses" in data and data["responses"]:
-                        text = data["responses"][0].get("fullTextAnnotation", {}).get("text", "")
-                        return self._extract_barcodes(text)
+                        response = data["responses"][0]
+                        text = response.get("fullTextAnnotation", {}).get("text", "")
+                        return self._extract_barcodes(text, self._word_boxes(response))
             except Exception:
                 pass
         
@@ -47,7 +51,20 @@ class VisionDecoder(Decoder):
             return []
         return self._extract_barcodes(resp.full_text_annotation.text)
     
-    def _extract_barcodes(self, text: str) -> List[Barcode]:
+    @staticmethod
+    def _word_boxes(response: dict) -> Dict[str, Tuple[float, float, float, float]]:
+        """Word -> relative bbox from textAnnotations (first one is the whole text)."""
+        pages = response.get("fullTextAnnotation", {}).get("pages") or [{}]
+        width, height = pages[0].get("width"), pages[0].get("height")
+        boxes: Dict[str, Tuple[float, float, float, float]] = {}
+        for word in response.get("textAnnotations", [])[1:]:
+            vertices = word.get("boundingPoly", {}).get("vertices", [])
+            bbox = relative_bbox([(v.get("x", 0), v.get("y", 0)) for v in vertices], width, height)
+            if bbox:
+                boxes.setdefault(word.get("description", ""), bbox)
+        return boxes
+
+    def _extract_barcodes(self, text: str, boxes: Optional[Dict[str, Tuple[float, float, float, float]]] = None) -> List[Barcode]:
         if not text:
             return []
         text = text.strip()
@@ -58,5 +75,5 @@ class VisionDecoder(Decoder):
             if d in seen:
                 continue
             seen.add(d)
-            out.append(Barcode(symbology="OCR", data=d, source=self.name))
+            out.append(Barcode(symbology="OCR", data=d, source=self.name, bbox=(boxes or {}).get(d)))
         return out
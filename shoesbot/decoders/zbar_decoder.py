@@ -3,7 +3,8 @@ import shoesbot.env_setup  # Must import first to setup DYLD_LIBRARY_PATH
 from typing import List
 from PIL import Image
 from shoesbot.models import Barcode
-from shoesbot.decoders.base import Decoder
+from shoesbot.decoders.base import Decoder, relative_bbox
+from shoesbot.preprocess import prepare
 
 try:
     from pyzbar.pyzbar import ZBarSymbol, decode as zbar_decode
@@ -13,6 +14,7 @@ except Exception:
 
 class ZBarDecoder(Decoder):
     name = "zbar"
+    max_side = 2048
 
     def decode(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
         if not HAS_ZBAR:
@@ -27,12 +29,15 @@ class ZBarDecoder(Decoder):
             ZBarSymbol.CODE93,
             ZBarSymbol.CODE128,
         ]
-        results = zbar_decode(image, symbols=symbols)
+        gray = prepare(image, image_bytes).array("gray")
+        results = zbar_decode(gray, symbols=symbols)
         out: List[Barcode] = []
         for r in results:
             try:
                 data = r.data.decode("utf-8", errors="replace")
             except Exception:
                 data = str(r.data)
-            out.append(Barcode(symbology=str(r.type), data=data, source=self.name))
+            left, top, width, height = r.rect
+            bbox = relative_bbox([(left, top), (left + width, top + height)], gray.shape[1], gray.shape[0])
+            out.append(Barcode(symbology=str(r.type), data=data, source=self.name, bbox=bbox))
         return out
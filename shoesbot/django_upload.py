@@ -9,6 +9,8 @@ from io import BytesIO
 from PIL import Image
 from shoesbot.logging_setup import logger
 from shoesbot.photo_queue import PhotoUploadQueue
+from shoesbot.album_scheduler import limits
+from shoesbot.models import barcode_to_payload
 
 
 DJANGO_API_URL = os.getenv("DJANGO_API_URL", "http://127.0.0.1:8000/photos/api/upload-batch/")
@@ -33,7 +35,8 @@ async def upload_batch_to_django(
         for idx, item in enumerate(photo_items):
             # Download photo
             buf = BytesIO()
-            await item.file_obj.download_to_memory(out=buf)
+            async with limits.download:
+                await item.file_obj.download_to_memory(out=buf)
             raw = buf.getvalue()
             
             # Convert to base64
@@ -45,16 +48,9 @@ async def upload_batch_to_django(
                 'image': img_b64,
             })
         
-        # Prepare barcodes
-        barcodes_data = []
-        for result in all_results:
-            # Find which photo this barcode came from (simplified - assume first photo for now)
-            barcodes_data.append({
-                'photo_index': 0,  # TODO: track which photo each barcode came from
-                'symbology': result.symbology,
-                'data': result.data,
-                'source': result.source,
-            })
+        # Prepare barcodes (codes without provenance go to the first photo)
+        barcodes_data = [{**barcode_to_payload(result), 'photo_index': result.photo_index or 0}
+                         for result in all_results]
         
         # SAVE TO QUEUE FIRST (protection against Django crash)
         queue_id = _photo_queue.add_upload(
@@ -92,37 +88,7 @@ async def upload_batch_to_django(
                             # SUCCESS - mark as uploaded in queue
                             _photo_queue.mark_uploaded(correlation_id)
                             
-                            # Проверяем результат Pochtoy и отправляем в чат
-                            pochtoy_msg = result.get('pochtoy_message')
-                            if pochtoy_msg:
-                                try:
-                                    # Используем requests синхронно (т.к. telegram-bot async сложнее)
-                                    import requests
-                                    bot_token = os.getenv('BOT_TOKEN')
-                                    telegram_url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
-                                    resp = requests.post(telegram_url, json={
-                                        'chat_id': chat_id,
-                                        'text': f"📡 Pochtoy:\n{pochtoy_msg}"
-                                    }, timeout=5)
-                                    
-                                    # Сохраняем message_id чтобы можно было удалить
-                                    if resp.status_code == 200:
-                                        resp_data = resp.json()
-                                        if resp_data.get('ok') and resp_data.get('result'):
-                                            msg_id = resp_data['result'].get('message_id')
-                                            if msg_id:
-                                                # Добавляем в SENT_BATCHES если есть
-                                                try:
-                                                    from shoesbot.telegram_bot import SENT_BATCHES
-                                                    if correlation_id in SENT_BATCHES:
-                                                        SENT_BATCHES[correlation_id]['message_ids'].append(msg_id)
-                                                        logger.info(f"Added Pochtoy message {msg_id} to batch {correlation_id}")
-                                                except Exception:
-                                                    pass
-                                    
-                                    logger.info(f"Sent Pochtoy message to chat: {pochtoy_msg}")
-                                except Exception as e:
-                                    logger.error(f"Failed to send Pochtoy message: {e}")
+                            # Pochtoy: Django delivers the card in the background and reports to the chat itself
                             
                             return True
                         else:
@@ -220,36 +186,7 @@ async def retry_upload_from_queue(correlation_id: str) -> bool:
                             # SUCCESS - mark as uploaded
                             _photo_queue.mark_uploaded(correlation_id)
                             
-                            # Send Pochtoy message if present
-                            pochtoy_msg = result.get('pochtoy_message')
-                            if pochtoy_msg:
-                                try:
-                                    import requests
-                                    bot_token = os.getenv('BOT_TOKEN')
-                                    telegram_url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
-                                    resp = requests.post(telegram_url, json={
-                                        'chat_id': chat_id,
-                                        'text': f"📡 Pochtoy:\n{pochtoy_msg}"
-                                    }, timeout=5)
-                                    
-                                    # Сохраняем message_id чтобы можно было удалить
-                                    if resp.status_code == 200:
-                                        resp_data = resp.json()
-                                        if resp_data.get('ok') and resp_data.get('result'):
-                                            msg_id = resp_data['result'].get('message_id')
-                                            if msg_id:
-                                                # Добавляем в SENT_BATCHES если есть
-                                                try:
-                                                    from shoesbot.telegram_bot import SENT_BATCHES
-                                                    if correlation_id in SENT_BATCHES:
-                                                        SENT_BATCHES[correlation_id]['message_ids'].append(msg_id)
-                                                        logger.info(f"Added Pochtoy message {msg_id} to batch {correlation_id}")
-                                                except Exception:
-                                                    pass
-                                    
-                                    logger.info(f"Sent Pochtoy message to chat: {pochtoy_msg}")
-                                except Exception as e:
-                                    logger.error(f"Failed to send Pochtoy message: {e}")
+                            # Pochtoy: Django delivers the card in the background and reports to the chat itself
                             
                             return True
                         else:
@@ -0,0 +1,54 @@
+"""Base URLs of every external API the bot and the site talk to.
+
+Each base can be overridden with its own env var; MOCK_GATEWAY_URL points all
+of them at once to the local stand-in server (tools/mock_gateway), which
+routes requests by path.
+"""
+from __future__ import annotations
+import os
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()  # read before the bases below, even when imported ahead of the app's own load_dotenv()
+except ImportError:
+    pass
+
+MOCK_GATEWAY_URL = os.getenv("MOCK_GATEWAY_URL", "").rstrip("/")
+
+
+def _base(env: str, default: str) -> str:
+    return (os.getenv(env) or MOCK_GATEWAY_URL or default).rstrip("/")
+
+
+VISION_API_BASE = _base("VISION_API_BASE", "https://vision.googleapis.com")
+GOOGLE_API_BASE = _base("GOOGLE_API_BASE", "https://www.googleapis.com")
+OPENAI_API_BASE = _base("OPENAI_API_BASE", "https://api.openai.com")
+TELEGRAM_API_BASE = _base("TELEGRAM_API_BASE", "https://api.telegram.org")
+FASHN_API_BASE = _base("FASHN_API_BASE", "https://api.fashn.ai")
+POCHTOY_API_BASE = _base("POCHTOY_API_BASE", "https://pochtoy-test.pochtoy3.ru")
+EBAY_FINDING_BASE = _base("EBAY_FINDING_BASE", "https://svcs.ebay.com")
+# eBay REST/OAuth bases depend on sandbox vs production; None keeps the client default
+EBAY_API_BASE = (os.getenv("EBAY_API_BASE") or MOCK_GATEWAY_URL or "").rstrip("/") or None
+EBAY_AUTH_BASE = (os.getenv("EBAY_AUTH_BASE") or MOCK_GATEWAY_URL or "").rstrip("/") or None
+
+OPENAI_CHAT_URL = f"{OPENAI_API_BASE}/v1/chat/completions"
+CUSTOMSEARCH_URL = f"{GOOGLE_API_BASE}/customsearch/v1"
+EBAY_FINDING_URL = f"{EBAY_FINDING_BASE}/services/search/FindingService/v1"
+FASHN_API_URL = f"{FASHN_API_BASE}/v1"
+# Full Pochtoy URLs from .env point at production: under the mock gateway they are ignored
+POCHTOY_STORE_URL = (None if MOCK_GATEWAY_URL else os.getenv("POCHTOY_API_URL")) \
+    or f"{POCHTOY_API_BASE}/api/garage-tg/store"
+POCHTOY_DELETE_URL = (None if MOCK_GATEWAY_URL else os.getenv("POCHTOY_DELETE_URL")) \
+    or f"{POCHTOY_API_BASE}/api/garage-tg/delete"
+
+
+def vision_annotate_url(api_key: str) -> str:
+    return f"{VISION_API_BASE}/v1/images:annotate?key={api_key}"
+
+
+def telegram_method_url(bot_token: str, method: str) -> str:
+    return f"{TELEGRAM_API_BASE}/bot{bot_token}/{method}"
+
+
+def telegram_file_url(bot_token: str, file_path: str) -> str:
+    return f"{TELEGRAM_API_BASE}/file/bot{bot_token}/{file_path}"
@@ -0,0 +1,111 @@
+"""Memory-bounded photo decoding.
+
+Photos are decoded through PIL's JPEG draft mode, so libjpeg scales them down
+while decoding instead of materialising the full-resolution frame first.
+A process-wide byte budget bounds how many decoded frames are alive at once,
+no matter how many albums are being processed concurrently.
+"""
+from __future__ import annotations
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from io import BytesIO
+from typing import AsyncIterator, Optional
+from PIL import Image
+from shoesbot.logging_setup import logger
+
+# Longest side decoders ever need; 0 disables draft-mode downscaling
+DECODE_MAX_SIDE = int(os.getenv("DECODE_MAX_SIDE", "2048"))
+# Total bytes of decoded RGB frames (and their preprocessed planes) alive at the same time
+IMAGE_MEMORY_BUDGET_MB = int(os.getenv("IMAGE_MEMORY_BUDGET_MB", "192"))
+
+
+class ImageMemoryBudget:
+    """Async byte budget for decoded frames.
+
+    A single frame larger than the whole budget is still admitted, but only
+    when nothing else is alive, so oversized photos never deadlock.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(1, int(max_bytes))
+        self.in_use = 0
+        self.peak = 0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int) -> AsyncIterator[None]:
+        nbytes = min(max(0, int(nbytes)), self.max_bytes)
+        async with self._cond:
+            if self.in_use + nbytes > self.max_bytes:
+                logger.debug("image budget: waiting for %d bytes (in use %d/%d)", nbytes, self.in_use, self.max_bytes)
+            await self._cond.wait_for(lambda: self.in_use + nbytes <= self.max_bytes)
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_use -= nbytes
+                self._cond.notify_all()
+
+
+def open_draft(raw: bytes, max_side: Optional[int] = None) -> Image.Image:
+    """Open an image lazily, asking the JPEG decoder for a reduced scale.
+
+    Only the header is read here; ``size`` already reflects the draft scale,
+    which is the smallest 1/2, 1/4 or 1/8 reduction still >= ``max_side``.
+    """
+    img = Image.open(BytesIO(raw))
+    if max_side and img.format == "JPEG" and max(img.size) > max_side:
+        # Draft needs a box both sides fit, so keep the aspect ratio
+        ratio = max_side / float(max(img.size))
+        img.draft("RGB", (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))))
+    return img
+
+
+def load_rgb(img: Image.Image) -> Image.Image:
+    """Decode pixels into a single RGB buffer (no extra copy for RGB JPEGs)."""
+    img.load()
+    if img.mode == "RGB":
+        return img
+    rgb = img.convert("RGB")
+    img.close()
+    return rgb
+
+
+def decode_side(needed: Optional[int]) -> Optional[int]:
+    """Draft target for a pipeline needing ``needed`` px, capped by DECODE_MAX_SIDE."""
+    if DECODE_MAX_SIDE and (needed is None or needed > DECODE_MAX_SIDE):
+        return DECODE_MAX_SIDE
+    return needed
+
+
+def decoded_size_bytes(img: Image.Image) -> int:
+    """RGB frame plus the gray and binarized planes its PreparedImage may keep."""
+    return img.width * img.height * (3 + 2)
+
+
+# Global budget instance
+budget = ImageMemoryBudget(IMAGE_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+@asynccontextmanager
+async def decoded_image(
+    raw: bytes,
+    max_side: Optional[int] = None,
+    memory_budget: Optional[ImageMemoryBudget] = None,
+) -> AsyncIterator[Image.Image]:
+    """Decode ``raw`` within the memory budget; the frame is released on exit.
+
+    The yielded image is the one pixel buffer shared by every decoder that
+    runs inside the ``async with`` block.
+    """
+    memory_budget = memory_budget or budget
+    img = open_draft(raw, max_side)
+    async with memory_budget.reserve(decoded_size_bytes(img)):
+        rgb = await asyncio.to_thread(load_rgb, img)
+        try:
+            yield rgb
+        finally:
+            rgb.close()
@@ -1,29 +1,127 @@
+"""Logging setup for the bot.
+
+Log calls only put the record on a queue.  A background QueueListener formats
+it and does the file/console I/O, so the event loop never waits on a disk
+write.  bot.log is JSON lines (LOG_FORMAT=text for the old layout), every
+line carrying the correlation id, chat id and stage bound with log_context()
+or bind_log_context() by the code that emitted it.
+"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Iterator
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_DIR = os.getenv("LOG_DIR", ".")
 LOG_FILE = os.path.join(LOG_DIR, "bot.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json | text (bot.log only)
+# Keep 1 of every N DEBUG records from chatty loggers (1 = keep all)
+LOG_DEBUG_SAMPLE_EVERY = int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "10"))
+SAMPLED_LOGGERS = ("shoesbot.photo_buffer",)
+
+CONTEXT_FIELDS = ("corr", "chat_id", "stage")
 
 os.makedirs(LOG_DIR, exist_ok=True)
 
+_fields: ContextVar[Dict[str, Any]] = ContextVar("log_fields", default={})
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """Attach fields to every record logged inside the block (and tasks started there)."""
+    token = _fields.set({**_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        _fields.reset(token)
+
+
+def bind_log_context(**fields: Any) -> None:
+    """Attach fields for the rest of the current task."""
+    _fields.set({**_fields.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copy the bound fields onto the record while still in the emitting task."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _fields.get().items():
+            if not hasattr(record, key):  # extra={...} wins
+                setattr(record, key, value)
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Drop all but 1 of every `every` DEBUG records from the given loggers."""
+
+    def __init__(self, every: int, prefixes=SAMPLED_LOGGERS):
+        super().__init__()
+        self.every = max(1, every)
+        self.prefixes = tuple(prefixes)
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or not record.name.startswith(self.prefixes):
+            return True
+        self._seen += 1
+        return (self._seen - 1) % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue the record as is: msg % args is evaluated on the listener thread.
+
+    The stock QueueHandler formats in the caller so the record can be pickled;
+    our queue never leaves the process.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
 _logger = logging.getLogger("shoesbot")
+listener = None
 if not _logger.handlers:
     _logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
     # Enable DEBUG for decoders to see what they're finding
     logging.getLogger("shoesbot.gg_label_decoder").setLevel(logging.DEBUG)
     logging.getLogger("shoesbot.vision_decoder").setLevel(logging.DEBUG)
-    fmt = logging.Formatter(
-        fmt="%(asctime)s %(levelname)s %(name)s %(message)s",
-        datefmt="%Y-%m-%dT%H:%M:%S%z",
-    )
-    fh = RotatingFileHandler(LOG_FILE, maxBytes=2_000_000, backupCount=3)
-    fh.setFormatter(fmt)
-    _logger.addHandler(fh)
+    datefmt = "%Y-%m-%dT%H:%M:%S%z"
+    fmt = logging.Formatter(fmt="%(asctime)s %(levelname)s %(name)s %(message)s", datefmt=datefmt)
 
+    fh = RotatingFileHandler(LOG_FILE, maxBytes=2_000_000, backupCount=3)
+    fh.setFormatter(JsonFormatter(datefmt=datefmt) if LOG_FORMAT == "json" else fmt)
     ch = logging.StreamHandler()
     ch.setFormatter(fmt)
-    _logger.addHandler(ch)
+
+    qh = LazyQueueHandler(queue.SimpleQueue())
+    qh.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_EVERY))
+    qh.addFilter(ContextFilter())
+    _logger.addHandler(qh)
+
+    listener = QueueListener(qh.queue, fh, ch, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # drains the queue
 
 logger = _logger
@@ -1,7 +1,38 @@
 from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
 
 @dataclass(frozen=True)
 class Barcode:
     symbology: str
     data: str
     source: str
+    # Which photo of the album the code was read from (set by DecoderPipeline)
+    photo_index: Optional[int] = None
+    # (x, y, w, h) as fractions of the image size, when the decoder locates the code
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    # Decoder's own score in 0..1, when it has one
+    confidence: Optional[float] = None
+
+
+def barcode_to_payload(result: Barcode) -> Dict[str, Any]:
+    """Barcode as JSON: Django uploads, the upload queue, the decode service and its cache."""
+    return {
+        "photo_index": result.photo_index,
+        "symbology": result.symbology,
+        "data": result.data,
+        "source": result.source,
+        "bbox": list(result.bbox) if result.bbox else None,
+        "confidence": result.confidence,
+    }
+
+
+def barcode_from_payload(data: Dict[str, Any]) -> Barcode:
+    bbox = data.get("bbox")
+    return Barcode(
+        symbology=data.get("symbology", ""),
+        data=data.get("data", ""),
+        source=data.get("source", "unknown"),
+        photo_index=data.get("photo_index"),
+        bbox=tuple(bbox) if bbox else None,
+        confidence=data.get("confidence"),
+    )
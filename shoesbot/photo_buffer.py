@@ -1,11 +1,25 @@
-"""Buffer to collect photos for batch processing."""
+"""Buffer to collect photos for batch processing.
+
+Photos sent as one Telegram album share a media_group_id.  Such an album is
+complete when it reaches Telegram's 10-photo limit, when a photo from another
+album (or a loose photo) arrives, or when no photo came for the debounce
+learned (per chat) from gaps between photos of recent albums, never less
+than ALBUM_WAIT_MIN.  A photo whose media_group_id matches an album still in
+the buffer joins it, even after another album started.  Loose photos without
+a media_group_id keep the fixed BUFFER_TIMEOUT window from the first photo.
+"""
 from __future__ import annotations
-from typing import Dict, List, Tuple, Optional, NamedTuple
-from time import time
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple, Optional, NamedTuple
+from time import monotonic
 from telegram import File
 import logging
 
-BUFFER_TIMEOUT = 3.0  # seconds to wait for more photos (до 10 фото)
+BUFFER_TIMEOUT = 3.0  # seconds to wait for more loose photos (до 10 фото)
+MAX_ALBUM_SIZE = 10  # Telegram media group limit
+ALBUM_GAP_INITIAL = 0.4  # seconds, gap estimate before any album was seen
+ALBUM_WAIT_MIN = 1.0  # never close an album quicker than this after its last photo (one slow update must not split it)
 
 logger = logging.getLogger("shoesbot.photo_buffer")
 
@@ -17,67 +31,127 @@ class PhotoItem(NamedTuple):
     message_id: int  # For deleting original message
 
 
+class LazyFile:
+    """Telegram file resolved with get_file on first download, so buffering never waits on the API."""
+
+    def __init__(self, bot: Any, file_id: str):
+        self.bot = bot
+        self.file_id = file_id
+        self._file: Optional[File] = None
+
+    async def download_to_memory(self, out) -> None:
+        if self._file is None:
+            self._file = await self.bot.get_file(self.file_id)
+        await self._file.download_to_memory(out=out)
+
+
+class GapEstimator:
+    """Smoothed gap between photos of one album (mean + 4 deviations, like TCP's RTO)."""
+
+    def __init__(self, initial: float = ALBUM_GAP_INITIAL, floor: float = ALBUM_WAIT_MIN,
+                 ceiling: float = BUFFER_TIMEOUT):
+        self.mean = initial
+        self.dev = initial / 2
+        self.floor = floor
+        self.ceiling = ceiling
+
+    def observe(self, gap: float) -> None:
+        gap = min(gap, self.ceiling)
+        self.dev = 0.75 * self.dev + 0.25 * abs(gap - self.mean)
+        self.mean = 0.875 * self.mean + 0.125 * gap
+
+    def debounce(self) -> float:
+        return min(self.ceiling, max(self.floor, self.mean + 4 * self.dev))
+
+
+class Album:
+    """Photos of one chat that will be processed as one batch."""
+
+    def __init__(self, media_group_id: Optional[str], now: float, gaps: GapEstimator):
+        self.media_group_id = media_group_id
+        self.gaps = gaps  # the chat's estimator
+        self.items: List[PhotoItem] = []
+        self.first = now
+        self.last = now
+        self.closed = False
+        self.changed = asyncio.Event()
+
+
 class PhotoBuffer:
-    def __init__(self):
-        self.buffers: Dict[int, List[Tuple[float, PhotoItem]]] = {}
-
-    def add(self, chat_id: int, file_id: str, photo_file: File, message_id: int) -> Tuple[bool, Optional[List[PhotoItem]]]:
-        """Add photo to buffer. Returns (should_wait, Optional[batch]).
-        should_wait=True means this is first photo and we should start timer."""
-        now = time()
-        
-        if chat_id not in self.buffers:
-            self.buffers[chat_id] = []
-        
-        self.buffers[chat_id].append((now, PhotoItem(file_id, photo_file, message_id)))
-        
-        # Clean old buffers
-        self._cleanup(now)
-        
-        # Always return the buffer after adding
-        items = [p for _, p in self.buffers[chat_id]]
-        is_first = len(items) == 1
-        return (is_first, items)
-
-    def flush(self, chat_id: int, timeout: float = BUFFER_TIMEOUT) -> Optional[List[PhotoItem]]:
-        """Flush buffer for chat_id after timeout."""
-        logger.info(f"flush: called for chat_id={chat_id}, timeout={timeout}")
-        if chat_id not in self.buffers:
-            logger.warning(f"flush: chat_id {chat_id} not in buffers")
-            return None
-        
-        now = time()
-        logger.info(f"flush: before cleanup, buffer[{chat_id}] size: {len(self.buffers[chat_id])}")
-        self._cleanup(now)
-        logger.info(f"flush: after cleanup, buffer[{chat_id}] exists: {chat_id in self.buffers}")
-        
-        if not self.buffers.get(chat_id):
-            logger.warning(f"flush: buffer[{chat_id}] empty after cleanup")
-            return None
-        
-        # Get FIRST photo time (when we started waiting)
-        first_time = min(t for t, _ in self.buffers[chat_id])
-        time_diff = now - first_time
-        logger.info(f"flush: first_time={first_time}, now={now}, diff={time_diff:.2f}s, timeout={timeout}")
-        
-        # Flush after timeout from FIRST photo
-        if now - first_time >= timeout:
-            items = [p for _, p in self.buffers[chat_id]]
-            logger.info(f"flush: returning {len(items)} items")
-            del self.buffers[chat_id]
-            return items
-        
-        logger.warning(f"flush: not yet timeout, returning None")
-        return None
-
-    def _cleanup(self, now: float):
-        """Remove old buffers."""
-        for chat_id in list(self.buffers.keys()):
-            if not self.buffers[chat_id]:
-                del self.buffers[chat_id]
-                continue
+    def __init__(self, timeout: float = BUFFER_TIMEOUT, gap_initial: float = ALBUM_GAP_INITIAL,
+                 gap_floor: float = ALBUM_WAIT_MIN):
+        self.timeout = timeout
+        self.gap_initial = gap_initial
+        self.gap_floor = gap_floor
+        self.gaps: Dict[int, GapEstimator] = {}  # chat_id -> its own album rhythm
+        self.albums: Dict[int, Deque[Album]] = {}
+
+    def gaps_for(self, chat_id: int) -> GapEstimator:
+        gaps = self.gaps.get(chat_id)
+        if gaps is None:
+            gaps = self.gaps[chat_id] = GapEstimator(self.gap_initial, self.gap_floor, self.timeout)
+        return gaps
+
+    def add(self, chat_id: int, file_id: str, photo_file: File, message_id: int,
+            media_group_id: Optional[str] = None) -> Tuple[bool, Album]:
+        """Add photo to buffer. Returns (is_first, album).
+        is_first=True means the photo opened a new album: start a collect() for it."""
+        now = monotonic()
+        queue = self.albums.setdefault(chat_id, deque())
+        # Same album still being collected (or closed but not taken yet): the photo belongs there
+        album = next((a for a in reversed(queue) if a.media_group_id == media_group_id), None) \
+            if media_group_id is not None else None
+        if album is not None:
+            if not album.closed:
+                album.gaps.observe(now - album.last)
+        else:
+            album = queue[-1] if queue else None
+            if album is None or album.closed or album.media_group_id != media_group_id:
+                if album is not None:
+                    self._close(album)
+                album = Album(media_group_id, now, self.gaps_for(chat_id))
+                queue.append(album)
+
+        album.items.append(PhotoItem(file_id, photo_file, message_id))
+        album.last = now
+        if media_group_id is not None and len(album.items) >= MAX_ALBUM_SIZE:
+            self._close(album)
+        album.changed.set()
+        return (len(album.items) == 1, album)
+
+    def deadline(self, album: Album) -> float:
+        """Monotonic time after which the album is considered complete."""
+        if album.media_group_id is None:
+            return album.first + self.timeout
+        return album.last + album.gaps.debounce()
+
+    async def collect(self, chat_id: int, album: Album) -> List[PhotoItem]:
+        """Wait until the album is complete, then take it out of the buffer."""
+        while not album.closed:
+            remaining = self.deadline(album) - monotonic()
+            if remaining <= 0:
+                break
+            album.changed.clear()
+            try:
+                await asyncio.wait_for(album.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        album.closed = True
+        queue = self.albums.get(chat_id)
+        if queue is not None:
+            if album in queue:
+                queue.remove(album)
+            if not queue:
+                del self.albums[chat_id]
+        logger.debug("collect: chat=%s group=%s photos=%d waited=%.2fs",
+                     chat_id, album.media_group_id, len(album.items), monotonic() - album.first)
+        return list(album.items)
+
+    @staticmethod
+    def _close(album: Album) -> None:
+        album.closed = True
+        album.changed.set()
 
 
 # Global buffer instance
 buffer = PhotoBuffer()
-
@@ -1,5 +1,7 @@
 from __future__ import annotations
-from typing import List, Sequence, Tuple, Dict, Any
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence, Tuple
+from contextlib import nullcontext
+from dataclasses import replace
 from time import perf_counter
 import asyncio
 from PIL import Image
@@ -7,14 +9,57 @@ from shoesbot.models import Barcode
 from shoesbot.decoders.base import Decoder
 
 class DecoderPipeline:
-    def __init__(self, decoders: Sequence[Decoder]):
+    def __init__(self, decoders: Sequence[Decoder], fallbacks: Optional[Dict[str, str]] = None):
         self.decoders = list(decoders)
-        # Quick decoders that are fast (ZBar, OpenCV)
-        self.quick_decoders = [d for d in decoders if d.name in ("zbar", "opencv-qr")]
+        # Quick decoders that are fast (ZBar, OpenCV, local GG reader)
+        self.quick_decoders = [d for d in decoders if d.name in ("zbar", "opencv-qr", "gg-label-local")]
         # Slow decoders that can be skipped (Vision, GG)
-        self.slow_decoders = [d for d in decoders if d.name in ("vision-ocr", "gg-label")]
+        self.slow_decoders = [d for d in decoders if d.name in ("vision-ocr", "gg-label", "gg-label-improved")]
+        # Optional admission gate: decoder -> semaphore / async context manager
+        self.gate: Optional[Callable[[Decoder], Any]] = None
+        # Fallback decoder name -> primary decoder name: the fallback only runs
+        # when the primary found nothing (e.g. network OCR after the local GG reader)
+        self.fallbacks: Dict[str, str] = dict(fallbacks or {})
+        # Optional wrapper for decoder calls made in worker threads (e.g. the /profile command)
+        self.wrap_call: Optional[Callable[[Callable], Callable]] = None
 
-    def run(self, image: Image.Image, image_bytes: bytes) -> List[Barcode]:
+    def _gated(self, decoder: Decoder):
+        return self.gate(decoder) if self.gate else nullcontext()
+
+    def _decode_fn(self, decoder: Decoder) -> Callable:
+        return self.wrap_call(decoder.decode) if self.wrap_call else decoder.decode
+
+    @staticmethod
+    def _tag(results: List[Barcode], photo_index: Optional[int]) -> List[Barcode]:
+        """Record which photo of the album the codes came from."""
+        if photo_index is None:
+            return results
+        return [replace(b, photo_index=photo_index) for b in results]
+
+    @staticmethod
+    def _skipped(decoder: Decoder) -> Dict[str, Any]:
+        return {
+            'decoder': getattr(decoder, 'name', decoder.__class__.__name__),
+            'count': 0,
+            'ms': 0,
+            'error': None,
+            'skipped': True,
+        }
+
+    @property
+    def paid_decoders(self) -> List[str]:
+        """Names of decoders that call paid network APIs."""
+        return [d.name for d in self.decoders if getattr(d, "paid", False)]
+
+    @property
+    def max_side(self) -> Optional[int]:
+        """Longest side any decoder needs from the decoded image (None = full resolution)."""
+        sides = [getattr(d, "max_side", None) for d in self.decoders]
+        if not sides or any(s is None for s in sides):
+            return None
+        return max(sides) or None
+
+    def run(self, image: Image.Image, image_bytes: bytes, photo_index: Optional[int] = None) -> List[Barcode]:
         results: List[Barcode] = []
         seen: set[Tuple[str, str]] = set()
         for d in self.decoders:
@@ -28,18 +73,24 @@ class DecoderPipeline:
                     continue
                 seen.add(key)
                 results.append(b)
-        return results
+        return self._tag(results, photo_index)
 
-    def run_debug(self, image: Image.Image, image_bytes: bytes) -> tuple[List[Barcode], list[Dict[str, Any]]]:
+    def run_debug(self, image: Image.Image, image_bytes: bytes, exclude: Collection[str] = (),
+                  photo_index: Optional[int] = None) -> tuple[List[Barcode], list[Dict[str, Any]]]:
         timeline: list[Dict[str, Any]] = []
         results: List[Barcode] = []
         seen: set[Tuple[str, str]] = set()
+        found: Dict[str, int] = {}
         for d in self.decoders:
+            if d.name in exclude or found.get(self.fallbacks.get(d.name)):
+                timeline.append(self._skipped(d))
+                continue
             t0 = perf_counter()
             count = 0
             error = None
             try:
                 out = d.decode(image, image_bytes)
+                found[d.name] = len(out)
                 for b in out:
                     key = (b.symbology, b.data)
                     if key in seen:
@@ -56,74 +107,56 @@ class DecoderPipeline:
                 'ms': dt,
                 'error': error,
             })
-        return results, timeline
+        return self._tag(results, photo_index), timeline
     
-    async def run_smart_parallel_debug(self, image: Image.Image, image_bytes: bytes) -> tuple[List[Barcode], list[Dict[str, Any]]]:
-        """Run quick decoders first, skip slow ones if quick decoders found barcodes."""
-        # Run quick decoders first
+    async def run_smart_parallel_debug(self, image: Image.Image, image_bytes: bytes, exclude: Collection[str] = (),
+                                       photo_index: Optional[int] = None,
+                                       on_result: Optional[Callable[[List[Barcode]], Any]] = None) -> tuple[List[Barcode], list[Dict[str, Any]]]:
+        """Run quick decoders first, skip slow ones if quick decoders found barcodes.
+
+        GG labels and their Q codes do not count as found barcodes: the slow
+        OCR decoders are still needed to pair them.  Fallbacks wait for their
+        primary as in run_parallel_debug.  on_result gets each decoder's codes
+        as soon as that decoder finishes.
+        """
+        quick_decoders = [d for d in self.quick_decoders if d.name not in exclude]
+        slow_decoders = [d for d in self.slow_decoders if d.name not in exclude]
+        tasks: Dict[str, asyncio.Future] = {}
+
         async def decode_one(decoder):
+            primary = tasks.get(self.fallbacks.get(decoder.name))
+            if primary is not None:
+                primary_result = await asyncio.shield(primary)
+                if primary_result is not None and primary_result[0]:
+                    return None  # primary decoder succeeded, fallback not needed
             t0 = perf_counter()
             try:
-                out = await asyncio.to_thread(decoder.decode, image, image_bytes)
+                async with self._gated(decoder):
+                    out = await asyncio.to_thread(self._decode_fn(decoder), image, image_bytes)
                 error = None
             except Exception as e:
                 out = []
                 error = repr(e)
             elapsed = perf_counter() - t0
+            if on_result and out:
+                on_result(self._tag(out, photo_index))
             return out, error, elapsed
-        
-        # Run quick decoders in parallel
-        quick_tasks = [decode_one(d) for d in self.quick_decoders]
-        quick_results = await asyncio.gather(*quick_tasks)
-        
-        # Check if quick decoders found anything (excluding Q-codes which are GG labels)
-        found_barcodes = False
+
+        async def run_all(decoders):
+            for d in decoders:
+                tasks[d.name] = asyncio.ensure_future(decode_one(d))
+            return await asyncio.gather(*(tasks[d.name] for d in decoders))
+
         all_results: List[Barcode] = []
-        seen: set[Tuple[str, str]] = set()
-        
-        for out, _, _ in quick_results:
-            for b in out:
-                key = (b.symbology, b.data)
-                if key not in seen:
-                    seen.add(key)
-                    all_results.append(b)
-                    # Check if it's a real barcode (not a Q code)
-                    if not (b.symbology == "CODE39" and b.data.startswith("Q")):
-                        found_barcodes = True
-        
         timeline: list[Dict[str, Any]] = []
-        decoder_idx = 0
-        
-        # Add quick decoder results to timeline
-        for idx, decoder in enumerate(self.quick_decoders):
-            out, error, elapsed = quick_results[idx]
-            count = 0
-            for b in out:
-                if (b.symbology, b.data) in seen:
-                    count += 1
-            timeline.append({
-                'decoder': getattr(decoder, 'name', decoder.__class__.__name__),
-                'count': count,
-                'ms': int(elapsed * 1000),
-                'error': error,
-            })
-            decoder_idx += 1
-        
-        # Skip slow decoders if we found barcodes
-        if found_barcodes:
-            for decoder in self.slow_decoders:
-                timeline.append({
-                    'decoder': getattr(decoder, 'name', decoder.__class__.__name__),
-                    'count': 0,
-                    'ms': 0,
-                    'error': None,
-                })
-        else:
-            # Run slow decoders in parallel
-            slow_tasks = [decode_one(d) for d in self.slow_decoders]
-            slow_results = await asyncio.gather(*slow_tasks)
-            
-            for idx, (out, error, elapsed) in enumerate(slow_results):
+        seen: set[Tuple[str, str]] = set()
+
+        def collect(decoders, decoder_results) -> None:
+            for decoder, decoder_result in zip(decoders, decoder_results):
+                if decoder_result is None:
+                    timeline.append(self._skipped(decoder))
+                    continue
+                out, error, elapsed = decoder_result
                 count = 0
                 for b in out:
                     key = (b.symbology, b.data)
@@ -132,37 +165,75 @@ class DecoderPipeline:
                         all_results.append(b)
                         count += 1
                 timeline.append({
-                    'decoder': getattr(self.slow_decoders[idx], 'name', '?'),
+                    'decoder': getattr(decoder, 'name', decoder.__class__.__name__),
                     'count': count,
                     'ms': int(elapsed * 1000),
                     'error': error,
                 })
-        
-        return all_results, timeline
+
+        # Run quick decoders in parallel
+        collect(quick_decoders, await run_all(quick_decoders))
+
+        # Real barcodes only: GG labels (text or Q code) still need the OCR decoders
+        found_barcodes = any(
+            b.symbology != "GG_LABEL" and not (b.symbology == "CODE39" and b.data.startswith("Q"))
+            for b in all_results
+        )
+
+        # Skip slow decoders if we found barcodes
+        if found_barcodes:
+            for decoder in slow_decoders:
+                timeline.append(self._skipped(decoder))
+        else:
+            collect(slow_decoders, await run_all(slow_decoders))
+
+        for decoder in self.quick_decoders + self.slow_decoders:
+            if decoder.name in exclude:
+                timeline.append(self._skipped(decoder))
+
+        return self._tag(all_results, photo_index), timeline
     
-    async def run_parallel_debug(self, image: Image.Image, image_bytes: bytes) -> tuple[List[Barcode], list[Dict[str, Any]]]:
-        """Run decoders in parallel using asyncio.gather()."""
+    async def run_parallel_debug(self, image: Image.Image, image_bytes: bytes, exclude: Collection[str] = (),
+                                 photo_index: Optional[int] = None,
+                                 on_result: Optional[Callable[[List[Barcode]], Any]] = None) -> tuple[List[Barcode], list[Dict[str, Any]]]:
+        """Run decoders in parallel using asyncio.gather(); on_result as in run_smart_parallel_debug."""
+        decoders = [d for d in self.decoders if d.name not in exclude]
+        tasks: Dict[str, asyncio.Future] = {}
+
         async def decode_one(decoder):
+            primary = tasks.get(self.fallbacks.get(decoder.name))
+            if primary is not None:
+                primary_out, _, _ = await asyncio.shield(primary)
+                if primary_out:
+                    return None  # primary decoder succeeded, fallback not needed
             t0 = perf_counter()
             try:
-                out = await asyncio.to_thread(decoder.decode, image, image_bytes)
+                async with self._gated(decoder):
+                    out = await asyncio.to_thread(self._decode_fn(decoder), image, image_bytes)
                 error = None
             except Exception as e:
                 out = []
                 error = repr(e)
             elapsed = perf_counter() - t0
+            if on_result and out:
+                on_result(self._tag(out, photo_index))
             return out, error, elapsed
         
-        # Run all decoders in parallel
-        tasks = [decode_one(d) for d in self.decoders]
-        decoder_results = await asyncio.gather(*tasks)
+        # Run all decoders in parallel (fallbacks wait for their primary)
+        for d in decoders:
+            tasks[d.name] = asyncio.ensure_future(decode_one(d))
+        decoder_results = await asyncio.gather(*tasks.values())
         
         # Deduplicate and build timeline
         results: List[Barcode] = []
         timeline: list[Dict[str, Any]] = []
         seen: set[Tuple[str, str]] = set()
         
-        for idx, (out, error, elapsed) in enumerate(decoder_results):
+        for idx, decoder_result in enumerate(decoder_results):
+            if decoder_result is None:
+                timeline.append(self._skipped(decoders[idx]))
+                continue
+            out, error, elapsed = decoder_result
             count = 0
             for b in out:
                 key = (b.symbology, b.data)
@@ -171,9 +242,29 @@ class DecoderPipeline:
                     results.append(b)
                     count += 1
             timeline.append({
-                'decoder': getattr(self.decoders[idx], 'name', self.decoders[idx].__class__.__name__),
+                'decoder': getattr(decoders[idx], 'name', decoders[idx].__class__.__name__),
                 'count': count,
                 'ms': int(elapsed * 1000),
                 'error': error,
             })
-        return results, timeline
+        for decoder in self.decoders:
+            if decoder.name in exclude:
+                timeline.append(self._skipped(decoder))
+        return self._tag(results, photo_index), timeline
+
+
+def default_pipeline(with_openai: bool = False) -> DecoderPipeline:
+    """Production decoder set; network GG OCR only runs when the local sticker reader is not confident."""
+    from shoesbot.decoders.zbar_decoder import ZBarDecoder
+    from shoesbot.decoders.cv_qr_decoder import OpenCvQrDecoder
+    from shoesbot.decoders.vision_decoder import VisionDecoder
+    from shoesbot.decoders.gg_label_local import LocalGGLabelDecoder
+    from shoesbot.decoders.gg_label_decoder_improved import ImprovedGGLabelDecoder
+
+    decoders: List[Decoder] = [
+        ZBarDecoder(), OpenCvQrDecoder(), VisionDecoder(), LocalGGLabelDecoder(), ImprovedGGLabelDecoder(),
+    ]
+    if with_openai:
+        from shoesbot.decoders.openai_barcode_decoder import OpenAIBarcodeDecoder
+        decoders.append(OpenAIBarcodeDecoder())
+    return DecoderPipeline(decoders, fallbacks={"gg-label-improved": "gg-label-local"})
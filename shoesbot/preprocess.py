@@ -0,0 +1,170 @@
+"""Per-photo preprocessing cache shared by all decoders.
+
+Decoders used to resize, enhance and re-encode their own copies of every
+photo.  ``prepare(image, image_bytes)`` returns one ``PreparedImage`` per
+decoded frame; its variants are computed lazily on first request, memoized,
+and handed out as read-only NumPy views, so concurrent decoders share them.
+
+Only compact results are kept for the life of the frame: the gray and
+binarized planes (one byte per pixel each, charged to the image memory budget
+together with the frame, see image_loader.decoded_size_bytes) and the encoded
+bytes.  ``rgb`` is a full copy of the frame (PIL cannot export its pixels
+without copying) and upscaled/enhanced PIL intermediates are many times the
+frame's size, so those are built on demand and dropped by the caller.
+
+Variants:
+- arrays: ``rgb`` (copied per call), ``gray``, ``binarized`` (Otsu)
+- recipes (upscale to a minimum width + contrast/sharpness boost), see RECIPES
+- encoded bytes of any recipe (or ``original``) as JPEG or PNG
+"""
+from __future__ import annotations
+import threading
+from io import BytesIO
+from typing import Any, Callable, Dict, Hashable, Tuple
+import numpy as np
+from PIL import Image, ImageEnhance
+
+try:
+    import cv2  # type: ignore
+    HAS_CV2 = True
+except Exception:
+    HAS_CV2 = False
+
+JPEG_QUALITY = 90
+
+# name -> (min width, resample, contrast, sharpness)
+RECIPES: Dict[str, Tuple[int, int, float, float]] = {
+    "ocr": (1200, Image.BICUBIC, 1.3, 1.0),  # GGLabelDecoder
+    "high_contrast": (2000, Image.LANCZOS, 2.0, 1.5),  # yellow stickers
+    "high_res": (2400, Image.LANCZOS, 1.5, 1.0),
+    "standard": (1600, Image.BICUBIC, 1.3, 1.0),
+    "vision_direct": (2000, Image.LANCZOS, 1.5, 1.2),  # Django reprocess_photo
+}
+
+
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
+
+class PreparedImage:
+    """Lazily computed, memoized preprocessing variants of one photo."""
+
+    def __init__(self, image: Image.Image, image_bytes: bytes = b""):
+        self.image = image if image.mode == "RGB" else image.convert("RGB")
+        self.image_bytes = image_bytes
+        self._cache: Dict[Hashable, Any] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _memo(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        if key in self._cache:
+            return self._cache[key]
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:  # concurrent decoders asking for the same variant build it once
+            if key not in self._cache:
+                self._cache[key] = build()
+            return self._cache[key]
+
+    # --- arrays ---------------------------------------------------------
+
+    def array(self, name: str) -> np.ndarray:
+        """Read-only view of ``rgb``, ``gray``, ``binarized`` or a recipe."""
+        if name == "rgb":
+            return _readonly(np.asarray(self.image))  # a copy: not memoized, see the module docstring
+        if name == "gray":
+            return _readonly(self._memo("gray", self._gray))
+        if name == "binarized":
+            return _readonly(self._memo("binarized", self._binarized))
+        if name in RECIPES:
+            return _readonly(np.asarray(self.pil(name)))  # not memoized: see the module docstring
+        raise KeyError(f"unknown variant: {name}")
+
+    def _gray(self) -> np.ndarray:
+        rgb = self.array("rgb")
+        if HAS_CV2:
+            return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        luma = rgb[..., 0] * 0.299 + rgb[..., 1] * 0.587 + rgb[..., 2] * 0.114
+        return luma.astype(np.uint8)
+
+    def _binarized(self) -> np.ndarray:
+        gray = self.array("gray")
+        if HAS_CV2:
+            _, out = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            return out
+        # Otsu threshold from the histogram
+        hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+        weights = np.cumsum(hist)
+        means = np.cumsum(hist * np.arange(256))
+        total, total_mean = weights[-1], means[-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            between = (total_mean * weights - means * total) ** 2 / (weights * (total - weights))
+        threshold = int(np.nanargmax(between))
+        return np.where(gray > threshold, 255, 0).astype(np.uint8)
+
+    # --- PIL recipes ----------------------------------------------------
+
+    def upscaled(self, min_width: int, resample: int = Image.LANCZOS) -> Image.Image:
+        """Frame upscaled to at least ``min_width`` (never downscaled); not memoized."""
+        img = self.image
+        if img.width >= min_width:
+            return img
+        ratio = min_width / float(img.width)
+        return img.resize((int(img.width * ratio), int(img.height * ratio)), resample)
+
+    def pil(self, name: str) -> Image.Image:
+        """PIL image for a recipe (or ``original``); built on every call, callers own it."""
+        if name == "original":
+            return self.image
+        width, resample, contrast, sharpness = RECIPES[name]
+        img = self.upscaled(width, resample)
+        if contrast != 1.0:
+            img = ImageEnhance.Contrast(img).enhance(contrast)
+        if sharpness != 1.0:
+            img = ImageEnhance.Sharpness(img).enhance(sharpness)
+        return img
+
+    # --- encoded bytes --------------------------------------------------
+
+    def encoded(self, name: str, fmt: str = "JPEG") -> bytes:
+        """Recipe (or ``original``) encoded for upload to an OCR/LLM API."""
+        fmt = fmt.upper()
+
+        def build() -> bytes:
+            img = self.pil(name)
+            buf = BytesIO()
+            try:
+                if fmt == "JPEG":
+                    img.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+                else:
+                    img.save(buf, format=fmt)
+            finally:
+                if img is not self.image:
+                    img.close()  # the intermediate is not kept, only its encoding
+            return buf.getvalue()
+        if name == "original" and fmt == "JPEG" and self.image_bytes:
+            return self.image_bytes
+        return self._memo(("encoded", name, fmt), build)
+
+
+_prepare_lock = threading.Lock()
+
+
+def prepare(image: Image.Image, image_bytes: bytes = b"") -> PreparedImage:
+    """Shared PreparedImage for this frame.
+
+    It is attached to the frame itself, so every decoder that receives the
+    same Image gets the same cache, and it is freed together with the frame.
+    """
+    prepared = getattr(image, "_prepared", None)
+    if prepared is None:
+        with _prepare_lock:
+            prepared = getattr(image, "_prepared", None)
+            if prepared is None:
+                prepared = PreparedImage(image, image_bytes)
+                image._prepared = prepared
+    if image_bytes and not prepared.image_bytes:
+        prepared.image_bytes = image_bytes
+    return prepared
@@ -0,0 +1,189 @@
+"""On-demand profiling of a single album (/profile admin command).
+
+/profile arms the profiler for a chat; the next album from that chat runs
+inside a ProfileSession which collects:
+- cProfile stats of the event loop thread plus every decoder call made in
+  worker threads for this album (pipeline.wrap_call)
+- tracemalloc peak and top allocation sites
+- event loop lag samples
+- wall time of the awaited stages of process_photo_batch (stage(), which
+  also tags log lines with the stage name for every album)
+The session is bound to the album through a context variable, which
+asyncio tasks and asyncio.to_thread inherit, so other chats' albums running
+at the same time do not end up in the decoder stats.  The loop-thread
+profile is process-wide by nature.
+"""
+from __future__ import annotations
+import asyncio
+import cProfile
+import marshal
+import os
+import pstats
+import threading
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Set
+from shoesbot.logging_setup import logger, log_context
+
+TOP_N = 8
+LAG_INTERVAL = 0.05  # seconds between event loop lag samples
+TRACEMALLOC_FRAMES = 1
+
+_session: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+
+
+@dataclass
+class ProfileReport:
+    text: str
+    stats: bytes  # marshalled pstats, loadable with pstats.Stats / snakeviz
+    filename: str
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ProfileSession:
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.lag: List[float] = []
+        self._loop_profile = cProfile.Profile()
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._own_tracemalloc = False
+        self._sampler: Optional[asyncio.Task] = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        self._started = perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._own_tracemalloc = True
+        else:
+            tracemalloc.reset_peak()
+        self._sampler = asyncio.get_running_loop().create_task(self._sample_lag())
+        self._loop_profile.enable()
+        _session.set(self)
+
+    async def _sample_lag(self) -> None:
+        while True:
+            t0 = perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag.append(max(0.0, perf_counter() - t0 - LAG_INTERVAL) * 1000)
+
+    def add_thread_profile(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            self._thread_profiles.append(profile)
+
+    async def finish(self) -> ProfileReport:
+        self._loop_profile.disable()
+        _session.set(None)
+        wall = perf_counter() - self._started
+        if self._sampler:
+            self._sampler.cancel()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+
+        stats = pstats.Stats(self._loop_profile)
+        with self._lock:
+            for profile in self._thread_profiles:
+                stats.add(profile)
+        return ProfileReport(
+            text=self._render(wall, stats, snapshot, peak),
+            stats=marshal.dumps(stats.stats),  # same format as pstats.Stats.dump_stats
+            filename=f"album_{self.chat_id}_{int(self._started)}.prof",
+        )
+
+    def _render(self, wall: float, stats: pstats.Stats, snapshot: tracemalloc.Snapshot, peak: int) -> str:
+        lines = [f"🔬 Профиль альбома: {wall:.2f}s"]
+        if self.stages:
+            lines.append("Этапы (сумма / макс, кол-во):")
+            for name, times in sorted(self.stages.items(), key=lambda kv: -sum(kv[1])):
+                lines.append(f"  {name}: {sum(times) * 1000:.0f}ms / {max(times) * 1000:.0f}ms ×{len(times)}")
+        lines.append(f"Event loop lag: p50 {_percentile(self.lag, 0.5):.1f}ms, "
+                     f"p95 {_percentile(self.lag, 0.95):.1f}ms, max {max(self.lag, default=0.0):.1f}ms")
+
+        lines.append(f"CPU top (tottime, {len(self._thread_profiles)} decoder calls):")
+        top = sorted(stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:TOP_N]
+        for (filename, lineno, func), (_, calls, tottime, cumtime, _) in top:
+            lines.append(f"  {tottime * 1000:.0f}ms ({cumtime * 1000:.0f}ms cum) "
+                         f"{os.path.basename(filename)}:{lineno} {func}")
+
+        lines.append(f"Память: пик {peak / 2 ** 20:.1f}MB, top:")
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        for stat in snapshot.statistics("lineno")[:TOP_N]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size / 2 ** 20:.1f}MB {os.path.basename(frame.filename)}:{frame.lineno}")
+        return "\n".join(lines)
+
+
+class AlbumProfiler:
+    """Arms profiling per chat; one session at a time (cProfile does not nest)."""
+
+    def __init__(self):
+        self.armed: Set[int] = set()
+        self.active: Optional[ProfileSession] = None
+
+    def arm(self, chat_id: int) -> None:
+        self.armed.add(chat_id)
+
+    def begin(self, chat_id: int) -> Optional[ProfileSession]:
+        """Start a session if this chat is armed and nothing else is being profiled."""
+        if chat_id not in self.armed or self.active is not None:
+            return None
+        self.armed.discard(chat_id)
+        self.active = ProfileSession(chat_id)
+        self.active.start()
+        logger.info(f"profiler: profiling album from chat={chat_id}")
+        return self.active
+
+    async def end(self, session: ProfileSession) -> ProfileReport:
+        try:
+            return await session.finish()
+        finally:
+            self.active = None
+
+    @staticmethod
+    def wrap_call(fn: Callable) -> Callable:
+        """Run fn under its own cProfile when called (in a worker thread) for a profiled album."""
+        def call(*args, **kwargs):
+            session = _session.get()
+            if session is None:
+                return fn(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(fn, *args, **kwargs)
+            finally:
+                session.add_thread_profile(profile)
+        return call
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Tag log lines with the stage; also time it if the album is being profiled."""
+    session = _session.get()
+    with log_context(stage=name):
+        if session is None:
+            yield
+            return
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            session.stages[name].append(perf_counter() - t0)
+
+
+profiler = AlbumProfiler()
@@ -0,0 +1,105 @@
+"""Card message that is delivered progressively while an album is decoded.
+
+One ProgressiveCard per correlation id:
+
+    WAITING --(codes form a GG/Q pair)--> SHOWN --(finish)--> FINAL
+       \\----------------------------(finish)-------------------/
+
+While WAITING nothing is sent.  As soon as the codes reported so far are
+ready (local decoders usually find the GG sticker and the Q barcode within
+a second), the card is sent; later codes from slower decoders edit it in
+place, at most once per EDIT_INTERVAL.  finish() delivers the final text by
+editing the shown card, or sends it if the card never became ready.
+"""
+from __future__ import annotations
+import asyncio
+import os
+from enum import Enum
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Set, Tuple
+from shoesbot.logging_setup import logger
+from shoesbot.models import Barcode
+
+PROGRESSIVE_CARD = os.getenv("PROGRESSIVE_CARD", "1") == "1"
+EDIT_INTERVAL = float(os.getenv("CARD_EDIT_INTERVAL", "1.0"))  # Telegram throttles frequent edits
+
+
+class CardState(str, Enum):
+    WAITING = "waiting"
+    SHOWN = "shown"
+    FINAL = "final"
+
+
+class ProgressiveCard:
+    def __init__(
+        self,
+        corr: str,
+        render: Callable[[List[Barcode]], str],
+        ready: Callable[[List[Barcode]], bool],
+        send: Callable[[str], Awaitable[Any]],
+        edit: Callable[[Any, str], Awaitable[Any]],
+        edit_interval: float = EDIT_INTERVAL,
+    ):
+        self.corr = corr
+        self.render = render
+        self.ready = ready
+        self.send = send
+        self.edit = edit
+        self.edit_interval = edit_interval
+        self.state = CardState.WAITING
+        self.codes: List[Barcode] = []
+        self.message: Any = None
+        self._seen: Set[Tuple[str, str]] = set()
+        self._html: Optional[str] = None
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def add(self, barcodes: Iterable[Barcode]) -> None:
+        """Report codes as decoders finish; delivery happens in the background."""
+        new = False
+        for b in barcodes:
+            key = (b.symbology, b.data)
+            if key not in self._seen:
+                self._seen.add(key)
+                self.codes.append(b)
+                new = True
+        if not new or self.state is CardState.FINAL:
+            return
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._sync())
+
+    async def _sync(self) -> None:
+        while self._dirty and self.state is not CardState.FINAL:
+            self._dirty = False
+            async with self._lock:
+                if self.state is CardState.WAITING and self.ready(self.codes):
+                    html = self.render(self.codes)
+                    self.message = await self.send(html)
+                    if self.message is not None:
+                        self.state = CardState.SHOWN
+                        self._html = html
+                        logger.info("progressive_card: shown with %d codes", len(self.codes))
+                elif self.state is CardState.SHOWN:
+                    await self._edit(self.render(self.codes))
+            if self._dirty:
+                await asyncio.sleep(self.edit_interval)
+
+    async def _edit(self, html: str) -> None:
+        if html == self._html:
+            return
+        try:
+            await self.edit(self.message, html)
+            self._html = html
+        except Exception as e:
+            logger.warning("progressive_card: edit failed: %s", e)
+
+    async def finish(self, html: str) -> Any:
+        """Deliver the final card text; returns the card message (None if sending failed)."""
+        async with self._lock:
+            if self.state is CardState.SHOWN:
+                await self._edit(html)
+            else:
+                self.message = await self.send(html)
+            self.state = CardState.FINAL
+        return self.message
@@ -0,0 +1,85 @@
+"""Fast local image quality gate.
+
+Runs on a downscaled frame with NumPy only (a few milliseconds per photo),
+before any paid OCR/LLM call:
+- blur: variance of the 4-neighbour Laplacian of the luma channel
+- exposure: mean luma and the share of crushed / clipped pixels
+- sticker: share of saturated yellow pixels (our GG labels are yellow)
+"""
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from typing import Tuple
+import numpy as np
+from PIL import Image
+
+QUALITY_SIDE = 512  # analysis resolution, longest side
+BLUR_MIN_VARIANCE = float(os.getenv("QUALITY_BLUR_MIN", "60"))
+DARK_MAX_MEAN = 40.0
+DARK_MAX_SHARE = 0.5  # share of pixels with luma < 25
+BRIGHT_MAX_SHARE = 0.4  # share of pixels with luma > 245
+STICKER_MIN_SHARE = 0.003
+
+ISSUE_TEXT = {
+    "blurry": "размыто",
+    "dark": "слишком темно",
+    "overexposed": "пересвет",
+}
+
+
+@dataclass(frozen=True)
+class QualityReport:
+    blur: float
+    brightness: float
+    dark_share: float
+    bright_share: float
+    sticker_share: float
+    issues: Tuple[str, ...]
+
+    @property
+    def usable(self) -> bool:
+        return not self.issues
+
+    @property
+    def has_sticker(self) -> bool:
+        return self.sticker_share >= STICKER_MIN_SHARE
+
+    def describe(self) -> str:
+        return ", ".join(ISSUE_TEXT.get(i, i) for i in self.issues)
+
+    def as_dict(self) -> dict:
+        return {
+            'blur': round(self.blur, 1),
+            'brightness': round(self.brightness, 1),
+            'sticker': round(self.sticker_share, 4),
+            'issues': list(self.issues),
+        }
+
+
+def assess(image: Image.Image, side: int = QUALITY_SIDE) -> QualityReport:
+    """Assess blur, exposure and sticker presence of an RGB image."""
+    factor = max(1, max(image.size) // side)
+    small = image.reduce(factor) if factor > 1 else image
+    rgb = np.asarray(small, dtype=np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    luma = 0.299 * r + 0.587 * g + 0.114 * b
+
+    lap = (
+        luma[:-2, 1:-1] + luma[2:, 1:-1] + luma[1:-1, :-2] + luma[1:-1, 2:]
+        - 4.0 * luma[1:-1, 1:-1]
+    )
+    blur = float(lap.var()) if lap.size else 0.0
+    brightness = float(luma.mean())
+    dark_share = float((luma < 25).mean())
+    bright_share = float((luma > 245).mean())
+    yellow = (r > 140) & (g > 140) & (b < 0.6 * np.minimum(r, g))
+    sticker_share = float(yellow.mean())
+
+    issues = []
+    if blur < BLUR_MIN_VARIANCE:
+        issues.append("blurry")
+    if brightness < DARK_MAX_MEAN or dark_share > DARK_MAX_SHARE:
+        issues.append("dark")
+    if bright_share > BRIGHT_MAX_SHARE:
+        issues.append("overexposed")
+    return QualityReport(blur, brightness, dark_share, bright_share, sticker_share, tuple(issues))
@@ -17,24 +17,26 @@ import sqlite3
 from io import BytesIO
 from dotenv import load_dotenv
 from time import perf_counter
-from PIL import Image
 from telegram import Update, InputMediaPhoto, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
 from typing import Optional
 from telegram.request import HTTPXRequest
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
-from shoesbot.pipeline import DecoderPipeline
-from shoesbot.decoders.zbar_decoder import ZBarDecoder
-from shoesbot.decoders.cv_qr_decoder import OpenCvQrDecoder
-from shoesbot.decoders.vision_decoder import VisionDecoder
-from shoesbot.decoders.gg_label_decoder import GGLabelDecoder
+from shoesbot.pipeline import default_pipeline
+from shoesbot.decode_client import DecodeServiceError, client as decode_client
+from shoesbot.endpoints import OPENAI_CHAT_URL, TELEGRAM_API_BASE
 from shoesbot.renderers.card_renderer import CardRenderer
-from shoesbot.logging_setup import logger
+from shoesbot.logging_setup import logger, bind_log_context, log_context
 from shoesbot.diagnostics import system_info
 from shoesbot.metrics import append_event, summarize
 from shoesbot.admin import get_admin_id, set_admin_id
-from shoesbot.photo_buffer import buffer as photo_buffer
+from shoesbot.photo_buffer import LazyFile, buffer as photo_buffer
+from shoesbot.image_loader import decoded_image, decode_side
+from shoesbot.album_scheduler import limits, scheduler as album_scheduler
+from shoesbot.profiler import profiler as album_profiler, stage
+from shoesbot.progressive_card import PROGRESSIVE_CARD, ProgressiveCard
+from shoesbot.quality import assess as assess_quality
 from shoesbot.django_upload import upload_batch_to_django
 from shoesbot.fitness_reporter import FitnessReporter
 
@@ -62,7 +64,9 @@ except Exception as _sentry_err:  # pragma: no cover
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN")
 
-pipeline = DecoderPipeline([ZBarDecoder(), OpenCvQrDecoder(), VisionDecoder(), GGLabelDecoder()])
+pipeline = default_pipeline()
+pipeline.gate = limits.for_decoder  # global limits for local decode vs paid API calls
+pipeline.wrap_call = album_profiler.wrap_call  # decoder stats for /profile
 renderer = CardRenderer(templates_dir=os.path.join(os.path.dirname(__file__), "..", "templates"))
 
 DEBUG_DEFAULT = os.getenv("DEBUG", "0") in ("1", "true", "True")
@@ -72,6 +76,7 @@ USE_PARALLEL_DECODERS = os.getenv("PARALLEL_DECODERS", "1") == "1"
 # Storage for photos waiting for GG label
 PENDING_WITHOUT_GG: dict = {}  # {chat_id: {'photos': [...], 'message_ids': [...]}}
 USE_SMART_SKIP = os.getenv("SMART_SKIP_VISION", "0") == "1"  # Disabled by default
+DECODE_MODE = ("smart" if USE_SMART_SKIP else "parallel") if USE_PARALLEL_DECODERS else "sequential"
 
 # In-memory registry of sent messages per batch (correlation id)
 # SENT_BATCHES[corr] = { 'chat_id': int, 'message_ids': [int] }
@@ -124,6 +129,34 @@ async def queue_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await update.message.reply_text(f"Ошибка: {e}")
 
 
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Профилировать следующий альбом из этого чата (только админ)."""
+    cid = update.effective_chat.id
+    if get_admin_id() != cid:
+        await update.message.reply_text("Только для админа (/admin_on)")
+        return
+    album_profiler.arm(cid)
+    await update.message.reply_text("🔬 Следующий альбом из этого чата будет профилирован")
+
+
+async def profile_album(chat_id: int, bot, factory) -> None:
+    """Run an album, under the profiler if /profile was armed for this chat, and send the report."""
+    session = album_profiler.begin(chat_id)
+    if session is None:
+        await factory()
+        return
+    try:
+        await factory()
+    finally:
+        try:
+            result = await album_profiler.end(session)
+            await bot.send_message(chat_id, result.text[:4000])
+            await bot.send_document(chat_id, document=result.stats, filename=result.filename,
+                                    caption=f"python -m pstats {result.filename}")
+        except Exception as e:
+            logger.error(f"profile_album: failed to send report: {e}", exc_info=True)
+
+
 async def report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Генерация отчета о тренировках и питании"""
     try:
@@ -221,15 +254,135 @@ async def send_media_group_ret(bot, chat_id: int, media_group: list, max_retries
                 logger.error(f"send_media_group_ret: failed after retries: {e}")
                 return []
 
-async def process_photo_batch(chat_id: int, photo_items: list, context: ContextTypes.DEFAULT_TYPE, status_msg=None) -> None:
-    """Process a batch of photos."""
+def queue_position_reporter(status_msg):
+    """Build a scheduler callback that shows the album's place in the queue."""
+    async def report_position(position: int) -> None:
+        if status_msg:
+            await status_msg.edit_text(f"⏳ В очереди: {position} (альбомов впереди: {position - 1})")
+    return report_position
+
+
+def card_codes(results: list) -> list:
+    """Codes in card order: regular barcodes, then GG labels from OCR, then Q codes (CODE39 Q… are GG labels too)."""
+    gg_from_ocr = [r for r in results if r.source.startswith("gg-label")]
+    gg_from_q = [r for r in results if r.symbology == "CODE39" and r.data.startswith("Q")]
+    regular = [r for r in results if not r.source.startswith("gg-label") and not (r.symbology == "CODE39" and r.data.startswith("Q"))]
+    return regular + gg_from_ocr + gg_from_q
+
+
+def gg_pair(codes: list) -> tuple:
+    """(GG text codes, Q codes); the card is complete when both are non-empty."""
+    gg_text_codes = [r for r in codes if r.symbology == 'GG_LABEL' and r.data.startswith('GG')]
+    q_barcode_codes = [r for r in codes if r.symbology in ('GG_LABEL', 'CODE39') and r.data.startswith('Q')]
+    return gg_text_codes, q_barcode_codes
+
+
+def render_card(barcode_results: list, photo_count: int, merged: bool = False, timelines: Optional[list] = None) -> str:
+    gg_text_codes, q_barcode_codes = gg_pair(barcode_results)
+    # Добавляем статус распознавания
+    if gg_text_codes and q_barcode_codes:
+        html = "✅ <b>GG лейбла найдена (полная пара)</b>\n"
+        html += f"🏷️ GG: {', '.join([r.data for r in gg_text_codes])}\n"
+        html += f"🔢 Q: {', '.join([r.data for r in q_barcode_codes])}\n\n"
+    else:
+        html = "⚠️ <b>Неполная пара GG/Q</b>\n"
+        if gg_text_codes:
+            html += f"🏷️ GG: {', '.join([r.data for r in gg_text_codes])}\n"
+        if q_barcode_codes:
+            html += f"🔢 Q: {', '.join([r.data for r in q_barcode_codes])}\n"
+        html += "\n"
+    
+    if merged:
+        html += f"📦 Объединено фото: {photo_count}\n\n"
+    html += renderer.render_barcodes_html(barcode_results, photo_count=photo_count)
+    if timelines:
+        lines = [f"{t['decoder']}: {t['count']} за {t['ms']}ms" for t in timelines]
+        html += "\n\n<code>" + " | ".join(lines) + "</code>"
+    return html
+
+
+async def process_photo_batch(chat_id: int, photo_items: list, context: ContextTypes.DEFAULT_TYPE, status_msg=None,
+                              known: Optional[dict] = None) -> None:
+    """Process a batch of photos.
+
+    known: photo index -> barcodes already read from that photo (e.g. on retry);
+    those photos are not decoded again.
+    """
     try:
-        logger.info(f"process_photo_batch: starting, chat={chat_id}, items={len(photo_items)}")
-        is_debug = DEBUG_DEFAULT or (chat_id in DEBUG_CHATS)
         corr = uuid.uuid4().hex[:8]
+        bind_log_context(corr=corr, chat_id=chat_id)
+        logger.info("process_photo_batch: starting, items=%d", len(photo_items))
+        is_debug = DEBUG_DEFAULT or (chat_id in DEBUG_CHATS)
         
         all_results = []
         all_timelines = []
+        photo_quality: dict = {}  # idx -> QualityReport
+        retake: dict = {}  # idx -> issues text, photos the user should reshoot
+        retake_lock = asyncio.Lock()
+        retake_msg = None
+        
+        # Registry of sent messages for this batch ("Удалить всё" / "Перезагрузить")
+        SENT_BATCHES[corr] = { 'chat_id': chat_id, 'message_ids': [] }
+        reg = SENT_BATCHES[corr]['message_ids']
+
+        async def send_card(html: str):
+            m_card = await send_message_ret(context.bot, chat_id, html, parse_mode='HTML')
+            if m_card:
+                reg.append(m_card.message_id)
+            return m_card
+
+        # Card: sent once codes form a GG/Q pair, edited as more codes arrive (PROGRESSIVE_CARD)
+        card = ProgressiveCard(
+            corr,
+            render=lambda codes: render_card(card_codes(codes), len(photo_items)),
+            ready=lambda codes: all(gg_pair(codes)),
+            send=send_card,
+            edit=lambda message, html: message.edit_text(html, parse_mode='HTML'),
+        )
+        on_result = card.add if PROGRESSIVE_CARD else None
+
+        async def send_album() -> None:
+            """PLACE4174 + photo album (the card follows it)."""
+            logger.info("process_photo_batch: sending PLACE4174")
+            m0 = await send_message_ret(context.bot, chat_id, "PLACE4174")
+            if m0:
+                reg.append(m0.message_id)
+            await asyncio.sleep(0.2)  # Баланс между скоростью и стабильностью
+            
+            logger.info("process_photo_batch: sending media group with %d photos", len(photo_items))
+            media_group = [InputMediaPhoto(item.file_id) for item in photo_items]
+            with stage("send_album"):
+                mg = await send_media_group_ret(context.bot, chat_id, media_group)
+            if mg:
+                reg.extend([m.message_id for m in mg])
+            await asyncio.sleep(0.2)  # Баланс между скоростью и стабильностью
+
+        async def delete_originals() -> None:
+            logger.info("process_photo_batch: deleting %d original messages", len(photo_items))
+            with stage("delete_originals"):
+                for item in photo_items:
+                    try:
+                        await context.bot.delete_message(chat_id=chat_id, message_id=item.message_id)
+                    except Exception as e:
+                        logger.warning("process_photo_batch: failed to delete message %s: %s", item.message_id, e)
+
+        async def report_retake(idx: int, quality) -> None:
+            """Tell the user right away which photos are unusable."""
+            nonlocal retake_msg
+            retake[idx] = quality.describe()
+            text = "📸 Переснимите фото:\n" + "\n".join(
+                f"• фото {i + 1}: {reason}" for i, reason in sorted(retake.items())
+            )
+            async with retake_lock:
+                try:
+                    if retake_msg is None:
+                        retake_msg = await send_message_ret(context.bot, chat_id, text)
+                        if retake_msg:
+                            reg.append(retake_msg.message_id)
+                    else:
+                        await retake_msg.edit_text(text)
+                except Exception as e:
+                    logger.debug(f"Failed to report retake: {e}")
         
         # Обновляем прогресс: начало обработки
         if status_msg:
@@ -238,42 +391,81 @@ async def process_photo_batch(chat_id: int, photo_items: list, context: ContextT
             except Exception as e:
                 logger.debug(f"Failed to update progress: {e}")
         
+        if PROGRESSIVE_CARD:
+            # Альбом уходит сразу, карточка появится, как только найдется пара GG/Q
+            await send_album()
+            await delete_originals()
+        
         # Параллельная обработка всех фото одновременно
         async def process_single_photo(idx: int, item) -> tuple:
             """Обработать одно фото и вернуть результаты."""
-            logger.info(f"process_photo_batch: processing item {idx+1}/{len(photo_items)}")
+            if known and idx in known:
+                results = [replace(b, photo_index=idx) for b in known[idx]]
+                if on_result:
+                    on_result(results)
+                return results, [], idx
+            logger.info("process_photo_batch: processing item %d/%d", idx + 1, len(photo_items))
             
             t0 = perf_counter()
             buf = BytesIO()
             
             # Retry механизм для скачивания (httpx.ConnectError защита)
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    await item.file_obj.download_to_memory(out=buf)
-                    break
-                except Exception as download_err:
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Download retry {attempt + 1}/{max_retries}: {download_err}")
-                        await asyncio.sleep(1)
-                    else:
-                        raise
+            with stage("download"):
+                max_retries = 3
+                for attempt in range(max_retries):
+                    try:
+                        async with limits.download:
+                            await item.file_obj.download_to_memory(out=buf)
+                        break
+                    except Exception as download_err:
+                        if attempt < max_retries - 1:
+                            logger.warning(f"Download retry {attempt + 1}/{max_retries}: {download_err}")
+                            await asyncio.sleep(1)
+                        else:
+                            raise
             
             download_ms = int((perf_counter() - t0) * 1000)
-            
+
             raw = buf.getvalue()
-            buf.seek(0)
-            img = Image.open(buf).convert("RGB")
-            
-            # Use smart parallel or regular parallel decoders
-            if USE_PARALLEL_DECODERS:
-                if USE_SMART_SKIP:
-                    results, timeline = await pipeline.run_smart_parallel_debug(img, raw)
-                else:
-                    results, timeline = await pipeline.run_parallel_debug(img, raw)
-            else:
-                results, timeline = pipeline.run_debug(img, raw)
-            
+            buf.close()
+
+            # Draft-mode decode within the global memory budget; all decoders share one RGB frame
+            async with decoded_image(raw, decode_side(pipeline.max_side)) as img:
+                # Local quality gate (a few ms): unusable frames never reach paid OCR/LLM
+                with stage("quality"):
+                    async with limits.decode:
+                        quality = await asyncio.to_thread(assess_quality, img)
+                photo_quality[idx] = quality
+                exclude = ()
+                if not quality.usable:
+                    logger.info("process_photo_batch: photo %d unusable (%s), skipping paid decoders", idx + 1, quality.describe())
+                    exclude = pipeline.paid_decoders
+                    await report_retake(idx, quality)
+
+                # Use smart parallel or regular parallel decoders
+                with stage("decoders"):
+                    remote = None
+                    if decode_client is not None:
+                        try:
+                            # The daemon also has the OpenAI decoder; the bot asks for it separately below
+                            remote = await decode_client.decode_async(
+                                raw, mode=DECODE_MODE, exclude=[*exclude, "openai-barcode"], photo_index=idx)
+                        except DecodeServiceError as e:
+                            logger.warning("process_photo_batch: %s, decoding in-process", e)
+                    if remote is not None:
+                        results, timeline = remote
+                        if on_result and results:
+                            on_result(results)
+                    elif USE_PARALLEL_DECODERS:
+                        if USE_SMART_SKIP:
+                            results, timeline = await pipeline.run_smart_parallel_debug(
+                                img, raw, exclude=exclude, photo_index=idx, on_result=on_result)
+                        else:
+                            results, timeline = await pipeline.run_parallel_debug(
+                                img, raw, exclude=exclude, photo_index=idx, on_result=on_result)
+                    else:
+                        results, timeline = pipeline.run_debug(img, raw, exclude=exclude, photo_index=idx)
+
             append_event({
                 'corr': corr,
                 'chat_id': chat_id,
@@ -281,6 +473,7 @@ async def process_photo_batch(chat_id: int, photo_items: list, context: ContextT
                 'download_ms': download_ms,
                 'timeline': timeline,
                 'size_bytes': len(raw),
+                'quality': quality.as_dict(),
             })
             
             return results, timeline, idx
@@ -297,54 +490,20 @@ async def process_photo_batch(chat_id: int, photo_items: list, context: ContextT
         
         # Don't send diagnostic messages to chat (only log them)
         
-        # Delete original messages
-        logger.info(f"process_photo_batch: deleting {len(photo_items)} original messages")
-        for item in photo_items:
-            try:
-                await context.bot.delete_message(chat_id=chat_id, message_id=item.message_id)
-            except Exception as e:
-                logger.warning(f"process_photo_batch: failed to delete message {item.message_id}: {e}")
-        
-        # Split results: GG from OCR decoder AND Q-codes from ZBar (CODE39/Q codes are our GG labels)
-        gg_from_ocr = [r for r in all_results if r.source == "gg-label"]
-        gg_from_q = [r for r in all_results if r.symbology == "CODE39" and r.data.startswith("Q")]
-        gg_results = gg_from_ocr + gg_from_q
-        
-        # Regular barcodes (excluding Q codes which are GG)
-        regular_barcodes = [r for r in all_results if r.source != "gg-label" and not (r.symbology == "CODE39" and r.data.startswith("Q"))]
+        if not PROGRESSIVE_CARD:
+            await delete_originals()
         
-        # All barcodes for card (regular + GG labels)
-        barcode_results = regular_barcodes + gg_results
-        
-        logger.info(f"GG labels: {len(gg_results)} ({len(gg_from_ocr)} from OCR, {len(gg_from_q)} from Q-codes)")
-        logger.info(f"Regular barcodes: {len(regular_barcodes)}")
-        logger.info(f"Total for card: {len(barcode_results)}")
+        # All barcodes for card: regular + GG labels (GG from OCR decoder AND Q-codes from ZBar)
+        barcode_results = card_codes(all_results)
         
         # Send: PLACE4174 + photo album + card (with GG labels) + PLACE4174
         # Each message has retry logic, but we continue sequentially
-        
-        # Prepare registry for this batch
-        SENT_BATCHES[corr] = { 'chat_id': chat_id, 'message_ids': [] }
-        reg = SENT_BATCHES[corr]['message_ids']
-
-        # First PLACE4174
-        logger.info("process_photo_batch: sending PLACE4174")
-        m0 = await send_message_ret(context.bot, chat_id, "PLACE4174")
-        if m0:
-            reg.append(m0.message_id)
-        await asyncio.sleep(0.2)  # Баланс между скоростью и стабильностью
-        
-        # Send photo album
-        logger.info(f"process_photo_batch: sending media group with {len(photo_items)} photos")
-        media_group = [InputMediaPhoto(item.file_id) for item in photo_items]
-        mg = await send_media_group_ret(context.bot, chat_id, media_group)
-        if mg:
-            reg.extend([m.message_id for m in mg])
-        await asyncio.sleep(0.2)  # Баланс между скоростью и стабильностью
+        if not PROGRESSIVE_CARD:
+            await send_album()
         
         # Проверяем наличие GG лейблов (GG текст + Q баркод)
-        gg_text_codes = [r for r in barcode_results if r.symbology == 'GG_LABEL' and r.data.startswith('GG')]
-        q_barcode_codes = [r for r in barcode_results if r.symbology == 'GG_LABEL' and r.data.startswith('Q')]
+        gg_text_codes, q_barcode_codes = gg_pair(barcode_results)
+        logger.info("GG: %d, Q: %d, total for card: %d", len(gg_text_codes), len(q_barcode_codes), len(barcode_results))
         
         has_gg_pair = len(gg_text_codes) > 0 and len(q_barcode_codes) > 0
         gg_labels = [r for r in barcode_results if r.symbology == 'GG_LABEL']
@@ -360,24 +519,35 @@ async def process_photo_batch(chat_id: int, photo_items: list, context: ContextT
                 
                 openai_key = os.getenv('OPENAI_API_KEY')
                 if openai_key:
-                    # Пробуем каждое фото
-                    for idx, photo_item in enumerate(photo_items):
+                    # Фото со стикером первыми, непригодные кадры не отправляем
+                    candidates = [
+                        idx for idx in range(len(photo_items))
+                        if idx not in photo_quality or photo_quality[idx].usable
+                    ]
+                    candidates.sort(key=lambda i: not (i in photo_quality and photo_quality[i].has_sticker))
+                    for idx in candidates:
+                        photo_item = photo_items[idx]
+                        if any(r.data.startswith('GG') for r in gg_labels) and (q_barcode_codes or any(r.data.startswith('Q') for r in gg_labels)):
+                            break  # полная пара уже найдена
                         try:
                             buf2 = BytesIO()
-                            await photo_item.file_obj.download_to_memory(out=buf2)
+                            async with limits.download:
+                                await photo_item.file_obj.download_to_memory(out=buf2)
                             img_data = buf2.getvalue()
                             img_b64 = base64.b64encode(img_data).decode('utf-8')
                             
-                            resp = sync_requests.post('https://api.openai.com/v1/chat/completions',
-                                headers={'Authorization': f'Bearer {openai_key}'},
-                                json={
-                                    'model': 'gpt-4o-mini',
-                                    'messages': [{
-                                        'role': 'user',
-                                        'content': [
-                                            {
-                                                'type': 'text',
-                                                'text': '''Find ALL codes on this product:
+                            with stage("openai_fallback"):
+                                async with limits.paid_api:
+                                    resp = await asyncio.to_thread(sync_requests.post, OPENAI_CHAT_URL,
+                                        headers={'Authorization': f'Bearer {openai_key}'},
+                                        json={
+                                            'model': 'gpt-4o-mini',
+                                            'messages': [{
+                                                'role': 'user',
+                                                'content': [
+                                                    {
+                                                        'type': 'text',
+                                                        'text': '''Find ALL codes on this product:
 
 1. GG code - LARGE BLACK TEXT on yellow sticker (like GG727, GG681)
 2. Q code - numbers UNDER or NEAR the barcode lines (like Q2622988, Q747)
@@ -394,15 +564,15 @@ Q2622988
 
 If you find only GG, still return it.
 If no codes at all, return "NONE"'''
-                                            },
-                                            {'type': 'image_url', 'image_url': {'url': f'data:image/jpeg;base64,{img_b64}'}}
-                                        ]
-                                    }],
-                                    'max_tokens': 50,
-                                    'temperature': 0
-                                },
-                                timeout=15
-                            )
+                                                    },
+                                                    {'type': 'image_url', 'image_url': {'url': f'data:image/jpeg;base64,{img_b64}'}}
+                                                ]
+                                            }],
+                                            'max_tokens': 50,
+                                            'temperature': 0
+                                        },
+                                        timeout=15
+                                    )
                             
                             if resp.status_code == 200:
                                 text = resp.json().get('choices', [{}])[0].get('message', {}).get('content', '').strip().upper()
@@ -418,7 +588,8 @@ If no codes at all, return "NONE"'''
                                         gg_labels.append(Barcode(
                                             symbology='GG_LABEL',
                                             data=match,
-                                            source='openai-emergency'
+                                            source='openai-emergency',
+                                            photo_index=idx,
                                         ))
                                         barcode_results.append(gg_labels[-1])
                                         logger.info(f"OpenAI emergency found: {match}")
@@ -429,14 +600,13 @@ If no codes at all, return "NONE"'''
                 logger.error(f"OpenAI emergency GG detection failed: {e}")
         
         # Перепроверяем наличие полной пары после OpenAI
-        gg_text_codes = [r for r in barcode_results if r.symbology == 'GG_LABEL' and r.data.startswith('GG')]
-        q_barcode_codes = [r for r in barcode_results if r.symbology == 'GG_LABEL' and r.data.startswith('Q')]
+        gg_text_codes, q_barcode_codes = gg_pair(barcode_results)
         has_gg_pair = len(gg_text_codes) > 0 and len(q_barcode_codes) > 0
         gg_labels = [r for r in barcode_results if r.symbology == 'GG_LABEL']
         
         if not gg_labels:
             # GG лейбла не найдена - создаем карточку с кнопкой "Удалить все"
-            logger.warning(f"process_photo_batch: NO GG LABEL FOUND for {corr}")
+            logger.warning("process_photo_batch: NO GG LABEL FOUND")
             
             # Создаем карточку с предупреждением и кнопкой (фото не дублируем - они уже были отправлены)
             html = "❌ <b>GG лейбла не найдена!</b>\n\n"
@@ -444,9 +614,7 @@ If no codes at all, return "NONE"'''
             html += "Чтобы не затруднять процесс, нажми кнопку <b>«Удалить всё»</b> и загрузи заново.\n\n"
             html += f"📸 У меня уже есть <b>{len(photo_items)} фото</b> товара."
             
-            m_card = await send_message_ret(context.bot, chat_id, html, parse_mode='HTML')
-            if m_card:
-                reg.append(m_card.message_id)
+            await card.finish(html)
             
             # Кнопка "Удалить всё"
             kb = InlineKeyboardMarkup([[InlineKeyboardButton("Удалить всё", callback_data=f"del:{corr}")]])
@@ -459,7 +627,7 @@ If no codes at all, return "NONE"'''
             return
         
         # GG найдена - проверяем есть ли ожидающие фото
-        logger.info(f"process_photo_batch: GG labels found: {[g.data for g in gg_labels]}")
+        logger.info("process_photo_batch: GG labels found: %s", [g.data for g in gg_labels])
         
         # Объединяем с ожидающими фото если есть
         all_photos = list(photo_items)
@@ -478,46 +646,28 @@ If no codes at all, return "NONE"'''
             # Объединяем message_ids для удаления старых сообщений
             reg.extend(old_message_ids)
             
-            # Перезапускаем распознавание на всех фото (старые + новые)
-            logger.info("Re-running barcode detection on all photos...")
-            all_barcode_results = []
-            tasks = []
-            for idx, item in enumerate(all_photos):
-                tasks.append(process_single_photo(idx, item))
-            
-            photo_results = await asyncio.gather(*tasks)
-            for pr in photo_results:
-                all_barcode_results.extend(pr['results'])
+            # Распознаем только старые фото, результаты текущих сдвигаем на их количество
+            logger.info("Running barcode detection on %d pending photos...", len(old_photos))
+            shift = len(old_photos)
+            photo_results = await asyncio.gather(*(process_single_photo(idx, item) for idx, item in enumerate(old_photos)))
+            old_results = [b for results, _, _ in photo_results for b in results]
+
+            def shifted(results: list) -> list:
+                return [replace(b, photo_index=b.photo_index + shift) if b.photo_index is not None else b for b in results]
             
             # Используем объединенные результаты
-            barcode_results = all_barcode_results
+            barcode_results = old_results + shifted(barcode_results)
+            all_results = old_results + shifted(all_results)
             photo_items = all_photos
         
         # Card (includes both regular barcodes and GG labels)
-        logger.info(f"process_photo_batch: rendering card with {len(photo_items)} total photos")
+        logger.info("process_photo_batch: rendering card with %d total photos", len(photo_items))
         
-        # Добавляем статус распознавания
-        if has_gg_pair:
-            html = "✅ <b>GG лейбла найдена (полная пара)</b>\n"
-            html += f"🏷️ GG: {', '.join([r.data for r in gg_text_codes])}\n"
-            html += f"🔢 Q: {', '.join([r.data for r in q_barcode_codes])}\n\n"
-        else:
-            html = "⚠️ <b>Неполная пара GG/Q</b>\n"
-            if gg_text_codes:
-                html += f"🏷️ GG: {', '.join([r.data for r in gg_text_codes])}\n"
-            if q_barcode_codes:
-                html += f"🔢 Q: {', '.join([r.data for r in q_barcode_codes])}\n"
-            html += "\n"
-        
-        if len(old_message_ids) > 0:
-            html += f"📦 Объединено фото: {len(photo_items)}\n\n"
-        html += renderer.render_barcodes_html(barcode_results, photo_count=len(photo_items))
-        if is_debug and all_timelines:
-            lines = [f"{t['decoder']}: {t['count']} за {t['ms']}ms" for t in all_timelines]
-            html += "\n\n<code>" + " | ".join(lines) + "</code>"
-        m_card = await send_message_ret(context.bot, chat_id, html, parse_mode='HTML')
-        if m_card:
-            reg.append(m_card.message_id)
+        html = render_card(barcode_results, len(photo_items), merged=len(old_message_ids) > 0,
+                           timelines=all_timelines if is_debug else None)
+        with stage("send_card"):
+            # Правим уже показанную карточку на месте или отправляем ее сейчас
+            await card.finish(html)
         await asyncio.sleep(0.2)  # Баланс между скоростью и стабильностью
         
         # Final PLACE4174 - can be closed manually if needed
@@ -533,17 +683,18 @@ If no codes at all, return "NONE"'''
         # Upload to Django in background
         message_ids_list = [item.message_id for item in photo_items]
         try:
-            upload_success = await upload_batch_to_django(corr, chat_id, message_ids_list, photo_items, all_results)
+            with stage("django_upload"):
+                upload_success = await upload_batch_to_django(corr, chat_id, message_ids_list, photo_items, all_results)
             if not upload_success:
                 # Django upload failed
                 await context.bot.send_message(chat_id, "❌❌❌\n\nОшибка загрузки в Django")
         except Exception as e:
-            logger.error(f"process_photo_batch: django upload error: {e}")
+            logger.error("process_photo_batch: django upload error: %s", e)
             await context.bot.send_message(chat_id, "❌❌❌\n\nОшибка загрузки в Django")
         
         logger.info("process_photo_batch: done")
     except Exception as e:
-        logger.error(f"process_photo_batch: error: {e}", exc_info=True)
+        logger.error("process_photo_batch: error: %s", e, exc_info=True)
         # Notify user about critical error
         try:
             await context.bot.send_message(chat_id, f"❌❌❌\n\nКритическая ошибка обработки:\n{str(e)[:200]}")
@@ -553,69 +704,56 @@ If no codes at all, return "NONE"'''
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
-        logger.info("handle_photo: received photo")
         if not update.message or not update.message.photo:
             logger.warning("handle_photo: no message or photo")
             return
         
         chat_id = update.effective_chat.id
-        largest = update.message.photo[-1]
-        file_id = largest.file_id
-        message_id = update.message.message_id
-        logger.info(f"handle_photo: chat={chat_id}, file_id={file_id[:20]}..., message_id={message_id}")
-        tg_file = await context.bot.get_file(file_id)
-        logger.info(f"handle_photo: got tg_file")
-        
-        # Add to buffer
-        is_first, photo_batch = photo_buffer.add(chat_id, file_id, tg_file, message_id)
-        logger.info(f"handle_photo: added to buffer, is_first={is_first}, batch_size={len(photo_batch) if photo_batch else 0}")
-        
-        if is_first:
-            # First photo AND no timer running: show "Началась обработка..." and schedule delayed processing
-            status_msg = None
-            try:
-                status_msg = await context.bot.send_message(chat_id, "🔍 Началась обработка...")
-                logger.info("handle_photo: sent status message, scheduling delayed_process")
-            except Exception as e:
-                logger.error(f"handle_photo: failed to send status message: {e}")
-                # Продолжаем без статуса
-            
-            async def delayed_process():
-                # Ждем полный timeout буфера (3.0s) + небольшой запас для сбора до 10 фото
-                wait_time = 3.2
-                logger.info(f"delayed_process: sleeping {wait_time}s for chat={chat_id}")
-                await asyncio.sleep(wait_time)
-                logger.info(f"delayed_process: flushing buffer for chat={chat_id}")
-                
-                # Debug: check buffer state
-                import shoesbot.photo_buffer as pb_mod
-                logger.info(f"delayed_process: buffer state: {list(pb_mod.buffer.buffers.keys())}")
-                if chat_id in pb_mod.buffer.buffers:
-                    logger.info(f"delayed_process: buffer[{chat_id}] size: {len(pb_mod.buffer.buffers[chat_id])}")
-                
-                flushed = photo_buffer.flush(chat_id)
-                logger.info(f"delayed_process: flushed={flushed is not None}, size={len(flushed) if flushed else 0}")
-                if flushed:
-                    logger.info("delayed_process: calling process_photo_batch")
-                    await process_photo_batch(chat_id, flushed, context, status_msg)
-                    # Delete status message after processing completes
-                    if status_msg:
-                        try:
-                            await status_msg.delete()
-                            logger.info("delayed_process: deleted status message")
-                        except Exception as e:
-                            logger.error(f"delayed_process: failed to delete status: {e}")
-                    logger.info("delayed_process: done")
-                else:
-                    pass
-            
-            # Schedule background task
-            context.application.create_task(delayed_process())
-            logger.info("handle_photo: task scheduled")
-        elif is_first:
-            pass
+        with log_context(chat_id=chat_id):
+            await _buffer_photo(update, context, chat_id)
     except Exception as e:
-        logger.error(f"handle_photo: error: {e}", exc_info=True)
+        logger.error("handle_photo: error: %s", e, exc_info=True)
+
+
+async def _buffer_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    largest = update.message.photo[-1]
+    file_id = largest.file_id
+    message_id = update.message.message_id
+    logger.debug("handle_photo: file_id=%.20s..., message_id=%s", file_id, message_id)
+    # Add to buffer before any API call: a slow get_file must not let the album close early
+    media_group_id = update.message.media_group_id
+    is_first, album = photo_buffer.add(chat_id, file_id, LazyFile(context.bot, file_id), message_id, media_group_id)
+    logger.info("handle_photo: added to buffer, group=%s, is_first=%s, album_size=%d", media_group_id, is_first, len(album.items))
+    
+    if is_first:
+        # First photo of a new album: show "Началась обработка..." and schedule delayed processing
+        status_msg = None
+        try:
+            status_msg = await context.bot.send_message(chat_id, "🔍 Началась обработка...")
+        except Exception as e:
+            logger.error("handle_photo: failed to send status message: %s", e)
+            # Продолжаем без статуса
+        
+        async def delayed_process():
+            # Ждем, пока альбом соберется: сразу по его границе, для одиночных фото — timeout буфера
+            flushed = await photo_buffer.collect(chat_id, album)
+            logger.info("delayed_process: flushed %d photos", len(flushed) if flushed else 0)
+            if flushed:
+                await album_scheduler.run(
+                    chat_id,
+                    lambda: profile_album(chat_id, context.bot, lambda: process_photo_batch(chat_id, flushed, context, status_msg)),
+                    on_position=queue_position_reporter(status_msg),
+                )
+                # Delete status message after processing completes
+                if status_msg:
+                    try:
+                        await status_msg.delete()
+                    except Exception as e:
+                        logger.error("delayed_process: failed to delete status: %s", e)
+                logger.debug("delayed_process: done")
+        
+        # Schedule background task (inherits the chat_id log context)
+        context.application.create_task(delayed_process())
 
 
 def build_app() -> Application:
@@ -631,7 +769,11 @@ def build_app() -> Application:
         pool_timeout=30.0,  # Увеличил таймаут пула
         media_write_timeout=30.0  # Для загрузки фото
     )
-    app = Application.builder().token(token).request(request).build()
+    app = (
+        Application.builder().token(token).request(request)
+        .base_url(f"{TELEGRAM_API_BASE}/bot").base_file_url(f"{TELEGRAM_API_BASE}/file/bot")
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("ping", ping))
     app.add_handler(CommandHandler("debug_on", debug_on))
@@ -640,6 +782,7 @@ def build_app() -> Application:
     app.add_handler(CommandHandler("admin_on", admin_on))
     app.add_handler(CommandHandler("stats", stats))
     app.add_handler(CommandHandler("queue", queue_stats))
+    app.add_handler(CommandHandler("profile", profile))
     app.add_handler(CommandHandler("report", report))
     app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     app.add_handler(CallbackQueryHandler(on_delete_batch, pattern=r"^del:"))
@@ -686,6 +829,7 @@ async def on_delete_batch(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     if resp.status == 200:
                         result = await resp.json()
                         logger.info(f"Django card deleted: {result}")
+                        ids = list(ids) + result.get('message_ids', [])  # Pochtoy status messages
                         deleted_info = f"Карточка удалена ({result.get('photos_deleted', 0)} фото)"
                     elif resp.status == 404:
                         logger.info(f"Django card not found (already deleted): {corr}")
@@ -714,7 +858,7 @@ async def on_delete_batch(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 async def on_retry_batch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle retry button click - reprocess batch from scratch."""
+    """Handle retry button click - rebuild the card, decoding again only photos that gave no codes."""
     try:
         query = update.callback_query
         await query.answer("🔄 Перезагружаю...")
@@ -744,6 +888,8 @@ async def on_retry_batch(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     timeout=aiohttp.ClientTimeout(total=10)
                 ) as resp:
                     if resp.status == 200:
+                        result = await resp.json()
+                        old_message_ids = list(old_message_ids) + result.get('message_ids', [])
                         logger.info(f"Deleted card and Pochtoy data for {corr}")
                     elif resp.status == 404:
                         logger.info(f"Card not found (already deleted): {corr}")
@@ -801,9 +947,19 @@ async def on_retry_batch(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 async def download_to_memory(self, out):
                     out.write(self._bytes)
             
+            # Photos that already gave codes keep them; only the empty ones are decoded again.
+            # Queue entries written before per-photo provenance put every code on photo 0.
+            from shoesbot.models import barcode_from_payload
+            found: dict = {}
+            for barcode_data in barcodes_data:
+                if 'confidence' in barcode_data:
+                    barcode = barcode_from_payload(barcode_data)
+                    found.setdefault(barcode.photo_index, []).append(barcode)
+            
             # Recreate file objects from base64
             photo_items = []
-            for photo_data in photos_data:
+            known: dict = {}
+            for photo_idx, photo_data in enumerate(photos_data):
                 file_id = photo_data.get('file_id')
                 message_id = photo_data.get('message_id')
                 image_b64 = photo_data.get('image')
@@ -819,10 +975,16 @@ async def on_retry_batch(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     message_id=message_id,
                     file_obj=MockFile(image_bytes)
                 )
+                if photo_idx in found:
+                    known[len(photo_items)] = found[photo_idx]
                 photo_items.append(item)
             
-            await context.bot.send_message(chat_id, "🔄 Перезагрузка: обрабатываю фото заново...")
-            await process_photo_batch(chat_id, photo_items, context)
+            status_msg = await context.bot.send_message(chat_id, "🔄 Перезагрузка: обрабатываю фото заново...")
+            await album_scheduler.run(
+                chat_id,
+                lambda: process_photo_batch(chat_id, photo_items, context, known=known),
+                on_position=queue_position_reporter(status_msg),
+            )
             
         except Exception as e:
             logger.error(f"on_retry_batch: error: {e}", exc_info=True)
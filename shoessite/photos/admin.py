@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.http import HttpResponseRedirect
-from .models import PhotoBatch, Photo, BarcodeResult, ProcessingTask
+from .models import PhotoBatch, Photo, BarcodeResult, ProcessingTask, PochtoyOutbox
 
 
 @admin.register(PhotoBatch)
@@ -10,6 +10,7 @@ class PhotoBatchAdmin(admin.ModelAdmin):
     list_display = ['correlation_id_link', 'product_title', 'gg_labels', 'chat_id', 'status', 'uploaded_at', 'photo_previews', 'photo_count']
     list_filter = ['status', 'uploaded_at']
     search_fields = ['correlation_id', 'chat_id', 'title', 'description']
+    search_help_text = 'ID карточки, название, баркод, GG/Q лейбл или Telegram file_id'
     readonly_fields = ['correlation_id', 'uploaded_at', 'processed_at']
     actions = ['send_to_ebay']
     fieldsets = (
@@ -44,7 +45,7 @@ class PhotoBatchAdmin(admin.ModelAdmin):
     
     def gg_labels(self, obj):
         """Показываем GG лейбы."""
-        labels = obj.get_gg_labels()
+        labels = obj.gg_labels  # денормализовано, без запросов на строку
         if labels:
             # Фильтруем только те что начинаются с GG
             gg_only = [label for label in labels if label.startswith('GG')]
@@ -58,7 +59,7 @@ class PhotoBatchAdmin(admin.ModelAdmin):
     gg_labels.short_description = 'Наша лейба'
     
     def photo_previews(self, obj):
-        """Показываем маленькие превью фото."""
+        """Показываем маленькие превью фото (120px превью, без проверки файлов на диске)."""
         import os
         photos = obj.photos.all()[:4]  # Первые 4 фото
         if not photos:
@@ -66,12 +67,12 @@ class PhotoBatchAdmin(admin.ModelAdmin):
         previews = []
         for photo in photos:
             if photo.image:
-                # Проверяем существование файла
-                if os.path.exists(photo.image.path):
+                # Файл проверяем только пока превью не готово
+                if photo.has_thumbnails() or os.path.exists(photo.image.path):
                     previews.append(
                         format_html(
-                            '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; margin: 2px; border: 1px solid #ddd; border-radius: 4px;" />',
-                            photo.image.url
+                            '<img src="{}" loading="lazy" style="width: 50px; height: 50px; object-fit: cover; margin: 2px; border: 1px solid #ddd; border-radius: 4px;" />',
+                            photo.thumbnail_url('xs')
                         )
                     )
                 else:
@@ -86,7 +87,17 @@ class PhotoBatchAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related('photos', 'photos__barcodes')
+        return qs.prefetch_related('photos')
+    
+    def get_search_results(self, request, queryset, search_term):
+        """К обычному поиску добавляем карточки, найденные по кодам (индексный поиск, lookup.py)."""
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            from .lookup import find_card_ids
+            card_ids = find_card_ids(search_term)
+            if card_ids:
+                results = results | queryset.filter(pk__in=card_ids)
+        return results, may_have_duplicates
 
     @admin.action(description='📦 Отправить в eBay')
     def send_to_ebay(self, request, queryset):
@@ -157,7 +168,7 @@ class PhotoAdmin(admin.ModelAdmin):
     
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-width: 200px; max-height: 200px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-width: 200px; max-height: 200px;" />', obj.thumbnail_url('sm'))
         return "Нет изображения"
     image_preview.short_description = 'Превью'
     
@@ -258,3 +269,21 @@ class ProcessingTaskAdmin(admin.ModelAdmin):
             return format_html('<a href="{}">Обработать</a>', url)
         return obj.get_status_display()
     task_actions.short_description = 'Действия'
+
+
+@admin.register(PochtoyOutbox)
+class PochtoyOutboxAdmin(admin.ModelAdmin):
+    list_display = ['idempotency_key', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'last_error']
+    list_filter = ['status']
+    search_fields = ['idempotency_key', 'batch__correlation_id']
+    readonly_fields = ['batch', 'idempotency_key', 'locked_at', 'result', 'message_id', 'created_at', 'sent_at']
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        """Повторить отправку сейчас (сбрасывает счётчик попыток)."""
+        from django.utils import timezone
+        from .outbox import dispatcher
+        updated = queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        dispatcher.wake()
+        self.message_user(request, f"Поставлено в очередь: {updated}")
+    retry_now.short_description = 'Отправить в Pochtoy повторно'
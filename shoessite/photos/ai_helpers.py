@@ -5,6 +5,11 @@ import os
 import requests
 import json
 from typing import Optional, Dict, List
+from shoesbot.endpoints import EBAY_FINDING_URL, OPENAI_CHAT_URL
+
+# Версия промптов auto_fill_product_card: поменяли промпт или модель - увеличьте,
+# и сохранённые AI подсказки карточек пересчитаются (см. ai_suggestions.py)
+AUTO_FILL_PROMPT_VERSION = 'vision-gpt-4o-1'
 
 
 def generate_product_description(barcode: str, photos_text: str = "") -> Optional[str]:
@@ -14,7 +19,7 @@ def generate_product_description(barcode: str, photos_text: str = "") -> Optiona
         return None
     
     try:
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
@@ -55,7 +60,7 @@ def suggest_category(barcode: str, description: str = "") -> Optional[str]:
         return None
     
     try:
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
@@ -95,7 +100,7 @@ def suggest_price(barcode: str, description: str = "", brand: str = "") -> Optio
         return None
     
     try:
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
@@ -145,7 +150,7 @@ def analyze_photos_with_vision(photo_urls: List[str]) -> Optional[Dict]:
         import base64
         import requests
         
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
@@ -264,7 +269,7 @@ def generate_from_instruction(instruction: str, photo_urls: List[str] = None, ca
         return {}
     
     try:
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
@@ -406,7 +411,7 @@ def search_product_with_openai(barcode: str) -> Optional[Dict]:
         return None
     
     try:
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
@@ -495,7 +500,7 @@ def search_products_on_ebay(brand: str = None, model: str = None, barcode: str =
         search_query = ' '.join(keywords[:10])  # Увеличиваем до 10 слов для лучшего поиска
         
         # eBay Finding API - используем findItemsAdvanced для большего контроля
-        url = 'https://svcs.ebay.com/services/search/FindingService/v1'
+        url = EBAY_FINDING_URL
         params = {
             'OPERATION-NAME': 'findItemsAdvanced',
             'SERVICE-VERSION': '1.0.0',
@@ -662,7 +667,7 @@ def generate_product_summary(photo_data_list: List[Dict] = None, photo_urls: Lis
         return None
     
     try:
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
@@ -872,7 +877,7 @@ def generate_from_instruction_text_only(instruction: str) -> Dict:
         return {}
     
     try:
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
@@ -0,0 +1,143 @@
+"""AI suggestions for the product card page, computed once per set of inputs.
+
+auto_fill_product_card is a gpt-4o vision request of up to 30 s.  Instead of
+calling it on every page view, a background thread computes it when a card
+is created or its photos/barcodes change, and stores the result on the card
+with a hash of the inputs and AUTO_FILL_PROMPT_VERSION.  The page renders
+whatever is stored; a stale or missing result is queued again, and the
+"regenerate" action forces a new request.
+
+An empty answer for a card that has photos or barcodes is a failure (OpenAI
+error, timeout, photo URL unreachable): it is not stored as current.  The
+card is marked failed for RETRY_AFTER, during which the page shows an error
+instead of re-queueing on every view; after that the next view retries.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .ai_helpers import AUTO_FILL_PROMPT_VERSION, auto_fill_product_card
+from .models import PhotoBatch
+
+MAX_PHOTOS = 3  # analyze_photos_with_vision looks at the first three only
+SUGGESTIONS_THREAD = os.getenv('AI_SUGGESTIONS_THREAD', '1') == '1'
+RETRY_AFTER = 5 * 60  # seconds before a failed card is tried again
+
+
+def enabled() -> bool:
+    return bool(os.getenv('OPENAI_API_KEY'))
+
+
+def public_url(path: str) -> str:
+    # OpenAI downloads the photos itself, so they must be reachable from outside
+    return f"{os.getenv('CLOUDFLARED_URL', 'https://pochtoy.us')}{path}"
+
+
+def gather_inputs(card: PhotoBatch) -> Dict:
+    photos = [p for p in card.photos.all() if p.image][:MAX_PHOTOS]
+    return {
+        'barcodes': [{'data': b.data, 'source': b.source} for b in card.get_all_barcodes()[:3]],
+        'brand': card.brand,
+        'photos': [p.image.name for p in photos],
+        'photo_urls': [public_url(p.image.url) for p in photos],
+    }
+
+
+def inputs_key(inputs: Dict) -> str:
+    signed = {k: v for k, v in inputs.items() if k != 'photo_urls'}  # host may change, photos did not
+    raw = json.dumps([AUTO_FILL_PROMPT_VERSION, signed], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def is_current(card: PhotoBatch) -> bool:
+    return bool(card.ai_suggestions_key) and card.ai_suggestions_key == inputs_key(gather_inputs(card))
+
+
+def _failure_key(card_id: int, key: str) -> str:
+    return f'ai-suggestions-failed:{card_id}:{key}'
+
+
+def failed(card: PhotoBatch) -> bool:
+    """The last attempt for the card's current inputs failed less than RETRY_AFTER ago."""
+    return cache.get(_failure_key(card.pk, inputs_key(gather_inputs(card)))) is not None
+
+
+def clear_failed(card: PhotoBatch) -> None:
+    cache.delete(_failure_key(card.pk, inputs_key(gather_inputs(card))))
+
+
+def compute(card_id: int, force: bool = False) -> Optional[Dict]:
+    """Run auto_fill_product_card unless the stored result matches the inputs."""
+    card = PhotoBatch.objects.filter(pk=card_id).first()
+    if card is None:
+        return None
+    inputs = gather_inputs(card)
+    key = inputs_key(inputs)
+    if not force and key == card.ai_suggestions_key:
+        return card.ai_suggestions
+    suggestions = {}
+    if inputs['photos'] or inputs['barcodes']:  # nothing to ask about otherwise
+        suggestions = auto_fill_product_card(
+            {'barcodes': inputs['barcodes'], 'brand': inputs['brand']},
+            photo_urls=inputs['photo_urls'],
+        )
+        if not suggestions:
+            # Not "current": keep what was stored and let a later view retry
+            cache.set(_failure_key(card_id, key), timezone.now().isoformat(), RETRY_AFTER)
+            print(f"AI suggestions for card {card_id}: empty answer, retry in {RETRY_AFTER}s")
+            return None
+    cache.delete(_failure_key(card_id, key))
+    PhotoBatch.objects.filter(pk=card_id).update(
+        ai_suggestions=suggestions, ai_suggestions_key=key, ai_suggestions_at=timezone.now(),
+    )
+    print(f"AI suggestions for card {card_id}: {sorted(suggestions)}")
+    return suggestions
+
+
+class SuggestionWorker:
+    """One daemon thread; a card queued twice before it is picked up runs once."""
+
+    def __init__(self):
+        self.jobs: 'queue.Queue[Tuple[int, bool]]' = queue.Queue()
+        self.pending: Set[int] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, card_id: int, force: bool = False) -> None:
+        with self._lock:
+            if card_id in self.pending and not force:
+                return
+            self.pending.add(card_id)
+            self.jobs.put((card_id, force))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='ai-suggestions', daemon=True)
+                self._thread.start()
+
+    def run(self) -> None:
+        while True:
+            card_id, force = self.jobs.get()
+            with self._lock:
+                self.pending.discard(card_id)
+            try:
+                compute(card_id, force)
+            except Exception as e:
+                print(f"AI suggestions for card {card_id} failed: {e}")
+            finally:
+                if self.jobs.empty():
+                    close_old_connections()
+
+
+worker = SuggestionWorker()
+
+
+def schedule(card_id: int, force: bool = False) -> None:
+    """Queue the card once the current transaction commits (no-op without an OpenAI key)."""
+    if card_id is not None and enabled() and SUGGESTIONS_THREAD:
+        transaction.on_commit(lambda: worker.submit(card_id, force))
@@ -0,0 +1,63 @@
+"""Run slow lookup sources concurrently under one deadline.
+
+Each source is a (name, function) pair in priority order.  Every call gets
+its own thread pool (up to MAX_WORKERS), so one wide lookup cannot queue the
+sources of concurrent ones behind it.  Results are handed back in priority
+order, waiting for each at most until the common deadline.  A source that
+already started when the deadline passes keeps running and its result still
+lands in the cache, so the next lookup of the same key gets it immediately;
+sources that have not started by then, or when the caller stops iterating,
+are cancelled.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import connections
+
+DEADLINE = float(os.getenv('BARCODE_SEARCH_DEADLINE', '12'))  # seconds for the whole lookup
+CACHE_TTL = 24 * 3600
+EMPTY_CACHE_TTL = 10 * 60  # empty answers are often transient errors: retry sooner
+MAX_WORKERS = int(os.getenv('BARCODE_SEARCH_WORKERS', '8'))  # per fan_out() call
+
+
+def _run(fn: Callable[[], Any], cache_key: Optional[str]) -> Any:
+    try:
+        result = fn()
+        if cache_key is not None:
+            cache.set(cache_key, result, CACHE_TTL if result else EMPTY_CACHE_TTL)
+        return result
+    finally:
+        connections.close_all()  # this pool thread's own DB connections
+
+
+def fan_out(sources: List[Tuple[str, Callable[[], Any]]], deadline: float = DEADLINE,
+            cache_prefix: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+    """Yield (name, result) in the given order; None for a source that failed or ran out of time."""
+    started = time.monotonic()
+    todo = [(name, fn, f'{cache_prefix}:{name}' if cache_prefix else None) for name, fn in sources]
+    pool = ThreadPoolExecutor(max_workers=max(1, min(len(todo), MAX_WORKERS)), thread_name_prefix='fanout')
+    try:
+        futures = []
+        for name, fn, cache_key in todo:
+            cached = cache.get(cache_key) if cache_key else None
+            futures.append((name, cached, None if cached is not None else pool.submit(_run, fn, cache_key)))
+
+        for name, cached, future in futures:
+            if future is None:
+                yield name, cached
+                continue
+            try:
+                yield name, future.result(timeout=max(0.0, deadline - (time.monotonic() - started)))
+            except TimeoutError:
+                future.cancel()  # only succeeds if it never started
+                print(f"fan_out: {name} missed the {deadline:.0f}s deadline")
+                yield name, None
+            except Exception as e:
+                print(f"fan_out: {name} failed: {e}")
+                yield name, None
+    finally:
+        # Caller is done (or gave up early): drop what has not started, leave running ones to finish
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -4,6 +4,7 @@ import sys
 import requests
 import time
 from typing import Optional
+from shoesbot.endpoints import FASHN_API_URL
 
 # Загружаем .env
 try:
@@ -23,7 +24,6 @@ except Exception as e:
     print(f"⚠️ Error loading .env: {e}", file=sys.stderr)
 
 FASHN_API_KEY = os.getenv('FASHN_API_KEY')
-FASHN_API_URL = 'https://api.fashn.ai/v1'
 
 # Проверка API ключа при импорте модуля
 if FASHN_API_KEY:
@@ -0,0 +1,149 @@
+"""Bulk ingest of photo batches uploaded by the Telegram bot.
+
+Image files are written to storage first, outside any transaction.  Then the
+batch, its photos and their barcodes are inserted in one transaction with
+bulk_create, so SQLite holds its write lock for a handful of statements per
+album instead of two writes per photo plus one get_or_create per barcode.
+"""
+import base64
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BarcodeResult, Photo, PhotoBatch, schedule_ai_suggestions, split_codes
+from .thumbnails import schedule as schedule_thumbnails
+
+
+@dataclass
+class PhotoReport:
+    index: int
+    file_id: str
+    photo_id: Optional[int] = None
+    barcodes: int = 0
+    error: str = ''
+
+    def as_dict(self) -> Dict:
+        return {
+            'index': self.index,
+            'file_id': self.file_id,
+            'photo_id': self.photo_id,
+            'barcodes': self.barcodes,
+            'error': self.error,
+        }
+
+
+@dataclass
+class IngestReport:
+    batch: PhotoBatch
+    created: bool
+    photos: List[PhotoReport] = field(default_factory=list)
+
+    @property
+    def photos_saved(self) -> int:
+        return sum(1 for p in self.photos if p.photo_id is not None)
+
+    @property
+    def barcodes_saved(self) -> int:
+        return sum(p.barcodes for p in self.photos)
+
+
+def _decode_image(image_data: str) -> bytes:
+    # Accepts plain base64 and data URLs
+    return base64.b64decode(image_data.split(',')[-1] if ',' in image_data else image_data)
+
+
+def _write_files(correlation_id: str, photos_data: List[Dict], reports: Dict[int, PhotoReport]) -> Dict[int, str]:
+    """Store every image; returns photo index -> storage name."""
+    image_field = Photo._meta.get_field('image')
+    names: Dict[int, str] = {}
+    for idx, photo_data in enumerate(photos_data):
+        report = reports.get(idx)
+        if report is None:
+            continue
+        try:
+            content = ContentFile(_decode_image(photo_data['image']))
+            name = image_field.generate_filename(None, f'{correlation_id}_{idx}.jpg')
+            names[idx] = image_field.storage.save(name, content, max_length=image_field.max_length)
+        except Exception as e:
+            report.error = str(e)
+    return names
+
+
+def ingest_batch(correlation_id: str, chat_id: int, message_ids: List, photos_data: List[Dict],
+                 barcodes: List[Dict]) -> IngestReport:
+    """Save an uploaded batch: files first, then one transaction for all rows."""
+    reports: Dict[int, PhotoReport] = {}
+    for idx, photo_data in enumerate(photos_data):
+        if photo_data.get('file_id') and photo_data.get('image'):
+            reports[idx] = PhotoReport(index=idx, file_id=photo_data['file_id'])
+    names = _write_files(correlation_id, photos_data, reports)
+    status = 'processed' if barcodes else 'pending'
+
+    try:
+        with transaction.atomic():
+            batch, created = PhotoBatch.objects.get_or_create(
+                correlation_id=correlation_id,
+                defaults={'chat_id': chat_id, 'message_ids': message_ids, 'status': status},
+            )
+            if not created:
+                batch.message_ids = message_ids
+                batch.status = status
+                batch.processed_at = timezone.now()
+                batch.save(update_fields=['message_ids', 'status', 'processed_at'])
+
+            photos = Photo.objects.bulk_create([
+                Photo(
+                    batch=batch,
+                    file_id=photos_data[idx]['file_id'],
+                    message_id=photos_data[idx].get('message_id'),
+                    image=name,
+                    order=idx,
+                )
+                for idx, name in names.items()
+            ])
+            if any(photo.pk is None for photo in photos):  # backends without RETURNING on bulk insert
+                saved = {p.image.name: p for p in Photo.objects.filter(batch=batch, image__in=list(names.values()))}
+                photos = [saved[name] for name in names.values()]
+            by_index = dict(zip(names, photos))
+
+            # Unique (photo, symbology, data): first occurrence wins, as get_or_create did
+            rows: Dict[tuple, BarcodeResult] = {}
+            for barcode_data in barcodes:
+                photo = by_index.get(barcode_data.get('photo_index') or 0)
+                if photo is None:
+                    continue
+                key = (photo.order, barcode_data.get('symbology', ''), barcode_data.get('data', ''))
+                if key in rows:
+                    continue
+                rows[key] = BarcodeResult(
+                    photo=photo,
+                    symbology=key[1],
+                    data=key[2],
+                    source=barcode_data.get('source', 'unknown'),
+                    bbox=barcode_data.get('bbox'),
+                    confidence=barcode_data.get('confidence'),
+                )
+            BarcodeResult.objects.bulk_create(rows.values(), ignore_conflicts=True)
+            # bulk_create skips BarcodeResult.save(): update the batch's codes here
+            if created:  # all its barcodes are in `rows`, no need to read them back
+                batch.gg_labels, batch.trackings = split_codes(sorted(rows.values(), key=lambda b: b.photo.order))
+                batch.save(update_fields=['gg_labels', 'trackings'])
+            else:
+                batch.refresh_codes()
+            schedule_ai_suggestions(batch.pk)
+            schedule_thumbnails(Photo, [photo.pk for photo in photos])  # bulk_create skips Photo.save()
+    except Exception:
+        # Nothing references the files any more
+        storage = Photo._meta.get_field('image').storage
+        for name in names.values():
+            storage.delete(name)
+        raise
+
+    for idx, photo in by_index.items():
+        reports[idx].photo_id = photo.pk
+    for order, _, _ in rows:
+        reports[order].barcodes += 1
+    return IngestReport(batch=batch, created=created, photos=[reports[idx] for idx in sorted(reports)])
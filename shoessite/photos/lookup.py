@@ -0,0 +1,86 @@
+"""Find cards by anything written on them: barcode, GG label, Q code, Telegram file id.
+
+Each lookup is an exact match on an indexed column (BarcodeResult.data,
+Photo.file_id, PhotoBatch.correlation_id, PhotoBuffer gg_label/barcode/
+file_id), so it stays a B-tree search as the catalog grows.  code_variants()
+lists the spellings one code may be stored under: case, spaces/dashes and
+UPC-A vs EAN-13 (the same product read by different decoders).
+"""
+import re
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from django.db.models import Q
+from django.urls import reverse
+
+from .models import BarcodeResult, Photo, PhotoBatch, PhotoBuffer
+
+
+@dataclass
+class Match:
+    field: str  # barcode | file_id | correlation_id
+    value: str
+    photo_id: Optional[int] = None
+    symbology: str = ''
+    source: str = ''
+
+
+def code_variants(query: str) -> List[str]:
+    query = query.strip()
+    compact = re.sub(r'[\s-]', '', query).upper()
+    variants = {query, query.upper(), compact}
+    if compact.isdigit():
+        if len(compact) == 12:
+            variants.add('0' + compact)  # UPC-A stored as EAN-13
+        elif len(compact) == 13 and compact.startswith('0'):
+            variants.add(compact[1:])
+    return sorted(v for v in variants if v)
+
+
+def find_matches(query: str, limit: int = 50) -> Dict[int, List[Match]]:
+    """batch id -> what matched; at most `limit` cards."""
+    variants = code_variants(query)
+    if not variants:
+        return {}
+    matches: Dict[int, List[Match]] = defaultdict(list)
+
+    for row in (BarcodeResult.objects.filter(data__in=variants)
+                .values('photo__batch_id', 'photo_id', 'data', 'symbology', 'source')[:limit * 5]):
+        matches[row['photo__batch_id']].append(
+            Match('barcode', row['data'], row['photo_id'], row['symbology'], row['source']))
+    for row in Photo.objects.filter(file_id=query.strip()).values('batch_id', 'id', 'file_id')[:limit]:
+        matches[row['batch_id']].append(Match('file_id', row['file_id'], row['id']))
+    for row in PhotoBatch.objects.filter(correlation_id__in=variants + [query.strip().lower()]).values('id', 'correlation_id'):
+        matches[row['id']].append(Match('correlation_id', row['correlation_id']))
+
+    return dict(list(matches.items())[:limit])
+
+
+def find_card_ids(query: str, limit: int = 50) -> List[int]:
+    return list(find_matches(query, limit))
+
+
+def lookup(query: str, limit: int = 50) -> Dict:
+    """Cards and unsorted buffer photos matching the query, for the lookup API."""
+    matches = find_matches(query, limit)
+    batches = PhotoBatch.objects.filter(pk__in=list(matches)).only(
+        'id', 'correlation_id', 'chat_id', 'title', 'status', 'uploaded_at', 'gg_labels', 'trackings')
+    cards = [{
+        'id': batch.id,
+        'correlation_id': batch.correlation_id,
+        'chat_id': batch.chat_id,
+        'title': batch.title,
+        'status': batch.status,
+        'uploaded_at': batch.uploaded_at.isoformat(),
+        'gg_labels': batch.gg_labels,
+        'trackings': batch.trackings,
+        'url': reverse('product_card_detail', args=[batch.id]),
+        'matches': [asdict(m) for m in matches[batch.id]],
+    } for batch in batches]
+
+    variants = code_variants(query)
+    buffer = list(PhotoBuffer.objects.filter(
+        Q(gg_label__in=variants) | Q(barcode__in=variants) | Q(file_id=query.strip())
+    ).values('id', 'file_id', 'message_id', 'chat_id', 'gg_label', 'barcode', 'group_id', 'processed')[:limit])
+    return {'query': query, 'cards': cards, 'buffer': buffer}
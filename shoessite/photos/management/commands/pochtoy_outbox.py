@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from photos.outbox import dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Доставить карточки из очереди Pochtoy (outbox) - однократно или в цикле'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Отправить всё, что готово, и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            done = dispatcher.run_once()
+            if done:
+                self.stdout.write(f'Pochtoy outbox: обработано {done}')
+            if options['once']:
+                return
+            time.sleep(dispatcher.idle_timeout())
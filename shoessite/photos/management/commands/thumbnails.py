@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from photos.models import Photo, PhotoBuffer
+from photos.thumbnails import refresh
+
+
+class Command(BaseCommand):
+    help = 'Создать превью для фото, у которых их ещё нет (или они устарели)'
+
+    def handle(self, *args, **options):
+        for model in (Photo, PhotoBuffer):
+            done = failed = 0
+            for photo in model.objects.exclude(image='').only('id', 'image', 'thumbnails').iterator():
+                if photo.has_thumbnails():
+                    continue
+                try:
+                    refresh(model, photo.pk)
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{model.__name__} {photo.pk}: {e}')
+            self.stdout.write(f'{model.__name__}: создано превью для {done}, ошибок {failed}')
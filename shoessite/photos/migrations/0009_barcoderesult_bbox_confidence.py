@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0008_photobatch_locations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="barcoderesult",
+            name="bbox",
+            field=models.JSONField(blank=True, null=True, verbose_name="Положение"),
+        ),
+        migrations.AddField(
+            model_name="barcoderesult",
+            name="confidence",
+            field=models.FloatField(blank=True, null=True, verbose_name="Уверенность"),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0009_barcoderesult_bbox_confidence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PochtoyOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "idempotency_key",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="Ключ идемпотентности"
+                    ),
+                ),
+                (
+                    "chat_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Chat ID"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает"),
+                            ("sending", "Отправляется"),
+                            ("sent", "Отправлено"),
+                            ("failed", "Ошибка"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0, verbose_name="Попыток")),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        verbose_name="Следующая попытка",
+                    ),
+                ),
+                (
+                    "locked_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Взято в работу"
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, verbose_name="Последняя ошибка"),
+                ),
+                (
+                    "result",
+                    models.JSONField(
+                        blank=True, null=True, verbose_name="Ответ Pochtoy"
+                    ),
+                ),
+                (
+                    "message_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Сообщение о статусе"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Создано"
+                    ),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Отправлено"
+                    ),
+                ),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pochtoy_outbox",
+                        to="photos.photobatch",
+                        verbose_name="Карточка товара",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Отправка в Pochtoy",
+                "verbose_name_plural": "Отправки в Pochtoy",
+                "ordering": ["next_attempt_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0010_pochtoyoutbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photo",
+            name="thumbnails",
+            field=models.JSONField(blank=True, default=dict, verbose_name="Превью"),
+        ),
+        migrations.AddField(
+            model_name="photobuffer",
+            name="thumbnails",
+            field=models.JSONField(blank=True, default=dict, verbose_name="Превью"),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:46
+
+from itertools import groupby
+
+from django.db import migrations, models
+
+# Copied from photos.models as of this migration, so later changes there
+# do not alter what the migration computes.
+BARCODES_IN_PHOTO_ORDER = [
+    "-photo__is_main",
+    "photo__order",
+    "photo__uploaded_at",
+    "photo_id",
+    "pk",
+]
+
+
+def is_gg_code(source, symbology, data):
+    return (source or "").startswith("gg-label") or (
+        symbology == "CODE39" and (data or "").startswith("Q")
+    )
+
+
+def split_codes(barcodes):
+    gg_labels, others = [], []
+    for _, photo_barcodes in groupby(barcodes, key=lambda b: b.photo_id):
+        photo_barcodes = list(photo_barcodes)
+        stickers = [
+            b.data for b in photo_barcodes if (b.source or "").startswith("gg-label")
+        ]
+        q_codes = [
+            b.data for b in photo_barcodes if is_gg_code("", b.symbology, b.data)
+        ]
+        gg_labels.extend(stickers + q_codes)
+        others.extend(
+            b.data
+            for b in photo_barcodes
+            if not is_gg_code(b.source, b.symbology, b.data)
+        )
+    gg_labels = list(dict.fromkeys(gg_labels))
+    return gg_labels, list(dict.fromkeys(gg_labels + others))
+
+
+def fill_codes(apps, schema_editor):
+    PhotoBatch = apps.get_model("photos", "PhotoBatch")
+    BarcodeResult = apps.get_model("photos", "BarcodeResult")
+    for batch_id in list(PhotoBatch.objects.values_list("pk", flat=True)):
+        gg_labels, trackings = split_codes(
+            BarcodeResult.objects.filter(photo__batch_id=batch_id).order_by(
+                *BARCODES_IN_PHOTO_ORDER
+            )
+        )
+        PhotoBatch.objects.filter(pk=batch_id).update(
+            gg_labels=gg_labels, trackings=trackings
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0011_thumbnails"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photobatch",
+            name="gg_labels",
+            field=models.JSONField(blank=True, default=list, verbose_name="GG лейблы"),
+        ),
+        migrations.AddField(
+            model_name="photobatch",
+            name="trackings",
+            field=models.JSONField(blank=True, default=list, verbose_name="Трекинги"),
+        ),
+        migrations.RunPython(fill_codes, migrations.RunPython.noop),
+    ]
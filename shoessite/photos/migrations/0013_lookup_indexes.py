@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0012_photobatch_codes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="barcoderesult",
+            name="data",
+            field=models.CharField(db_index=True, max_length=500, verbose_name="Код"),
+        ),
+        migrations.AlterField(
+            model_name="photo",
+            name="file_id",
+            field=models.CharField(
+                db_index=True, max_length=255, verbose_name="File ID"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="photo",
+            name="message_id",
+            field=models.BigIntegerField(db_index=True, verbose_name="Message ID"),
+        ),
+        migrations.AlterField(
+            model_name="photobuffer",
+            name="barcode",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=200, verbose_name="Баркод"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="photobuffer",
+            name="gg_label",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=50, verbose_name="GG лейбл"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="photobuffer",
+            name="message_id",
+            field=models.BigIntegerField(db_index=True, verbose_name="Message ID"),
+        ),
+    ]
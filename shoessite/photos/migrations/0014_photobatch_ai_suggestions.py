@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0013_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photobatch",
+            name="ai_suggestions",
+            field=models.JSONField(
+                blank=True, default=dict, verbose_name="AI подсказки"
+            ),
+        ),
+        migrations.AddField(
+            model_name="photobatch",
+            name="ai_suggestions_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="AI подсказки от"
+            ),
+        ),
+        migrations.AddField(
+            model_name="photobatch",
+            name="ai_suggestions_key",
+            field=models.CharField(
+                blank=True, max_length=64, verbose_name="Ключ AI подсказок"
+            ),
+        ),
+    ]
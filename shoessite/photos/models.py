@@ -1,8 +1,35 @@
 from django.db import models
 from django.utils import timezone
+from itertools import groupby
 import json
 
 
+class ThumbnailsMixin:
+    """Helpers for models with an `image` and its `thumbnails` (see photos/thumbnails.py)."""
+
+    def has_thumbnails(self) -> bool:
+        return bool(self.image) and (self.thumbnails or {}).get('src') == self.image.name
+
+    def thumbnail_url(self, size: str = 'sm') -> str:
+        """URL of the derivative, or of the original while it is not generated yet."""
+        if not self.image:
+            return ''
+        if self.has_thumbnails() and self.thumbnails.get(size):
+            return self.image.storage.url(self.thumbnails[size])
+        return self.image.url
+
+    @property
+    def thumbnail_urls(self) -> dict:
+        """For templates: {{ photo.thumbnail_urls.sm }}."""
+        from .thumbnails import SIZES
+        return {size: self.thumbnail_url(size) for size in SIZES}
+
+    def schedule_thumbnails(self) -> None:
+        if self.image and not self.has_thumbnails():
+            from .thumbnails import schedule
+            schedule(type(self), [self.pk])
+
+
 class PhotoBatch(models.Model):
     """Карточка товара - батч фото загруженных из Telegram бота."""
     correlation_id = models.CharField(max_length=32, unique=True, db_index=True, verbose_name='ID карточки')
@@ -42,10 +69,18 @@ class PhotoBatch(models.Model):
     sku = models.CharField(max_length=200, blank=True, verbose_name='SKU/Артикул')
     quantity = models.IntegerField(default=1, verbose_name='Количество')
     ai_summary = models.TextField(blank=True, verbose_name='AI Сводка')
+    # Подсказки auto_fill_product_card, считаются в фоне (ai_suggestions.py); ключ - хэш входных данных и версии промпта
+    ai_suggestions = models.JSONField(default=dict, blank=True, verbose_name='AI подсказки')
+    ai_suggestions_key = models.CharField(max_length=64, blank=True, verbose_name='Ключ AI подсказок')
+    ai_suggestions_at = models.DateTimeField(null=True, blank=True, verbose_name='AI подсказки от')
 
     # Inventory locations - JSON array: [{"name": "Shelf A", "qty": 2}, {"name": "Box 3", "qty": 1}]
     locations = models.JSONField(default=list, blank=True, verbose_name='Locations')
     
+    # Денормализованные коды из BarcodeResult (обновляются при записи баркодов, см. refresh_batch_codes)
+    gg_labels = models.JSONField(default=list, blank=True, verbose_name='GG лейблы')
+    trackings = models.JSONField(default=list, blank=True, verbose_name='Трекинги')
+    
     class Meta:
         ordering = ['-uploaded_at']
         verbose_name = 'Карточка товара'
@@ -54,37 +89,81 @@ class PhotoBatch(models.Model):
     def __str__(self):
         return f"Карточка {self.correlation_id} ({self.get_status_display()})"
     
+    def _barcodes(self, fresh=False):
+        """Баркоды всех фото по порядку фото; из prefetch_related('photos__barcodes') если он был."""
+        cache = getattr(self, '_prefetched_objects_cache', {})
+        if not fresh and 'photos' in cache:
+            photos = cache['photos']
+            if all('barcodes' in getattr(p, '_prefetched_objects_cache', {}) for p in photos):
+                return [b for p in photos for b in sorted(p.barcodes.all(), key=lambda b: b.pk)]
+        return list(BarcodeResult.objects.filter(photo__batch=self).order_by(*BARCODES_IN_PHOTO_ORDER))
+    
     def get_gg_labels(self):
         """Получить все GG лейбы из всех фото этого батча."""
-        gg_labels = []
-        for photo in self.photos.all():
-            for barcode in photo.barcodes.filter(source='gg-label'):
-                if barcode.data not in gg_labels:
-                    gg_labels.append(barcode.data)
-            # Также проверяем Q-коды как GG
-            for barcode in photo.barcodes.filter(symbology='CODE39', data__startswith='Q'):
-                if barcode.data not in gg_labels:
-                    gg_labels.append(barcode.data)
-        return gg_labels
+        if 'photos' in getattr(self, '_prefetched_objects_cache', {}):
+            return split_codes(self._barcodes())[0]
+        return list(self.gg_labels)
     
     def get_all_barcodes(self):
         """Получить все баркоды (кроме GG) из всех фото."""
-        barcodes = []
-        for photo in self.photos.all():
-            for barcode in photo.barcodes.exclude(source='gg-label').exclude(symbology='CODE39', data__startswith='Q'):
-                barcodes.append(barcode)
-        return barcodes
+        return [b for b in self._barcodes() if not is_gg_code(b.source, b.symbology, b.data)]
+    
+    def refresh_codes(self):
+        """Пересчитать gg_labels/trackings после изменения баркодов."""
+        self.gg_labels, self.trackings = refresh_batch_codes(self.pk)
+
+
+# Порядок фото (Photo.Meta.ordering), внутри фото - порядок записи
+BARCODES_IN_PHOTO_ORDER = ['-photo__is_main', 'photo__order', 'photo__uploaded_at', 'photo_id', 'pk']
+
+
+def is_gg_code(source, symbology, data):
+    """Наша лейба: GG-стикер или Q-код (CODE39)."""
+    return (source or '').startswith('gg-label') or (symbology == 'CODE39' and (data or '').startswith('Q'))
+
+
+def split_codes(barcodes):
+    """(gg_labels, trackings) из баркодов в порядке фото.
+
+    Внутри фото сначала GG-стикеры, потом Q-коды; trackings - GG лейбы и
+    затем остальные коды, без повторов (так их ждёт Pochtoy).
+    """
+    gg_labels, others = [], []
+    for _, photo_barcodes in groupby(barcodes, key=lambda b: b.photo_id):
+        photo_barcodes = list(photo_barcodes)
+        stickers = [b.data for b in photo_barcodes if (b.source or '').startswith('gg-label')]
+        q_codes = [b.data for b in photo_barcodes if is_gg_code('', b.symbology, b.data)]
+        gg_labels.extend(stickers + q_codes)
+        others.extend(b.data for b in photo_barcodes if not is_gg_code(b.source, b.symbology, b.data))
+    gg_labels = list(dict.fromkeys(gg_labels))
+    return gg_labels, list(dict.fromkeys(gg_labels + others))
+
+
+def refresh_batch_codes(batch_id):
+    """Пересчитать денормализованные коды карточки (два запроса)."""
+    gg_labels, trackings = split_codes(
+        BarcodeResult.objects.filter(photo__batch_id=batch_id).order_by(*BARCODES_IN_PHOTO_ORDER)
+    )
+    PhotoBatch.objects.filter(pk=batch_id).update(gg_labels=gg_labels, trackings=trackings)
+    schedule_ai_suggestions(batch_id)  # баркоды - часть входных данных AI подсказок
+    return gg_labels, trackings
 
 
-class Photo(models.Model):
+def schedule_ai_suggestions(batch_id):
+    from .ai_suggestions import schedule
+    schedule(batch_id)
+
+
+class Photo(ThumbnailsMixin, models.Model):
     """Фото из карточки товара."""
     batch = models.ForeignKey(PhotoBatch, related_name='photos', on_delete=models.CASCADE, verbose_name='Карточка товара')
-    file_id = models.CharField(max_length=255, verbose_name='File ID')  # Telegram file_id
-    message_id = models.BigIntegerField(verbose_name='Message ID')
+    file_id = models.CharField(max_length=255, db_index=True, verbose_name='File ID')  # Telegram file_id
+    message_id = models.BigIntegerField(db_index=True, verbose_name='Message ID')
     image = models.ImageField(upload_to='photos/%Y/%m/%d/', verbose_name='Изображение')
     uploaded_at = models.DateTimeField(default=timezone.now, verbose_name='Загружено')
     is_main = models.BooleanField(default=False, verbose_name='Главное фото')
     order = models.IntegerField(default=0, verbose_name='Порядок')
+    thumbnails = models.JSONField(default=dict, blank=True, verbose_name='Превью')  # {'src': image.name, size: storage name}
     
     class Meta:
         ordering = ['-is_main', 'order', 'uploaded_at']
@@ -95,18 +174,38 @@ class Photo(models.Model):
         return f"Фото {self.id} (карточка {self.batch.correlation_id})"
     
     def save(self, *args, **kwargs):
+        # Порядок фото до сохранения: от него зависит порядок gg_labels/trackings карточки
+        before = Photo.objects.filter(pk=self.pk).values('batch_id', 'is_main', 'order', 'uploaded_at').first() \
+            if self.pk else None
         # Если это главное фото, убираем главный статус у остальных
         if self.is_main:
             Photo.objects.filter(batch=self.batch, is_main=True).exclude(id=self.id).update(is_main=False)
         super().save(*args, **kwargs)
+        self.schedule_thumbnails()
+        after = {'batch_id': self.batch_id, 'is_main': self.is_main, 'order': self.order, 'uploaded_at': self.uploaded_at}
+        if before is not None and before != after:
+            # Фото переставили или перенесли: пересчитать коды обеих карточек (и AI подсказки)
+            for batch_id in {before['batch_id'], self.batch_id}:
+                refresh_batch_codes(batch_id)
+        else:
+            schedule_ai_suggestions(self.batch_id)  # набор фото изменился
+    
+    def delete(self, *args, **kwargs):
+        batch_id = self.batch_id
+        result = super().delete(*args, **kwargs)
+        refresh_batch_codes(batch_id)  # баркоды фото удалились каскадом
+        return result
 
 
 class BarcodeResult(models.Model):
     """Баркод найденный на фото."""
     photo = models.ForeignKey(Photo, related_name='barcodes', on_delete=models.CASCADE, verbose_name='Фото')
     symbology = models.CharField(max_length=50, verbose_name='Тип')
-    data = models.CharField(max_length=500, verbose_name='Код')
+    data = models.CharField(max_length=500, db_index=True, verbose_name='Код')  # поиск карточки по коду, см. lookup.py
     source = models.CharField(max_length=50, verbose_name='Источник')  # zbar, opencv-qr, vision-ocr, gg-label
+    # Where on the photo the code was read: [x, y, w, h] as fractions of the image size
+    bbox = models.JSONField(null=True, blank=True, verbose_name='Положение')
+    confidence = models.FloatField(null=True, blank=True, verbose_name='Уверенность')
     
     class Meta:
         unique_together = [['photo', 'symbology', 'data']]
@@ -115,6 +214,16 @@ class BarcodeResult(models.Model):
     
     def __str__(self):
         return f"{self.symbology}: {self.data} ({self.source})"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        refresh_batch_codes(self.photo.batch_id)
+    
+    def delete(self, *args, **kwargs):
+        batch_id = self.photo.batch_id
+        result = super().delete(*args, **kwargs)
+        refresh_batch_codes(batch_id)
+        return result
 
 
 class ProcessingTask(models.Model):
@@ -147,17 +256,18 @@ class ProcessingTask(models.Model):
         return f"{self.api_name} для фото {self.photo.id} ({self.get_status_display()})"
 
 
-class PhotoBuffer(models.Model):
+class PhotoBuffer(ThumbnailsMixin, models.Model):
     """Буфер для несортированных фото из Telegram."""
     file_id = models.CharField(max_length=255, unique=True, verbose_name='Telegram File ID')
-    message_id = models.BigIntegerField(verbose_name='Message ID')
+    message_id = models.BigIntegerField(db_index=True, verbose_name='Message ID')
     chat_id = models.BigIntegerField(verbose_name='Chat ID')
     image = models.ImageField(upload_to='buffer/%Y/%m/%d/', verbose_name='Изображение')
     uploaded_at = models.DateTimeField(default=timezone.now, verbose_name='Загружено')
+    thumbnails = models.JSONField(default=dict, blank=True, verbose_name='Превью')
     
     # Распознанные данные
-    gg_label = models.CharField(max_length=50, blank=True, verbose_name='GG лейбл')
-    barcode = models.CharField(max_length=200, blank=True, verbose_name='Баркод')
+    gg_label = models.CharField(max_length=50, blank=True, db_index=True, verbose_name='GG лейбл')
+    barcode = models.CharField(max_length=200, blank=True, db_index=True, verbose_name='Баркод')
     
     # Группировка
     group_id = models.IntegerField(null=True, blank=True, verbose_name='Группа')
@@ -174,3 +284,38 @@ class PhotoBuffer(models.Model):
     
     def __str__(self):
         return f"Буфер фото {self.id} (группа {self.group_id or 'не назначена'})"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.schedule_thumbnails()
+
+
+class PochtoyOutbox(models.Model):
+    """Отправка карточки в Pochtoy: запись создаётся вместе с карточкой, доставляет фоновый диспетчер."""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    batch = models.ForeignKey(PhotoBatch, related_name='pochtoy_outbox', on_delete=models.CASCADE, verbose_name='Карточка товара')
+    idempotency_key = models.CharField(max_length=64, unique=True, verbose_name='Ключ идемпотентности')
+    chat_id = models.BigIntegerField(null=True, blank=True, verbose_name='Chat ID')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True, verbose_name='Статус')
+    attempts = models.IntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Следующая попытка')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взято в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    result = models.JSONField(null=True, blank=True, verbose_name='Ответ Pochtoy')
+    message_id = models.BigIntegerField(null=True, blank=True, verbose_name='Сообщение о статусе')  # Telegram message for deletion
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Создано')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        verbose_name = 'Отправка в Pochtoy'
+        verbose_name_plural = 'Отправки в Pochtoy'
+
+    def __str__(self):
+        return f"Pochtoy {self.idempotency_key} ({self.get_status_display()}, попыток: {self.attempts})"
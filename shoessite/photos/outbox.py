@@ -0,0 +1,187 @@
+"""Durable outbox for sending cards to Pochtoy.
+
+upload_batch only stores a PochtoyOutbox row next to the card and returns.
+A background dispatcher delivers the rows: network errors, 429 and 5xx are
+retried with exponential backoff, and the final outcome is posted to the
+card's chat.  Every row carries an idempotency key (sent as the
+Idempotency-Key header), so a retry after a lost response, or a re-upload of
+the same album, does not create the product in Pochtoy twice.
+
+The dispatcher is a daemon thread started on the first enqueue; rows left
+over from a previous process are picked up on that first wake, or by
+`python manage.py pochtoy_outbox`.
+"""
+import os
+import threading
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+import requests
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from shoesbot.endpoints import telegram_method_url
+
+from .models import PhotoBatch, PochtoyOutbox
+
+MAX_ATTEMPTS = int(os.getenv('POCHTOY_OUTBOX_MAX_ATTEMPTS', '6'))
+RETRY_BASE = float(os.getenv('POCHTOY_OUTBOX_RETRY_BASE', '10'))  # seconds, doubled per attempt
+RETRY_MAX = 600.0
+LEASE = timedelta(minutes=5)  # a 'sending' row older than this was abandoned by a dead worker
+POLL_INTERVAL = 30.0  # seconds between scans when nobody wakes the dispatcher
+DISPATCHER_THREAD = os.getenv('POCHTOY_OUTBOX_THREAD', '1') == '1'
+
+
+def idempotency_key(batch: PhotoBatch) -> str:
+    return f'card-{batch.correlation_id}'
+
+
+def enqueue_card(batch: PhotoBatch) -> PochtoyOutbox:
+    """Queue the card for Pochtoy; safe to call again for the same card."""
+    entry, created = PochtoyOutbox.objects.get_or_create(
+        idempotency_key=idempotency_key(batch),
+        defaults={'batch': batch, 'chat_id': batch.chat_id},
+    )
+    if not created and entry.status == 'failed':
+        # Re-upload of a card that gave up earlier: start over
+        entry.status = 'pending'
+        entry.attempts = 0
+        entry.next_attempt_at = timezone.now()
+        entry.last_error = ''
+        entry.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error'])
+    if DISPATCHER_THREAD:
+        transaction.on_commit(dispatcher.wake)
+    return entry
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_MAX, RETRY_BASE * 2 ** max(0, attempts - 1)))
+
+
+def status_text(entry: PochtoyOutbox) -> str:
+    """Text of the chat message, same wording as the old synchronous send."""
+    if entry.status == 'sent':
+        message = (entry.result or {}).get('message', 'Товар успешно добавлен')
+        return f"📡 Pochtoy:\n✅ {message}"
+    return f"📡 Pochtoy:\n❌❌❌\n\nОшибка Pochtoy:\n{entry.last_error or 'Неизвестная ошибка'}"
+
+
+def notify_chat(entry: PochtoyOutbox) -> Optional[int]:
+    """Post the outcome to the card's chat; returns the Telegram message id."""
+    bot_token = os.getenv('BOT_TOKEN')
+    if not bot_token or not entry.chat_id:
+        return None
+    try:
+        response = requests.post(telegram_method_url(bot_token, 'sendMessage'), json={
+            'chat_id': entry.chat_id,
+            'text': status_text(entry),
+        }, timeout=10)
+        data = response.json() if response.status_code == 200 else {}
+        if data.get('ok') and data.get('result'):
+            return data['result'].get('message_id')
+    except Exception as e:
+        print(f"Pochtoy outbox: chat notification failed for {entry.idempotency_key}: {e}")
+    return None
+
+
+class Dispatcher:
+    """Claims due outbox rows and delivers them one by one."""
+
+    def __init__(self, send: Optional[Callable[..., Optional[Dict]]] = None,
+                 notify: Callable[[PochtoyOutbox], Optional[int]] = notify_chat):
+        self.send = send
+        self.notify = notify
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def wake(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='pochtoy-outbox', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def run_forever(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Pochtoy outbox: dispatcher error: {e}")
+            finally:
+                close_old_connections()
+            self._wake.wait(self.idle_timeout())
+
+    def run_once(self) -> int:
+        """Deliver every row that is due now; returns how many were attempted."""
+        done = 0
+        while True:
+            entry = self.claim()
+            if entry is None:
+                return done
+            self.deliver(entry)
+            done += 1
+
+    def claim(self) -> Optional[PochtoyOutbox]:
+        now = timezone.now()
+        due = Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', locked_at__lt=now - LEASE)
+        while True:
+            entry = PochtoyOutbox.objects.filter(due).order_by('next_attempt_at').first()
+            if entry is None:
+                return None
+            # Conditional update: only one worker wins the row
+            won = PochtoyOutbox.objects.filter(pk=entry.pk, status=entry.status, locked_at=entry.locked_at).update(
+                status='sending', locked_at=now, attempts=F('attempts') + 1,
+            )
+            if won:
+                entry.refresh_from_db()
+                return entry
+
+    def deliver(self, entry: PochtoyOutbox) -> PochtoyOutbox:
+        send = self.send
+        if send is None:
+            from .pochtoy_integration import send_card_to_pochtoy as send
+        try:
+            result = send(entry.batch, idempotency_key=entry.idempotency_key) or {}
+        except PhotoBatch.DoesNotExist:
+            return entry  # card deleted meanwhile, the row went with it
+        except Exception as e:
+            result = {'success': False, 'error': str(e), 'retryable': True}
+        print(f"Pochtoy outbox: {entry.idempotency_key} attempt {entry.attempts}: {result}")
+
+        now = timezone.now()
+        entry.result = result
+        entry.locked_at = None
+        if result.get('success'):
+            entry.status = 'sent'
+            entry.sent_at = now
+            entry.last_error = ''
+        else:
+            entry.last_error = result.get('error') or 'Неизвестная ошибка'
+            if result.get('retryable') and entry.attempts < MAX_ATTEMPTS:
+                entry.status = 'pending'
+                entry.next_attempt_at = now + retry_delay(entry.attempts)
+            else:
+                entry.status = 'failed'
+        # update() rather than save(): the card may have been deleted while we were sending
+        fields = ['status', 'result', 'locked_at', 'sent_at', 'last_error', 'next_attempt_at']
+        PochtoyOutbox.objects.filter(pk=entry.pk).update(**{f: getattr(entry, f) for f in fields})
+
+        if entry.status in ('sent', 'failed'):
+            entry.message_id = self.notify(entry)
+            if entry.message_id:
+                PochtoyOutbox.objects.filter(pk=entry.pk).update(message_id=entry.message_id)
+        return entry
+
+    def idle_timeout(self) -> float:
+        upcoming = (PochtoyOutbox.objects.filter(status='pending')
+                    .order_by('next_attempt_at').values_list('next_attempt_at', flat=True).first())
+        if upcoming is None:
+            return POLL_INTERVAL
+        return min(POLL_INTERVAL, max(0.0, (upcoming - timezone.now()).total_seconds()))
+
+
+# Global dispatcher instance
+dispatcher = Dispatcher()
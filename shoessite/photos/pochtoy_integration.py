@@ -1,84 +1,58 @@
 """Интеграция с Pochtoy API для отправки карточек товаров."""
 import os
-import base64
 import requests
 from typing import List, Dict, Optional
+from shoesbot.endpoints import POCHTOY_DELETE_URL, POCHTOY_STORE_URL
+from .pochtoy_payload import PochtoyPayload
 
 
-POCHTOY_API_URL = os.getenv('POCHTOY_API_URL', 'https://pochtoy-test.pochtoy3.ru/api/garage-tg/store')
+POCHTOY_API_URL = POCHTOY_STORE_URL
 POCHTOY_API_TOKEN = os.getenv('POCHTOY_API_TOKEN', 'uqwyfg4367gqfuifg3')
 
 
-def send_card_to_pochtoy(card) -> Optional[Dict]:
+def send_card_to_pochtoy(card, idempotency_key: Optional[str] = None) -> Optional[Dict]:
     """
     Отправляет карточку товара в Pochtoy API.
     
     Args:
         card: PhotoBatch объект
+        idempotency_key: Ключ для заголовка Idempotency-Key (повторная отправка не дублирует товар)
     
     Returns:
-        Response dict или None при ошибке
+        Response dict или None при ошибке.
+        'retryable': True - временная ошибка (сеть, 429, 5xx), отправку можно повторить
     """
     try:
-        # 1. Собираем все изображения
-        images = []
-        for idx, photo in enumerate(card.photos.all()):
-            try:
-                # Читаем файл
-                with photo.image.open('rb') as f:
-                    image_data = f.read()
-                
-                # Конвертим в base64
-                img_b64 = base64.b64encode(image_data).decode('utf-8')
-                
-                # Определяем имя файла
-                filename = f"{card.correlation_id}_{idx}.jpg"
-                
-                images.append({
-                    'base64': img_b64,
-                    'file_name': filename
-                })
-                
-            except Exception as e:
-                print(f"Error encoding photo {photo.id}: {e}")
-                continue
+        # 1. Изображения: кодируются в base64 по кускам прямо во время отправки
+        images = [
+            (f"{card.correlation_id}_{idx}.jpg", lambda photo=photo: photo.image.open('rb'))
+            for idx, photo in enumerate(card.photos.all())
+        ]
         
-        # 2. Собираем все трекинги (GG лейблы + баркоды)
-        trackings = []
-        
-        # GG лейблы
-        gg_labels = card.get_gg_labels()
-        trackings.extend(gg_labels)
+        # 2. Трекинги: GG лейблы + баркоды без повторов (денормализованы в карточке)
+        trackings = list(card.trackings)
         
-        # Обычные баркоды
-        barcodes = card.get_all_barcodes()
-        for barcode in barcodes:
-            if barcode.data not in trackings:
-                trackings.append(barcode.data)
+        # 3. Формируем payload (потоковый, большие фото уменьшаются)
+        payload = PochtoyPayload(images, trackings)
+        images_sent = payload.image_count
         
-        # Удаляем дубликаты, сохраняя порядок
-        trackings = list(dict.fromkeys(trackings))
-        
-        # 3. Формируем payload
-        payload = {
-            'images': images,
-            'trackings': trackings
-        }
-        
-        print(f"Sending to Pochtoy: {len(images)} images, {len(trackings)} trackings")
+        print(f"Sending to Pochtoy: {images_sent} images ({payload.original_bytes} -> {len(payload)} bytes), {len(trackings)} trackings")
         
         # 4. Отправляем в Pochtoy API
         headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {POCHTOY_API_TOKEN}'
         }
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
         
-        response = requests.put(
-            POCHTOY_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=60
-        )
+        with payload:
+            response = requests.put(
+                POCHTOY_API_URL,
+                data=payload,
+                headers=headers,
+                timeout=60
+            )
         
         print(f"Pochtoy API response: {response.status_code}")
         print(f"Response: {response.text[:500]}")
@@ -104,7 +78,7 @@ def send_card_to_pochtoy(card) -> Optional[Dict]:
                     return {
                         'success': True,
                         'message': 'Товар успешно добавлен',
-                        'images_sent': len(images),
+                        'images_sent': images_sent,
                         'trackings_sent': len(trackings)
                     }
                 else:
@@ -116,14 +90,15 @@ def send_card_to_pochtoy(card) -> Optional[Dict]:
                 return {
                     'success': True,
                     'message': 'Товар успешно добавлен',
-                    'images_sent': len(images),
+                    'images_sent': images_sent,
                     'trackings_sent': len(trackings)
                 }
         else:
             return {
                 'success': False,
                 'error': f'HTTP error: {response.status_code}',
-                'response': response.text[:500]
+                'response': response.text[:500],
+                'retryable': response.status_code == 429 or response.status_code >= 500
             }
             
     except Exception as e:
@@ -132,7 +107,8 @@ def send_card_to_pochtoy(card) -> Optional[Dict]:
         traceback.print_exc()
         return {
             'success': False,
-            'error': str(e)
+            'error': str(e),
+            'retryable': True
         }
 
 
@@ -147,22 +123,11 @@ def send_buffer_group_to_pochtoy(group_photos: List) -> Optional[Dict]:
         Response dict
     """
     try:
-        # Собираем изображения
-        images = []
-        for idx, photo in enumerate(group_photos):
-            try:
-                with photo.image.open('rb') as f:
-                    image_data = f.read()
-                
-                img_b64 = base64.b64encode(image_data).decode('utf-8')
-                filename = f"buffer_{photo.id}_{idx}.jpg"
-                
-                images.append({
-                    'base64': img_b64,
-                    'file_name': filename
-                })
-            except:
-                continue
+        # Собираем изображения (кодируются по кускам во время отправки)
+        images = [
+            (f"buffer_{photo.id}_{idx}.jpg", lambda photo=photo: photo.image.open('rb'))
+            for idx, photo in enumerate(group_photos)
+        ]
         
         # Собираем трекинги (GG лейблы из буфера)
         trackings = []
@@ -176,17 +141,16 @@ def send_buffer_group_to_pochtoy(group_photos: List) -> Optional[Dict]:
         trackings = list(dict.fromkeys(trackings))
         
         # Отправляем
-        payload = {
-            'images': images,
-            'trackings': trackings
-        }
+        payload = PochtoyPayload(images, trackings)
+        images_sent = payload.image_count
         
         headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {POCHTOY_API_TOKEN}'
         }
         
-        response = requests.put(POCHTOY_API_URL, json=payload, headers=headers, timeout=60)
+        with payload:
+            response = requests.put(POCHTOY_API_URL, data=payload, headers=headers, timeout=60)
         
         print(f"Pochtoy response status: {response.status_code}")
         print(f"Pochtoy response body: {response.text}")
@@ -216,7 +180,7 @@ def send_buffer_group_to_pochtoy(group_photos: List) -> Optional[Dict]:
                     return {
                         'success': True,
                         'message': 'Товар успешно добавлен',
-                        'images_sent': len(images),
+                        'images_sent': images_sent,
                         'trackings_sent': len(trackings)
                     }
                 else:
@@ -230,7 +194,7 @@ def send_buffer_group_to_pochtoy(group_photos: List) -> Optional[Dict]:
                 return {
                     'success': True,
                     'message': 'Товар успешно добавлен',
-                    'images_sent': len(images),
+                    'images_sent': images_sent,
                     'trackings_sent': len(trackings)
                 }
         else:
@@ -258,7 +222,6 @@ def delete_from_pochtoy(trackings: List[str]) -> Dict:
     """
     try:
         # URL от программиста Pochtoy - garage-tg, не garage!
-        POCHTOY_DELETE_URL = 'https://pochtoy-test.pochtoy3.ru/api/garage-tg/delete'
         
         if not trackings:
             return {'success': False, 'error': 'No trackings'}
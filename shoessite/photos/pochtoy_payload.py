@@ -0,0 +1,136 @@
+"""Streaming JSON body for Pochtoy's store endpoint.
+
+    {"images": [{"base64": "...", "file_name": "..."}, ...], "trackings": [...]}
+
+The body is never built in memory: images are base64-encoded chunk by chunk
+while requests sends it, straight from storage or, for photos larger than
+POCHTOY_IMAGE_MAX_SIDE, from a downscaled JPEG spooled to a temp file.  The
+exact length is known in advance, so it goes out with a Content-Length
+rather than chunked transfer encoding.
+"""
+import base64
+import json
+import os
+import tempfile
+from typing import IO, Callable, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+MAX_SIDE = int(os.getenv('POCHTOY_IMAGE_MAX_SIDE', '1600'))  # 0 = send originals
+JPEG_QUALITY = int(os.getenv('POCHTOY_JPEG_QUALITY', '85'))
+CHUNK = 3 * 64 * 1024  # multiple of 3: base64 of each chunk needs no padding
+SPOOL_MAX = 2 * 1024 * 1024  # downscaled images above this go to disk
+
+
+def b64_len(size: int) -> int:
+    return 4 * ((size + 2) // 3)
+
+
+def downscale(f: IO[bytes], max_side: int = MAX_SIDE) -> Optional[IO[bytes]]:
+    """Re-encode to JPEG within max_side; None if the photo is small enough already."""
+    if not max_side:
+        return None
+    with Image.open(f) as img:
+        if max(img.size) <= max_side:
+            return None
+        img = ImageOps.exif_transpose(img)  # EXIF is dropped on re-encode
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+        img.convert('RGB').save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    out.seek(0)
+    return out
+
+
+class PochtoyPayload:
+    """Iterable request body with a known length (requests sends it with Content-Length)."""
+
+    def __init__(self, images: List[Tuple[str, Callable[[], IO[bytes]]]], trackings: List[str],
+                 max_side: int = MAX_SIDE):
+        """images: (file_name, open) pairs; open() returns a binary file positioned at 0."""
+        self.trackings = trackings
+        self.parts: List[Tuple[str, Callable[[], IO[bytes]], int]] = []
+        self._spooled: List[IO[bytes]] = []
+        self.original_bytes = 0
+        for file_name, opener in images:
+            try:
+                self._add(file_name, opener, max_side)
+            except Exception as e:
+                print(f"Pochtoy payload: skipping {file_name}: {e}")
+
+    def _add(self, file_name: str, opener: Callable[[], IO[bytes]], max_side: int) -> None:
+        with opener() as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(0)
+            small = downscale(f, max_side)
+        self.original_bytes += size
+        if small is None:
+            self.parts.append((file_name, opener, size))
+            return
+        self._spooled.append(small)
+        small.seek(0, os.SEEK_END)
+        small_size = small.tell()
+
+        def reopen(small=small):
+            small.seek(0)
+            return _Unclosable(small)
+        self.parts.append((file_name, reopen, small_size))
+
+    @property
+    def image_count(self) -> int:
+        return len(self.parts)
+
+    def _frame(self) -> Iterator[Tuple[bytes, Optional[Tuple[Callable[[], IO[bytes]], int]]]]:
+        """Literal JSON pieces, each followed by the image to encode after it (if any)."""
+        yield b'{"images": [', None
+        for i, (file_name, opener, size) in enumerate(self.parts):
+            yield (b', ' if i else b'') + b'{"base64": "', (opener, size)
+            yield b'", "file_name": ' + json.dumps(file_name).encode() + b'}', None
+        yield b'], "trackings": ' + json.dumps(self.trackings).encode() + b'}', None
+
+    def __len__(self) -> int:
+        return sum(len(text) + (b64_len(image[1]) if image else 0) for text, image in self._frame())
+
+    def __iter__(self) -> Iterator[bytes]:
+        for text, image in self._frame():
+            yield text
+            if image is None:
+                continue
+            opener, size = image
+            sent = 0
+            with opener() as f:
+                while sent < size:
+                    chunk = f.read(min(CHUNK, size - sent))
+                    if not chunk:
+                        break
+                    sent += len(chunk)
+                    yield base64.b64encode(chunk)
+            if sent != size:  # file changed under us: the Content-Length would be a lie
+                raise IOError(f'image changed while sending ({sent} of {size} bytes)')
+
+    def close(self) -> None:
+        for f in self._spooled:
+            f.close()
+        self._spooled = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Unclosable:
+    """Context manager over a spooled file that must survive several reads."""
+
+    def __init__(self, f: IO[bytes]):
+        self.f = f
+
+    def read(self, n: int = -1) -> bytes:
+        return self.f.read(n)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
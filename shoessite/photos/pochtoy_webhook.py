@@ -3,6 +3,7 @@ import os
 import json
 import requests
 from typing import Dict, Any
+from shoesbot.endpoints import telegram_method_url
 
 
 def send_telegram_message(chat_id: int, text: str) -> bool:
@@ -13,7 +14,7 @@ def send_telegram_message(chat_id: int, text: str) -> bool:
             print("BOT_TOKEN not set")
             return False
         
-        url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
+        url = telegram_method_url(bot_token, 'sendMessage')
         response = requests.post(url, json={
             'chat_id': chat_id,
             'text': text,
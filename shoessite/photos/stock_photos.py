@@ -0,0 +1,308 @@
+"""Stock photo search: sources in two parallel rounds, deduplicated, cached.
+
+The first round sends Google Lens (Vision web detection) for the first
+product photo, Google Custom Search for the plain query, DuckDuckGo and Bing
+at once through fan_out().  The remaining paid requests (second photo, other
+query variants) go out together in a second round, and only when the first
+one found fewer than LIMIT unique images.  Results are merged in
+the old priority order; URLs are compared after normalize_url(), so the same
+picture with a different tracking query or host case counts once.  The final
+list is cached per (query, photo content hash).
+"""
+import base64
+import hashlib
+import os
+import re
+import time
+import urllib.parse
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from bs4 import BeautifulSoup
+from django.core.cache import cache
+
+from shoesbot.endpoints import CUSTOMSEARCH_URL, OPENAI_CHAT_URL
+
+from .fanout import fan_out
+
+LIMIT = 12
+FALLBACK_BELOW = 8  # DuckDuckGo/Bing only count when the better sources found fewer
+CACHE_TTL = 6 * 3600
+DEADLINE = float(os.getenv('STOCK_PHOTOS_DEADLINE', '12'))
+BROWSER_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+EXCLUDED_DOMAINS = [
+    'instagram.com', 'facebook.com', 'fbsbx.com', 'linkedin.com',
+    'media.licdn.com', 'tiktok.com', 'twitter.com', 'pinterest.com',
+    'lookaside.instagram.com', 'lookaside.fbsbx.com'
+]
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'ref', 'spm')
+
+
+def normalize_url(url: str) -> str:
+    """Key for deduplication: lower-case scheme/host, no fragment, no tracking params."""
+    parts = urllib.parse.urlsplit(url.strip())
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith(TRACKING_PARAMS)]
+    return urllib.parse.urlunsplit((
+        parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'),
+        urllib.parse.urlencode(sorted(query)), '',
+    ))
+
+
+def photo_hash(paths: Iterable[str]) -> str:
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        except OSError:
+            digest.update(path.encode())
+    return digest.hexdigest()
+
+
+class ImageSet:
+    """Unique images in arrival order, up to a limit."""
+
+    def __init__(self, limit: int = LIMIT, excluded_domains: Iterable[str] = ()):
+        self.limit = limit
+        self.excluded_domains = list(excluded_domains)
+        self.images: List[Dict] = []
+        self.seen = set()
+        self.total = 0
+        self.filtered = 0
+
+    @property
+    def full(self) -> bool:
+        return len(self.images) >= self.limit
+
+    def add(self, image: Dict) -> bool:
+        url = image.get('url') or ''
+        if self.full or not url.startswith('http'):
+            return False
+        self.total += 1
+        key = normalize_url(url)
+        if key in self.seen:
+            return False
+        if any(domain in url.lower() for domain in self.excluded_domains):
+            self.filtered += 1
+            return False
+        self.seen.add(key)
+        self.images.append(image)
+        return True
+
+    def extend(self, images: Optional[Iterable[Dict]]) -> None:
+        for image in images or []:
+            if self.full:
+                break
+            self.add(image)
+
+    def sources(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for image in self.images:
+            counts[image.get('source', 'unknown')] = counts.get(image.get('source', 'unknown'), 0) + 1
+        return counts
+
+
+def google_lens(photo_path: str, limit: Optional[int] = None) -> List[Dict]:
+    from .views import search_product_with_vision_api
+    found = search_product_with_vision_api(photo_path)
+    return [{'url': url, 'thumbnail': url, 'title': found.get('title', ''), 'source': 'google_lens'}
+            for url in (found.get('images') or [])[:limit]]
+
+
+IDENTIFY_PROMPT = '''Определи товар на фото максимально точно для поиска стоковых фото.
+
+Верни: "Бренд тип_товара цвет особенности"
+Пример: "Stone Island crew neck sweater black logo patch"
+
+КРИТИЧНО:
+- Если Stone Island (компас) - ОБЯЗАТЕЛЬНО включи бренд
+- НЕ упоминай упаковку/пакет/barcode - опиши САМ ТОВАР
+- Фокус на продукте, а не на том, как он упакован'''
+
+
+def identify_product(photo_path: str) -> Optional[str]:
+    """Short product description from OpenAI Vision, used as the search query."""
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        return None
+    with open(photo_path, 'rb') as f:
+        b64_img = base64.b64encode(f.read()).decode('utf-8')
+    resp = requests.post(OPENAI_CHAT_URL, json={
+        'model': 'gpt-4o',
+        'messages': [{
+            'role': 'user',
+            'content': [
+                {'type': 'text', 'text': IDENTIFY_PROMPT},
+                {'type': 'image_url', 'image_url': {'url': f'data:image/jpeg;base64,{b64_img}'}}
+            ]
+        }],
+        'max_tokens': 80,
+        'temperature': 0.2
+    }, headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}, timeout=15)
+    if not resp.ok:
+        return None
+    return resp.json().get('choices', [{}])[0].get('message', {}).get('content', '').strip().strip('"').strip("'") or None
+
+
+def clean_query(query: str) -> str:
+    """Drop barcodes and packaging words: they find photos of bags, not of the product."""
+    query = re.sub(r'\b\d{8,}\b', '', query)
+    query = re.sub(r'\b(packaged|packaging|package|plastic|bag|box|boxed|wrapped)\b', '', query, flags=re.IGNORECASE)
+    return ' '.join(query.split())
+
+
+def ebay(brand: Optional[str], title: str, barcode: Optional[str]) -> List[Dict]:
+    from .ai_helpers import search_products_on_ebay
+    found = search_products_on_ebay(brand=brand, title=title, barcode=barcode) or {}
+    return [{'url': url, 'thumbnail': url, 'title': f"eBay ({found.get('price', 'N/A')} USD)", 'source': 'ebay'}
+            for url in found.get('images') or []]
+
+
+def custom_search(query: str, **extra) -> List[Dict]:
+    api_key = os.getenv('GOOGLE_CUSTOM_SEARCH_API_KEY')
+    cx = os.getenv('GOOGLE_CUSTOM_SEARCH_ENGINE_ID')
+    if not api_key or not cx:
+        return []
+    params = {'key': api_key, 'cx': cx, 'q': query, 'searchType': 'image', 'num': 10, 'safe': 'active',
+              'imgSize': 'large', **extra}
+    resp = requests.get(CUSTOMSEARCH_URL, params=params, timeout=10)
+    if not resp.ok:
+        print(f"❌ CSE error {resp.status_code}: {resp.text[:200]}")
+        return []
+    return [{
+        'url': item.get('link', ''),
+        'thumbnail': item.get('image', {}).get('thumbnailLink', item.get('link', '')),
+        'title': item.get('title', ''),
+        'source': 'google',
+    } for item in resp.json().get('items', [])]
+
+
+def duckduckgo(query: str) -> List[Dict]:
+    resp = requests.get('https://api.duckduckgo.com/', params={
+        'q': f'{query} product', 'iax': 'images', 'ia': 'images',
+    }, timeout=10)
+    if not resp.ok:
+        return []
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    return [{'url': img.get('src'), 'thumbnail': img.get('src'), 'title': img.get('alt', ''), 'source': 'duckduckgo'}
+            for img in soup.find_all('img', limit=10) if img.get('src')]
+
+
+def bing(query: str) -> List[Dict]:
+    search_url = f'https://www.bing.com/images/search?q={urllib.parse.quote(query + " product")}&qft=+filterui:imagesize-large'
+    resp = requests.get(search_url, headers={'User-Agent': BROWSER_UA}, timeout=10)
+    if not resp.ok:
+        return []
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    images = []
+    for img in soup.find_all('img', limit=20):
+        src = img.get('data-src') or img.get('src') or ''
+        # Без своих картинок Bing и маленьких иконок
+        if 'bing.com' in src or 'icon' in src.lower() or 'logo' in src.lower():
+            continue
+        images.append({'url': src, 'thumbnail': src, 'title': img.get('alt', ''), 'source': 'bing'})
+    return images
+
+
+def merge(found: Dict[str, Optional[List[Dict]]], paid: List[Tuple[str, Callable]],
+          free: List[Tuple[str, Callable]], limit: int = LIMIT) -> ImageSet:
+    """Results so far in priority order; the free fallbacks only when the paid ones found few."""
+    images = ImageSet(limit)
+    for name, _ in paid:
+        images.extend(found.get(name))
+    if len(images.images) < FALLBACK_BELOW:
+        for name, _ in free:
+            images.extend(found.get(name))
+    return images
+
+
+def search(query: str, photo_paths: Optional[List[str]] = None, limit: int = LIMIT) -> List[Dict]:
+    """Stock images for the query and product photos (first two), up to `limit`."""
+    photo_paths = (photo_paths or [])[:2]
+    cache_key = f'stock-photos:{hashlib.sha1(query.encode()).hexdigest()}:{photo_hash(photo_paths)}:{limit}'
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    paid: List[Tuple[str, Callable[[], List[Dict]]]] = []
+    for i, path in enumerate(photo_paths):
+        paid.append((f'lens_{i}', lambda path=path: google_lens(path)))
+    for variant in (query, f'{query} product', f'{query} official', f'{query} brand'):
+        paid.append((f'cse:{variant}', lambda variant=variant: custom_search(variant, imgType='photo')))
+    free = [('duckduckgo', lambda: duckduckgo(query)), ('bing', lambda: bing(query))]
+
+    # Two parallel rounds: the best Lens source and the plain query with the free
+    # fallbacks, then the other paid sources (Vision, CSE quota) together, only
+    # if the set is not full yet
+    first = [s for s in paid if s[0] in ('lens_0', f'cse:{query}')] or paid[:1]
+    rest = [s for s in paid if s not in first]
+    started = time.monotonic()
+    found: Dict[str, Optional[List[Dict]]] = dict(fan_out(first + free, deadline=DEADLINE))
+    remaining = DEADLINE - (time.monotonic() - started)
+    if rest and remaining > 0 and not merge(found, paid, free, limit).full:
+        for name, result in fan_out(rest, deadline=remaining):
+            found[name] = result
+            if merge(found, paid, free, limit).full:
+                break  # results come in priority order: the rest would not be used
+
+    images = merge(found, paid, free, limit)
+    cache.set(cache_key, images.images, CACHE_TTL if images.images else 60)
+    return images.images
+
+
+def search_card(title: str, brand: str, barcode: Optional[str], photo_paths: List[str],
+                limit: int = LIMIT) -> Dict:
+    """What the card page's "stock photos" button shows: eBay, Google Lens, Custom Search.
+
+    Two rounds instead of five serial calls: OpenAI identification and Lens
+    (both need only the photo), then eBay and Custom Search with the query.
+    """
+    photo_paths = photo_paths[:2]
+    cache_key = 'stock-photos-card:{}:{}'.format(
+        hashlib.sha1('|'.join([title or '', brand or '', barcode or '', str(limit)]).encode()).hexdigest(),
+        photo_hash(photo_paths))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return {**cached, 'debug': {**cached['debug'], 'cached': True}}
+
+    lens: List[Dict] = []
+    description = None
+    if photo_paths:
+        for name, found in fan_out([
+            ('identify', lambda: identify_product(photo_paths[0])),
+            ('lens', lambda: google_lens(photo_paths[0], limit=10)),
+        ], deadline=DEADLINE):
+            if name == 'identify':
+                description = found
+            else:
+                lens = found or []
+        print(f"✅ OpenAI Vision identified: '{description}', Google Lens: {len(lens)} images")
+
+    query = clean_query(description or title or (brand + ' product' if brand else 'product'))
+    print(f"📝 Search query (cleaned): '{query}'")
+
+    images = ImageSet(limit, EXCLUDED_DOMAINS)
+    found_ebay, found_cse = [found for _, found in fan_out([
+        ('ebay', lambda: ebay(brand, query, barcode)),
+        ('cse', lambda: custom_search(query)),
+    ], deadline=DEADLINE)]
+    for found in (found_ebay, lens, found_cse):
+        images.extend(found)
+
+    result = {
+        'images': images.images,
+        'query': query,
+        'debug': {
+            'total_found': images.total,
+            'filtered_out': images.filtered,
+            'final_count': len(images.images),
+            'sources': images.sources(),
+            'version': 'v5.0_parallel',
+            'cached': False,
+        },
+    }
+    cache.set(cache_key, result, CACHE_TTL if images.images else 60)
+    return result
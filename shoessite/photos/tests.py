@@ -12,3 +12,439 @@ class BasicTests(TestCase):
         from django.conf import settings
         self.assertTrue(hasattr(settings, 'STATIC_ROOT'))
         self.assertTrue(hasattr(settings, 'MEDIA_ROOT'))
+
+
+class IngestBatchTests(TestCase):
+    """Bulk ingest writes files first and all rows in a few queries."""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def test_ingest_batch_report_and_queries(self):
+        import base64
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .ingest import ingest_batch
+        from .models import BarcodeResult
+
+        image = base64.b64encode(b'\xff\xd8fake-jpeg').decode()
+        photos = [
+            {'file_id': 'f0', 'message_id': 1, 'image': image},
+            {'file_id': 'f1', 'message_id': 2, 'image': ''},  # skipped
+            {'file_id': 'f2', 'message_id': 3, 'image': f'data:image/jpeg;base64,{image}'},
+        ]
+        barcodes = [
+            {'photo_index': 0, 'symbology': 'GG_LABEL', 'data': 'GG123', 'source': 'gg-label-local',
+             'bbox': [0.1, 0.2, 0.3, 0.1], 'confidence': 0.8},
+            {'photo_index': 2, 'symbology': 'CODE39', 'data': 'Q123', 'source': 'zbar'},
+            {'photo_index': 2, 'symbology': 'CODE39', 'data': 'Q123', 'source': 'vision-ocr'},
+            {'photo_index': 1, 'symbology': 'EAN13', 'data': '123', 'source': 'zbar'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            report = ingest_batch('corr1', 42, [1, 2, 3], photos, barcodes)
+        self.assertLessEqual(len(queries), 9)
+        self.assertEqual(report.batch.trackings, ['GG123', 'Q123'])
+
+        self.assertTrue(report.created)
+        self.assertEqual(report.photos_saved, 2)
+        self.assertEqual(report.barcodes_saved, 2)
+        self.assertEqual([(p.index, p.barcodes) for p in report.photos], [(0, 1), (2, 1)])
+        q = BarcodeResult.objects.get(data='Q123')
+        self.assertEqual((q.photo.order, q.source), (2, 'zbar'))
+        gg = BarcodeResult.objects.get(data='GG123')
+        self.assertEqual(gg.bbox, [0.1, 0.2, 0.3, 0.1])
+        with gg.photo.image.open('rb') as f:
+            self.assertEqual(f.read(), b'\xff\xd8fake-jpeg')
+
+
+class PochtoyOutboxTests(TestCase):
+    """Cards reach Pochtoy through the outbox: retried, idempotent, reported to the chat."""
+
+    def test_retry_then_sent_and_idempotent_enqueue(self):
+        from .models import PhotoBatch
+        from .outbox import Dispatcher, enqueue_card
+
+        batch = PhotoBatch.objects.create(correlation_id='corr2', chat_id=42)
+        entry = enqueue_card(batch)
+        self.assertEqual(enqueue_card(batch).pk, entry.pk)
+
+        calls, notified = [], []
+        results = [{'success': False, 'error': 'HTTP error: 503', 'retryable': True},
+                   {'success': True, 'message': 'Товар успешно добавлен'}]
+
+        def send(card, idempotency_key=None):
+            calls.append(idempotency_key)
+            return results[len(calls) - 1]
+
+        def notify(e):
+            notified.append(e.status)
+            return 777
+
+        dispatcher = Dispatcher(send=send, notify=notify)
+        self.assertEqual(dispatcher.run_once(), 1)
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('pending', 1, 'HTTP error: 503'))
+        self.assertEqual(dispatcher.run_once(), 0)  # backoff: not due yet
+        self.assertEqual(notified, [])
+
+        entry.next_attempt_at = entry.created_at
+        entry.save(update_fields=['next_attempt_at'])
+        dispatcher.run_once()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts, entry.message_id), ('sent', 2, 777))
+        self.assertEqual(calls, ['card-corr2', 'card-corr2'])
+        self.assertEqual(notified, ['sent'])
+
+        enqueue_card(batch)  # re-upload of a delivered card does not send it again
+        self.assertEqual(dispatcher.run_once(), 0)
+
+        response = self.client.delete('/photos/api/delete-card-by-correlation/corr2/')
+        self.assertEqual(response.json()['message_ids'], [777])
+
+    def test_permanent_error_fails_without_retry(self):
+        from .models import PhotoBatch
+        from .outbox import Dispatcher, enqueue_card
+
+        entry = enqueue_card(PhotoBatch.objects.create(correlation_id='corr3', chat_id=42))
+        dispatcher = Dispatcher(send=lambda card, idempotency_key=None: {'success': False, 'error': 'Трекинг уже есть'},
+                                notify=lambda e: None)
+        dispatcher.run_once()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), ('failed', 1))
+
+
+class PochtoyPayloadTests(TestCase):
+    """The streamed body is the same JSON as before, with an exact Content-Length."""
+
+    def test_stream_matches_json_and_downscales(self):
+        import base64
+        import io
+        import json
+        import requests
+        from PIL import Image
+        from .pochtoy_payload import PochtoyPayload
+
+        def jpeg(size):
+            out = io.BytesIO()
+            Image.new('RGB', size, (200, 10, 10)).save(out, 'JPEG')
+            return out.getvalue()
+
+        small, large = jpeg((300, 200)), jpeg((3000, 2000))
+        images = [('a.jpg', lambda: io.BytesIO(small)), ('b.jpg', lambda: io.BytesIO(large))]
+        with PochtoyPayload(images, ['GG123', 'Q1'], max_side=1000) as payload:
+            body = b''.join(payload)
+            self.assertEqual(len(body), len(payload))
+            prepared = requests.Request('PUT', 'http://pochtoy.invalid/', data=payload).prepare()
+            self.assertEqual(prepared.headers['Content-Length'], str(len(body)))
+            self.assertNotIn('Transfer-Encoding', prepared.headers)
+            self.assertEqual(b''.join(payload), body)  # can be iterated again
+
+        data = json.loads(body)
+        self.assertEqual(data['trackings'], ['GG123', 'Q1'])
+        self.assertEqual([i['file_name'] for i in data['images']], ['a.jpg', 'b.jpg'])
+        self.assertEqual(base64.b64decode(data['images'][0]['base64']), small)
+        with Image.open(io.BytesIO(base64.b64decode(data['images'][1]['base64']))) as img:
+            self.assertEqual(img.size, (1000, 667))
+
+
+class ThumbnailTests(TestCase):
+    """Derivatives are content-addressed, served once current, and released with the last user."""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def test_generate_fallback_and_release(self):
+        import io
+        from django.core.files.base import ContentFile
+        from PIL import Image
+        from .models import Photo, PhotoBatch
+        from .thumbnails import SIZES, refresh, release
+
+        out = io.BytesIO()
+        Image.new('RGB', (2000, 1500), (10, 200, 10)).save(out, 'JPEG')
+        batch = PhotoBatch.objects.create(correlation_id='corr4', chat_id=42)
+        photos = []
+        for i in range(2):
+            photo = Photo(batch=batch, file_id=f'f{i}', message_id=i, order=i)
+            photo.image.save(f'corr4_{i}.jpg', ContentFile(out.getvalue()), save=True)
+            photos.append(photo)
+        self.assertEqual(photos[0].thumbnail_url('xs'), photos[0].image.url)  # not generated yet
+
+        for photo in photos:
+            refresh(Photo, photo.pk)
+            photo.refresh_from_db()
+        first, second = photos
+        self.assertTrue(first.has_thumbnails())
+        self.assertEqual(first.thumbnails['md'], second.thumbnails['md'])  # same content, same files
+        self.assertIn('/thumbs/', first.thumbnail_url('xs'))
+        storage = first.image.storage
+        with storage.open(first.thumbnails['xs']) as f, Image.open(f) as img:
+            self.assertEqual(img.size, (SIZES['xs'], 90))
+
+        first.delete()
+        self.assertEqual(release(first.thumbnails), 0)  # still used by the second photo
+        second.delete()
+        self.assertEqual(release(second.thumbnails), len(SIZES))
+        self.assertFalse(storage.exists(second.thumbnails['sm']))
+
+
+class BatchCodesTests(TestCase):
+    """gg_labels/trackings follow barcode writes; reading them costs no per-photo queries."""
+
+    def test_denormalized_codes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import BarcodeResult, Photo, PhotoBatch
+
+        batch = PhotoBatch.objects.create(correlation_id='corr5', chat_id=42)
+        first = Photo.objects.create(batch=batch, file_id='f0', message_id=1, order=0)
+        second = Photo.objects.create(batch=batch, file_id='f1', message_id=2, order=1)
+        BarcodeResult.objects.create(photo=first, symbology='EAN13', data='4006381333931', source='zbar')
+        BarcodeResult.objects.create(photo=second, symbology='CODE39', data='Q4155', source='zbar')
+        BarcodeResult.objects.create(photo=second, symbology='GG_LABEL', data='GG727', source='gg-label-local')
+        ean = BarcodeResult.objects.get(data='4006381333931')
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.gg_labels, ['GG727', 'Q4155'])
+        self.assertEqual(batch.trackings, ['GG727', 'Q4155', '4006381333931'])
+        self.assertEqual(batch.get_gg_labels(), ['GG727', 'Q4155'])
+        self.assertEqual([b.data for b in batch.get_all_barcodes()], ['4006381333931'])
+
+        with CaptureQueriesContext(connection) as queries:
+            batches = list(PhotoBatch.objects.prefetch_related('photos__barcodes'))
+            labels = [(b.get_gg_labels(), [x.data for x in b.get_all_barcodes()]) for b in batches]
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(labels, [(['GG727', 'Q4155'], ['4006381333931'])])
+
+        ean.delete()
+        second.delete()
+        batch.refresh_from_db()
+        self.assertEqual((batch.gg_labels, batch.trackings), ([], []))
+
+    def test_reordering_photos_reorders_codes(self):
+        from .models import BarcodeResult, Photo, PhotoBatch
+
+        batch = PhotoBatch.objects.create(correlation_id='corr7', chat_id=42)
+        first = Photo.objects.create(batch=batch, file_id='f0', message_id=1, order=0)
+        second = Photo.objects.create(batch=batch, file_id='f1', message_id=2, order=1)
+        BarcodeResult.objects.create(photo=first, symbology='GG_LABEL', data='GG701', source='gg-label-local')
+        BarcodeResult.objects.create(photo=second, symbology='GG_LABEL', data='GG702', source='gg-label-local')
+        batch.refresh_from_db()
+        self.assertEqual(batch.gg_labels, ['GG701', 'GG702'])
+
+        second.is_main = True  # как set_main_photo
+        second.save()
+        batch.refresh_from_db()
+        self.assertEqual(batch.gg_labels, ['GG702', 'GG701'])
+
+        second.is_main = False  # как move_photo: фото меняются order
+        second.order, first.order = 0, 1
+        second.save()
+        first.save()
+        batch.refresh_from_db()
+        self.assertEqual(batch.gg_labels, ['GG702', 'GG701'])
+        first.order, second.order = 0, 1
+        first.save()
+        second.save()
+        batch.refresh_from_db()
+        self.assertEqual(batch.gg_labels, ['GG701', 'GG702'])
+
+
+class LookupTests(TestCase):
+    """Cards are found by any of their codes through indexed exact matches."""
+
+    def test_lookup_api_and_index_use(self):
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from .models import BarcodeResult, Photo, PhotoBatch, PhotoBuffer
+
+        self.assertEqual(self.client.get('/photos/api/lookup/', {'q': 'GG727'}).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+        batch = PhotoBatch.objects.create(correlation_id='corr6', chat_id=42, title='Nike')
+        photo = Photo.objects.create(batch=batch, file_id='AgACfile', message_id=7, order=0)
+        BarcodeResult.objects.create(photo=photo, symbology='EAN13', data='0011334478137', source='zbar')
+        BarcodeResult.objects.create(photo=photo, symbology='GG_LABEL', data='GG727', source='gg-label-local')
+        PhotoBuffer.objects.create(file_id='AgACbuf', message_id=8, chat_id=42, gg_label='GG727')
+
+        for query, field in [('011334478137', 'barcode'), ('gg727', 'barcode'), ('AgACfile', 'file_id'),
+                             ('CORR6', 'correlation_id')]:
+            data = self.client.get('/photos/api/lookup/', {'q': query}).json()
+            self.assertEqual([c['correlation_id'] for c in data['cards']], ['corr6'], query)
+            self.assertEqual(data['cards'][0]['matches'][0]['field'], field)
+        self.assertEqual([b['file_id'] for b in data['buffer']], [])
+        data = self.client.get('/photos/api/lookup/', {'q': 'GG727'}).json()
+        self.assertEqual([b['file_id'] for b in data['buffer']], ['AgACbuf'])
+        self.assertEqual(self.client.get('/photos/api/lookup/').status_code, 400)
+        data = self.client.get('/photos/api/lookup/', {'q': 'GG727', 'limit': -5}).json()
+        self.assertEqual([c['correlation_id'] for c in data['cards']], ['corr6'])  # limit clamped to 1
+
+        with connection.cursor() as cursor:
+            sql, params = BarcodeResult.objects.filter(data__in=['GG727']).query.sql_with_params()
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('USING INDEX', plan)
+
+        response = self.client.delete('/photos/api/delete-card-by-correlation/corr6/')
+        self.assertEqual(response.json()['returned_to_buffer'], 0)
+
+
+class AISuggestionsTests(TestCase):
+    """Suggestions are computed once per inputs and served from the card."""
+
+    def test_compute_once_per_inputs(self):
+        from unittest import mock
+        from .models import BarcodeResult, Photo, PhotoBatch
+        from . import ai_suggestions
+
+        batch = PhotoBatch.objects.create(correlation_id='corr7', chat_id=42)
+        photo = Photo.objects.create(batch=batch, file_id='f0', message_id=1, order=0)
+        BarcodeResult.objects.create(photo=photo, symbology='EAN13', data='4006381333931', source='zbar')
+
+        with mock.patch.object(ai_suggestions, 'auto_fill_product_card', return_value={'title': 'Boots'}) as fill:
+            self.assertEqual(ai_suggestions.compute(batch.id), {'title': 'Boots'})
+            ai_suggestions.compute(batch.id)
+            self.assertEqual(fill.call_count, 1)
+            batch.refresh_from_db()
+            self.assertTrue(ai_suggestions.is_current(batch))
+
+            BarcodeResult.objects.create(photo=photo, symbology='EAN13', data='5901234123457', source='zbar')
+            batch.refresh_from_db()
+            self.assertFalse(ai_suggestions.is_current(batch))
+            ai_suggestions.compute(batch.id)
+            ai_suggestions.compute(batch.id, force=True)
+            self.assertEqual(fill.call_count, 3)
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.ai_suggestions, {'title': 'Boots'})
+
+    def test_empty_answer_is_not_current(self):
+        from unittest import mock
+        from django.core.cache import cache
+        from .models import Photo, PhotoBatch
+        from . import ai_suggestions
+
+        cache.clear()
+        batch = PhotoBatch.objects.create(correlation_id='corr8', chat_id=42)
+        Photo.objects.create(batch=batch, file_id='f0', message_id=1, order=0, image='photos/x.jpg')
+
+        with mock.patch.object(ai_suggestions, 'auto_fill_product_card', return_value={}):
+            self.assertIsNone(ai_suggestions.compute(batch.id))
+        batch.refresh_from_db()
+        self.assertFalse(ai_suggestions.is_current(batch))
+        self.assertTrue(ai_suggestions.failed(batch))
+
+        ai_suggestions.clear_failed(batch)
+        with mock.patch.object(ai_suggestions, 'auto_fill_product_card', return_value={'title': 'Boots'}):
+            self.assertEqual(ai_suggestions.compute(batch.id), {'title': 'Boots'})
+        batch.refresh_from_db()
+        self.assertTrue(ai_suggestions.is_current(batch))
+        self.assertFalse(ai_suggestions.failed(batch))
+
+
+class FanOutTests(TestCase):
+    """Sources run concurrently, answer in priority order and are cached even when late."""
+
+    def test_concurrent_deadline_and_cache(self):
+        import time
+        from django.core.cache import cache
+        from .fanout import fan_out
+
+        cache.clear()
+        calls = []
+
+        def source(name, delay, value):
+            def run():
+                calls.append(name)
+                time.sleep(delay)
+                return value
+            return run
+
+        sources = [('slow', source('slow', 0.3, {'a': 1})), ('fast', source('fast', 0.1, ['x'])),
+                   ('late', source('late', 0.8, ['y']))]
+        started = time.monotonic()
+        results = list(fan_out(sources, deadline=0.5, cache_prefix='test:1'))
+        elapsed = time.monotonic() - started
+        self.assertEqual(results, [('slow', {'a': 1}), ('fast', ['x']), ('late', None)])
+        self.assertLess(elapsed, 0.7)  # not 1.2 s, the sum
+
+        time.sleep(0.5)  # the late source finishes in the background
+        self.assertEqual(list(fan_out(sources, deadline=0.5, cache_prefix='test:1')),
+                         [('slow', {'a': 1}), ('fast', ['x']), ('late', ['y'])])
+        self.assertEqual(sorted(calls), ['fast', 'late', 'slow'])
+
+    def test_unstarted_sources_are_cancelled(self):
+        import time
+        from unittest import mock
+        from django.core.cache import cache
+        from . import fanout
+
+        cache.clear()
+        calls = []
+
+        def source(name):
+            def run():
+                calls.append(name)
+                time.sleep(0.2)
+                return [name]
+            return run
+
+        with mock.patch.object(fanout, 'MAX_WORKERS', 1):
+            results = fanout.fan_out([(n, source(n)) for n in ('a', 'b', 'c')], deadline=0.1)
+            self.assertEqual(next(results), ('a', None))  # deadline passed while 'a' ran
+            self.assertEqual(list(results), [('b', None), ('c', None)])
+        time.sleep(0.3)
+        self.assertEqual(calls, ['a'])  # 'b' and 'c' never started
+
+
+class StockPhotosTests(TestCase):
+    """Stock search dedupes by normalized URL, stops requesting at the limit and caches the result."""
+
+    def test_dedupe_limit_and_cache(self):
+        from unittest import mock
+        from django.core.cache import cache
+        from . import stock_photos
+
+        cache.clear()
+        self.assertEqual(stock_photos.normalize_url('HTTPS://Img.Example.com/a.jpg/?utm_source=x&w=2#top'),
+                         'https://img.example.com/a.jpg?w=2')
+
+        def cse(query, **extra):
+            return [{'url': f'https://img.example.com/{query}/{i}.jpg?utm_campaign=q', 'source': 'google'}
+                    for i in range(5)] + [{'url': 'https://IMG.example.com/shared.jpg', 'source': 'google'}]
+
+        with mock.patch.object(stock_photos, 'custom_search', side_effect=cse) as search, \
+                mock.patch.object(stock_photos, 'duckduckgo', return_value=[]), \
+                mock.patch.object(stock_photos, 'bing', return_value=[]):
+            images = stock_photos.search('nike air')
+            self.assertEqual(len(images), 12)
+            self.assertEqual(len({stock_photos.normalize_url(i['url']) for i in images}), 12)
+            self.assertEqual(search.call_count, 4)  # plain query, then the other variants together
+
+            self.assertEqual(stock_photos.search('nike air'), images)
+            self.assertEqual(search.call_count, 4)  # second search comes from the cache
+
+        def cse_full(query, **extra):
+            return [{'url': f'https://img.example.com/{query}/{i}.jpg', 'source': 'google'} for i in range(12)]
+
+        with mock.patch.object(stock_photos, 'custom_search', side_effect=cse_full) as search, \
+                mock.patch.object(stock_photos, 'duckduckgo', return_value=[]), \
+                mock.patch.object(stock_photos, 'bing', return_value=[]):
+            self.assertEqual(len(stock_photos.search('adidas')), 12)
+            self.assertEqual(search.call_count, 1)  # full after the first round: no second round
@@ -0,0 +1,140 @@
+"""Thumbnails for photos shown in the admin, sorting and card pages.
+
+Each photo gets one derivative per SIZES entry, stored next to the original
+under thumbs/ with a content-hash name (identical uploads share files).  The
+names are kept in the model's `thumbnails` JSON together with the original's
+name, so a rotated or replaced image falls back to the original until its
+new thumbnails exist.
+
+Generation runs on a background thread after the saving transaction commits;
+`python manage.py thumbnails` backfills photos that have none.
+"""
+import hashlib
+import os
+import posixpath
+import queue
+import threading
+from io import BytesIO
+from typing import Dict, Iterable, Optional, Tuple, Type
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, models, transaction
+from PIL import Image, ImageOps, features
+
+SIZES = {
+    'xs': 120,   # admin changelist (50 px previews on retina)
+    'sm': 480,   # sorting grid, card photo grid, admin photo page
+    'md': 1280,  # lightbox
+}
+FORMAT, EXT = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+QUALITY = 80
+THUMBNAILS_THREAD = os.getenv('THUMBNAILS_THREAD', '1') == '1'
+
+
+def content_hash(f) -> str:
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+        digest.update(chunk)
+    return digest.hexdigest()[:20]
+
+
+def render(img: Image.Image, side: int) -> bytes:
+    thumb = img.copy()
+    thumb.thumbnail((side, side), Image.LANCZOS)
+    if thumb.mode not in ('RGB', 'RGBA') or FORMAT == 'JPEG':
+        thumb = thumb.convert('RGB')
+    out = BytesIO()
+    thumb.save(out, FORMAT, quality=QUALITY)
+    return out.getvalue()
+
+
+def generate(instance: models.Model) -> Dict[str, str]:
+    """Write the derivatives of instance.image; returns the new `thumbnails` value."""
+    field = instance.image
+    storage = field.storage
+    with field.open('rb') as f:
+        digest = content_hash(f)
+        f.seek(0)
+        with Image.open(f) as img:
+            img = ImageOps.exif_transpose(img)
+            img.load()
+
+    folder = posixpath.join(posixpath.dirname(field.name), 'thumbs')
+    thumbnails = {'src': field.name}
+    for size, side in SIZES.items():
+        name = posixpath.join(folder, f'{digest}_{size}.{EXT}')
+        if not storage.exists(name):  # same content, same name: nothing to do
+            name = storage.save(name, ContentFile(render(img, side)))
+        thumbnails[size] = name
+    return thumbnails
+
+
+def refresh(model: Type[models.Model], pk: int) -> Optional[Dict[str, str]]:
+    """(Re)build thumbnails of one row unless they are current."""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.image or instance.has_thumbnails():
+        return None
+    thumbnails = generate(instance)
+    # Only if the image was not replaced meanwhile
+    if model.objects.filter(pk=pk, image=thumbnails['src']).update(thumbnails=thumbnails):
+        release(instance.thumbnails)  # derivatives of the previous image (e.g. before a rotation)
+    return thumbnails
+
+
+def release(*thumbnail_sets: Dict[str, str]) -> int:
+    """Delete derivative files no row references any more; call after deleting rows."""
+    from .models import Photo, PhotoBuffer
+
+    storage = Photo._meta.get_field('image').storage
+    removed = 0
+    for thumbnails in thumbnail_sets:
+        for size in SIZES:
+            name = (thumbnails or {}).get(size)
+            if not name:
+                continue
+            if any(m.objects.filter(**{f'thumbnails__{size}': name}).exists() for m in (Photo, PhotoBuffer)):
+                continue  # same content elsewhere (e.g. a re-uploaded album)
+            try:
+                storage.delete(name)
+                removed += 1
+            except Exception as e:
+                print(f"Thumbnails: could not delete {name}: {e}")
+    return removed
+
+
+class ThumbnailWorker:
+    """One daemon thread working through (model, pk) jobs."""
+
+    def __init__(self):
+        self.jobs: 'queue.Queue[Tuple[Type[models.Model], int]]' = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, model: Type[models.Model], pks: Iterable[int]) -> None:
+        for pk in pks:
+            self.jobs.put((model, pk))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='thumbnails', daemon=True)
+                self._thread.start()
+
+    def run(self) -> None:
+        while True:
+            model, pk = self.jobs.get()
+            try:
+                refresh(model, pk)
+            except Exception as e:
+                print(f"Thumbnails: {model.__name__} {pk} failed: {e}")
+            finally:
+                if self.jobs.empty():
+                    close_old_connections()
+
+
+worker = ThumbnailWorker()
+
+
+def schedule(model: Type[models.Model], pks: Iterable[int]) -> None:
+    """Generate thumbnails in the background once the current transaction commits."""
+    pks = [pk for pk in pks if pk is not None]
+    if pks and THUMBNAILS_THREAD:
+        transaction.on_commit(lambda: worker.submit(model, pks))
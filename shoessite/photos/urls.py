@@ -16,12 +16,14 @@ urlpatterns = [
     path('api/delete-card-by-correlation/<str:correlation_id>/', views.delete_card_by_correlation, name='delete_card_by_correlation'),
     path('api/delete-buffer-photo/<int:photo_id>/', views.delete_buffer_photo, name='delete_buffer_photo'),
     path('api/get-last-card/', views.get_last_card, name='get_last_card'),
+    path('api/lookup/', views.lookup_cards, name='lookup_cards'),
     path('admin/process-task/<int:task_id>/', views.process_task, name='process_task'),
     path('card/<int:card_id>/', views.product_card_detail, name='product_card_detail'),
     path('api/search-barcode/', views.search_by_barcode, name='search_by_barcode'),
     path('api/reprocess-photo/<int:photo_id>/', views.reprocess_photo, name='reprocess_photo'),
     path('api/generate-from-instruction/<int:card_id>/', views.generate_from_instruction_api, name='generate_from_instruction'),
     path('api/generate-summary/<int:card_id>/', views.generate_summary_api, name='generate_summary'),
+    path('api/ai-suggestions/<int:card_id>/', views.ai_suggestions_api, name='ai_suggestions'),
     path('api/search-stock-photos/<int:card_id>/', views.search_stock_photos_api, name='search_stock_photos'),
     path('api/upload-photo-from-computer/<int:card_id>/', views.upload_photo_from_computer, name='upload_photo_from_computer'),
     path('api/add-photo-from-url/<int:card_id>/', views.add_photo_from_url, name='add_photo_from_url'),
@@ -7,14 +7,19 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.http import require_http_methods as require_methods
 from .models import PhotoBatch, Photo, BarcodeResult, ProcessingTask, PhotoBuffer
-from django.db.models import Max
+from .ingest import ingest_batch
+from .fanout import fan_out
+from .lookup import lookup
+from . import stock_photos
+from .outbox import enqueue_card
+from .thumbnails import release as release_thumbnails
+from django.db.models import Max, Q
 import json
 
-try:
-    from .ai_helpers import auto_fill_product_card
-except ImportError:
-    def auto_fill_product_card(data):
-        return {}
+from .ai_suggestions import (
+    clear_failed as clear_failed_ai_suggestions, enabled as ai_suggestions_enabled, failed as ai_suggestions_failed,
+    is_current as is_current_ai_suggestions, schedule as schedule_ai_suggestions,
+)
 import uuid
 import base64
 import requests
@@ -24,6 +29,7 @@ import re
 from bs4 import BeautifulSoup
 from io import BytesIO
 from PIL import Image
+from shoesbot.endpoints import CUSTOMSEARCH_URL, OPENAI_CHAT_URL, vision_annotate_url
 
 # Загружаем переменные окружения из .env
 try:
@@ -58,87 +64,27 @@ def upload_batch(request):
         if not chat_id or not photos_data:
             return JsonResponse({'error': 'chat_id and photos required'}, status=400)
         
-        # Create or get batch
-        batch, created = PhotoBatch.objects.get_or_create(
-            correlation_id=correlation_id,
-            defaults={
-                'chat_id': chat_id,
-                'message_ids': message_ids,
-                'status': 'processed' if barcodes else 'pending',
-            }
-        )
-        
-        if not created:
-            batch.message_ids = message_ids
-            batch.status = 'processed' if barcodes else 'pending'
-            batch.processed_at = timezone.now()
-            batch.save()
-        
-        # Process photos
-        photo_objects = []
-        for idx, photo_data in enumerate(photos_data):
-            file_id = photo_data.get('file_id')
-            message_id = photo_data.get('message_id')
-            image_data = photo_data.get('image')  # base64 encoded
-            
-            if not file_id or not image_data:
-                continue
-            
-            # Decode base64 image
-            try:
-                image_bytes = base64.b64decode(image_data.split(',')[-1] if ',' in image_data else image_data)
-                photo = Photo.objects.create(
-                    batch=batch,
-                    file_id=file_id,
-                    message_id=message_id,
-                )
-                photo.image.save(
-                    f'{correlation_id}_{idx}.jpg',
-                    ContentFile(image_bytes),
-                    save=True
-                )
-                photo_objects.append(photo)
-            except Exception as e:
-                print(f"Error processing photo {idx}: {e}")
-                continue
-        
-        # Save barcodes
-        barcode_count = 0
-        for barcode_data in barcodes:
-            photo_idx = barcode_data.get('photo_index', 0)
-            if photo_idx < len(photo_objects):
-                BarcodeResult.objects.get_or_create(
-                    photo=photo_objects[photo_idx],
-                    symbology=barcode_data.get('symbology', ''),
-                    data=barcode_data.get('data', ''),
-                    defaults={
-                        'source': barcode_data.get('source', 'unknown'),
-                    }
-                )
-                barcode_count += 1
+        # Files first, then batch + photos + barcodes in one transaction
+        report = ingest_batch(correlation_id, chat_id, message_ids, photos_data, barcodes)
+        batch = report.batch
+        for photo_report in report.photos:
+            if photo_report.error:
+                print(f"Error processing photo {photo_report.index}: {photo_report.error}")
         
-        # Автоматически отправляем в Pochtoy API
-        pochtoy_message = None
+        # Pochtoy получает карточку в фоне (outbox), результат придёт в чат отдельным сообщением
+        pochtoy_status = 'error'
         try:
-            from .pochtoy_integration import send_card_to_pochtoy
-            pochtoy_result = send_card_to_pochtoy(batch)
-            print(f"Pochtoy auto-send result: {pochtoy_result}")
-            
-            if pochtoy_result:
-                if pochtoy_result.get('success'):
-                    pochtoy_message = f"✅ {pochtoy_result.get('message', 'Товар успешно добавлен')}"
-                else:
-                    pochtoy_message = f"❌❌❌\n\nОшибка Pochtoy:\n{pochtoy_result.get('error', 'Неизвестная ошибка')}"
+            pochtoy_status = enqueue_card(batch).status
         except Exception as e:
-            print(f"Pochtoy auto-send error: {e}")
-            pochtoy_message = f"❌❌❌\n\nPochtoy недоступен:\n{str(e)}"
+            print(f"Pochtoy outbox enqueue error: {e}")
         
         return JsonResponse({
             'success': True,
             'correlation_id': correlation_id,
-            'photos_saved': len(photo_objects),
-            'barcodes_saved': barcode_count,
-            'pochtoy_message': pochtoy_message,  # Для Telegram бота
+            'photos_saved': report.photos_saved,
+            'barcodes_saved': report.barcodes_saved,
+            'photos': [p.as_dict() for p in report.photos],
+            'pochtoy': pochtoy_status,
         })
         
     except Exception as e:
@@ -192,7 +138,7 @@ def process_google_vision(photo):
         image_bytes = f.read()
     
     img_b64 = base64.b64encode(image_bytes).decode('utf-8')
-    url = f'https://vision.googleapis.com/v1/images:annotate?key={api_key}'
+    url = vision_annotate_url(api_key)
     
     payload = {
         'requests': [{
@@ -292,32 +238,16 @@ def product_card_detail(request, card_id):
     gg_labels = card.get_gg_labels()
     all_barcodes = card.get_all_barcodes()
     
-    # Автозаполнение через AI (если есть OpenAI ключ) - всегда вызываем
-    ai_suggestions = {}
+    # AI подсказки считаются в фоне при создании карточки и изменении фото (ai_suggestions.py)
+    ai_suggestions = card.ai_suggestions
     ai_summary = card.ai_summary if card.ai_summary else None
-    
-    if 'OPENAI_API_KEY' in os.environ:
-        try:
-            barcodes_data = [{'data': b.data, 'source': b.source} for b in all_barcodes[:3]]
-            # Получаем URL фото для анализа
-            photo_urls = []
-            for photo in photos:
-                if photo.image:
-                    # Формируем полный URL
-                    request_scheme = request.scheme if hasattr(request, 'scheme') else 'http'
-                    request_host = request.get_host() if hasattr(request, 'get_host') else 'localhost:8000'
-                    photo_url = f"{request_scheme}://{request_host}{photo.image.url}"
-                    photo_urls.append(photo_url)
-                    print(f"Photo URL: {photo_url}")
-            
-            ai_suggestions = auto_fill_product_card({
-                'barcodes': barcodes_data,
-                'brand': card.brand,
-            }, photo_urls=photo_urls)
-        except Exception as e:
-            print(f"Ошибка AI автозаполнения: {e}")
-            import traceback
-            traceback.print_exc()
+    ai_suggestions_pending = ai_suggestions_enabled() and not is_current_ai_suggestions(card)
+    # Недавняя неудача: показываем ошибку, повтор не чаще RETRY_AFTER
+    ai_suggestions_error = ai_suggestions_pending and ai_suggestions_failed(card)
+    if ai_suggestions_error:
+        ai_suggestions_pending = False
+    elif ai_suggestions_pending:
+        schedule_ai_suggestions(card.id)
     
     return render(request, 'photos/product_card.html', {
         'card': card,
@@ -325,6 +255,8 @@ def product_card_detail(request, card_id):
         'gg_labels': gg_labels,
         'all_barcodes': all_barcodes,
         'ai_suggestions': ai_suggestions,
+        'ai_suggestions_pending': ai_suggestions_pending,
+        'ai_suggestions_error': ai_suggestions_error,
         'ai_summary': ai_summary,
     })
 
@@ -339,36 +271,34 @@ def search_by_barcode(request):
         return JsonResponse({'error': 'Barcode required'}, status=400)
     
     try:
-        # Пробуем несколько источников
+        # Все источники запускаются сразу, общий дедлайн; результаты кэшируются по баркоду
+        sources = [
+            ('lens', lambda: search_with_google_lens(barcode, card_id)),
+            ('google_images', lambda: search_google_images(barcode)),
+            ('product_info', lambda: search_product_info(barcode)),
+            ('bing_images', lambda: search_bing_images(barcode)),
+        ]
         results = {}
-        
-        # 1. Google Lens / Vision API web detection - используем фото из карточки
-        lens_results = search_with_google_lens(barcode, card_id)
-        if lens_results:
-            results.update(lens_results)
-        
-        # 2. Google Images по баркоду
-        if 'images' not in results or not results.get('images'):
-            images = search_google_images(barcode)
-            if images:
-                if 'images' not in results:
-                    results['images'] = []
-                results['images'].extend(images)
-        
-        # 3. Поиск через Google Shopping / OpenAI / обычный поиск
-        product_info = search_product_info(barcode)
-        # Объединяем результаты, но не перезаписываем то что уже есть от Lens
-        for key, value in product_info.items():
-            if key not in results or not results.get(key):
-                results[key] = value
-        
-        # 4. Поиск через Bing Images (резервный вариант)
-        if 'images' not in results or len(results.get('images', [])) < 3:
-            bing_images = search_bing_images(barcode)
-            if bing_images:
-                if 'images' not in results:
-                    results['images'] = []
-                results['images'].extend(bing_images[:3])
+        # Сливаем в порядке приоритета, как раньше при последовательных запросах
+        for name, found in fan_out(sources, cache_prefix=f'barcode-search:{barcode}:{card_id}'):
+            if not found:
+                continue
+            if name == 'lens':
+                # 1. Google Lens / Vision API web detection - фото из карточки
+                results.update(found)
+            elif name == 'google_images':
+                # 2. Google Images - если Lens не дал картинок
+                if not results.get('images'):
+                    results.setdefault('images', []).extend(found)
+            elif name == 'product_info':
+                # 3. Google Shopping / OpenAI / поиск - не перезаписываем то что уже есть от Lens
+                for key, value in found.items():
+                    if key not in results or not results.get(key):
+                        results[key] = value
+            elif name == 'bing_images':
+                # 4. Bing Images (резервный вариант)
+                if len(results.get('images', [])) < 3:
+                    results.setdefault('images', []).extend(found[:3])
         
         return JsonResponse(results)
         
@@ -388,7 +318,7 @@ def search_google_images(barcode):
         # Fallback: используем простой веб-поиск
         return search_google_images_web(barcode)
     
-    url = f'https://www.googleapis.com/customsearch/v1'
+    url = CUSTOMSEARCH_URL
     params = {
         'key': api_key,
         'cx': search_engine_id,
@@ -480,7 +410,7 @@ def search_with_google_lens(barcode, card_id=None):
         # Также пробуем поиск через Custom Search API с Google Lens подходом
         search_engine_id = os.getenv('GOOGLE_CUSTOM_SEARCH_ENGINE_ID')
         if search_engine_id:
-            url = 'https://www.googleapis.com/customsearch/v1'
+            url = CUSTOMSEARCH_URL
             params = {
                 'key': api_key,
                 'cx': search_engine_id,
@@ -537,7 +467,7 @@ def search_product_with_vision_api(image_path):
             image_bytes = f.read()
         
         img_b64 = base64.b64encode(image_bytes).decode('utf-8')
-        url = f'https://vision.googleapis.com/v1/images:annotate?key={api_key}'
+        url = vision_annotate_url(api_key)
         
         payload = {
             'requests': [{
@@ -653,7 +583,7 @@ def search_product_info(barcode):
         search_engine_id = os.getenv('GOOGLE_CUSTOM_SEARCH_ENGINE_ID')
         
         if api_key and search_engine_id:
-            url = 'https://www.googleapis.com/customsearch/v1'
+            url = CUSTOMSEARCH_URL
             params = {
                 'key': api_key,
                 'cx': search_engine_id,
@@ -735,78 +665,25 @@ def search_product_info(barcode):
 @require_http_methods(["POST"])
 def reprocess_photo(request, photo_id):
     """Повторная обработка фото для поиска баркодов."""
+    # Импорт здесь: shoesbot.logging_setup создаёт bot.log и поток логирования, Django это нужно только тут
+    from shoesbot import decode_client
+
     photo = get_object_or_404(Photo, id=photo_id)
     
     try:
-        # Добавляем путь к shoesbot в sys.path
-        import sys
-        # Путь к корню проекта (где находится shoesbot)
-        current_file = os.path.abspath(__file__)  # shoessite/photos/views.py
-        project_root = os.path.abspath(os.path.join(current_file, '../../'))  # ~/Projects/shoesbot
-        if project_root not in sys.path:
-            sys.path.insert(0, project_root)
-        
-        from PIL import Image
-        import asyncio
-        from io import BytesIO
-        
         # Читаем изображение
         with photo.image.open('rb') as f:
             image_bytes = f.read()
-            image = Image.open(BytesIO(image_bytes))
-            image.load()
         
-        # Пробуем импортировать декодеры
-        import_error = None
-        try:
-            from shoesbot.pipeline import DecoderPipeline
-            from shoesbot.decoders.gg_label_decoder import GGLabelDecoder
-            from shoesbot.decoders.vision_decoder import VisionDecoder
-            from shoesbot.decoders.zbar_decoder import ZBarDecoder
-            from shoesbot.decoders.cv_qr_decoder import OpenCvQrDecoder
-            from shoesbot.decoders.openai_barcode_decoder import OpenAIBarcodeDecoder
-            
-            # Инициализируем декодеры (включая OpenAI для веб-интерфейса)
-            decoders = [
-                ZBarDecoder(),
-                OpenCvQrDecoder(),
-                VisionDecoder(),
-                GGLabelDecoder(),
-                OpenAIBarcodeDecoder(),  # Только для веб-интерфейса
-            ]
-            
-            pipeline = DecoderPipeline(decoders)
-            
-            # Запускаем обработку
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                results = loop.run_until_complete(pipeline.run_smart_parallel_debug(image))
-            finally:
-                loop.close()
-            
-            print(f"Pipeline results: {len(results)} codes found")
-                
-        except ImportError as e:
-            import_error = str(e)
-            print(f"Import error: {e}")
-            # Если не можем импортировать декодеры, используем прямые вызовы API
-            results = []
-            # Пробуем Google Vision API напрямую
-            print("Trying Google Vision API directly...")
-            vision_results = process_with_google_vision_direct(image, image_bytes)
-            print(f"Google Vision found: {len(vision_results)} codes")
-            results.extend(vision_results)
-            # Пробуем OpenAI Vision (если доступен)
-            print("Trying OpenAI Vision...")
-            openai_results = process_with_openai_vision(image, image_bytes)
-            print(f"OpenAI Vision found: {len(openai_results)} codes")
-            results.extend(openai_results)
+        # Тёплые декодеры: демон декодирования (DECODE_SERVICE_URL) или пайплайн этого процесса
+        results, _ = decode_client.decode(image_bytes, mode='smart', photo_index=photo.order)
+        print(f"Pipeline results: {len(results)} codes found")
         
-        # Если результатов нет, пробуем API напрямую в любом случае
-        if not results and not import_error:
+        # Если результатов нет, пробуем API напрямую
+        if not results:
             print("No results from pipeline, trying direct API calls...")
+            image = Image.open(BytesIO(image_bytes))
+            image.load()
             vision_results = process_with_google_vision_direct(image, image_bytes)
             results.extend(vision_results)
             openai_results = process_with_openai_vision(image, image_bytes)
@@ -827,19 +704,25 @@ def reprocess_photo(request, photo_id):
                 source = result.source
                 symbology = result.symbology
                 data = result.data
+                bbox = list(result.bbox) if result.bbox else None
+                confidence = result.confidence
             else:
                 # Это словарь
                 key = (result.get('symbology', ''), result.get('data', ''))
                 source = result.get('source', 'unknown')
                 symbology = result.get('symbology', '')
                 data = result.get('data', '')
+                bbox = result.get('bbox')
+                confidence = result.get('confidence')
             
             if key not in existing_barcodes and data:
                 BarcodeResult.objects.create(
                     photo=photo,
                     symbology=symbology,
                     data=data,
-                    source=source
+                    source=source,
+                    bbox=bbox,
+                    confidence=confidence,
                 )
                 barcodes_found.append(f"{symbology}: {data} ({source})")
                 existing_barcodes.add(key)
@@ -863,7 +746,7 @@ def reprocess_photo(request, photo_id):
             'total_results': len(results),
             'api_info': api_info,
             'debug_info': {
-                'used_pipeline': 'decoders' if 'pipeline' in locals() else 'direct_api',
+                'used_pipeline': 'decode_service' if decode_client.client else 'decoders',
                 'google_vision_called': 'GOOGLE_VISION_API_KEY' in os.environ,
                 'openai_called': 'OPENAI_API_KEY' in os.environ,
             }
@@ -896,30 +779,28 @@ def process_with_google_vision_direct(image, image_bytes):
         from PIL import Image, ImageEnhance
         from io import BytesIO
         
-        # Предобработка изображения для лучшего OCR
-        # Увеличиваем разрешение для лучшего распознавания
-        proc_img = image
-        target_size = 2000  # Увеличиваем до 2000px для лучшего качества
-        if image.width < target_size:
-            ratio = target_size / float(image.width)
-            new_size = (int(image.width * ratio), int(image.height * ratio))
-            proc_img = image.resize(new_size, Image.LANCZOS)  # LANCZOS лучше для текста
-            print(f"Изображение увеличено с {image.width}x{image.height} до {proc_img.width}x{proc_img.height}")
-        
-        # Увеличиваем контраст и резкость
-        proc_img = ImageEnhance.Contrast(proc_img).enhance(1.5)  # Увеличили до 1.5
-        proc_img = ImageEnhance.Sharpness(proc_img).enhance(1.2)  # Добавили резкость
-        
-        print(f"Изображение обработано: контраст +50%, резкость +20%")
-        
-        # Сохраняем обработанное изображение
-        buf = BytesIO()
-        proc_img.save(buf, format='PNG')
-        proc_bytes = buf.getvalue()
+        # Предобработка изображения для лучшего OCR:
+        # увеличиваем до 2000px (LANCZOS), контраст +50%, резкость +20%
+        try:
+            from shoesbot.preprocess import prepare
+            proc_bytes = prepare(image, image_bytes).encoded('vision_direct', 'PNG')
+        except ImportError:
+            proc_img = image
+            target_size = 2000
+            if image.width < target_size:
+                ratio = target_size / float(image.width)
+                new_size = (int(image.width * ratio), int(image.height * ratio))
+                proc_img = image.resize(new_size, Image.LANCZOS)  # LANCZOS лучше для текста
+            proc_img = ImageEnhance.Contrast(proc_img).enhance(1.5)
+            proc_img = ImageEnhance.Sharpness(proc_img).enhance(1.2)
+            buf = BytesIO()
+            proc_img.save(buf, format='PNG')
+            proc_bytes = buf.getvalue()
+        print(f"Изображение обработано: {image.width}x{image.height}, {len(proc_bytes)} байт")
         
         # Кодируем изображение
         img_b64 = base64.b64encode(proc_bytes).decode('utf-8')
-        url = f'https://vision.googleapis.com/v1/images:annotate?key={api_key}'
+        url = vision_annotate_url(api_key)
         
         payload = {
             'requests': [{
@@ -1136,7 +1017,7 @@ def process_with_openai_vision(image, image_bytes):
         
         # Кодируем изображение
         img_b64 = base64.b64encode(image_bytes).decode('utf-8')
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = OPENAI_CHAT_URL
         
         headers = {
             'Authorization': f'Bearer {api_key}',
@@ -1213,6 +1094,28 @@ def process_with_openai_vision(image, image_bytes):
     return results
 
 
+@staff_member_required
+@require_http_methods(["GET", "POST"])
+def ai_suggestions_api(request, card_id):
+    """GET - сохранённые AI подсказки карточки, POST - пересчитать заново (в фоне)."""
+    card = get_object_or_404(PhotoBatch, id=card_id)
+    if request.method == 'POST':
+        if not ai_suggestions_enabled():
+            return JsonResponse({'success': False, 'error': 'OPENAI_API_KEY не задан'}, status=400)
+        PhotoBatch.objects.filter(pk=card.pk).update(ai_suggestions_key='')
+        clear_failed_ai_suggestions(card)
+        schedule_ai_suggestions(card.id, force=True)
+        return JsonResponse({'success': True, 'queued': True})
+    current = is_current_ai_suggestions(card)
+    return JsonResponse({
+        'success': True,
+        'current': current,
+        'failed': not current and ai_suggestions_failed(card),
+        'suggestions': card.ai_suggestions,
+        'generated_at': card.ai_suggestions_at.isoformat() if card.ai_suggestions_at else None,
+    })
+
+
 @staff_member_required
 @require_http_methods(["POST"])
 def generate_summary_api(request, card_id):
@@ -1356,160 +1259,21 @@ def generate_from_instruction_api(request, card_id):
 
 def search_stock_photos(query, photo_paths=None):
     """Поиск стоковых фото товара по запросу и фото товара."""
-    images = []
-    seen_urls = set()
-    
-    # 1. Google Vision API Web Detection (Google Lens) - используем фото товара
-    if photo_paths:
-        for photo_path in photo_paths[:2]:  # Берем первые 2 фото
-            try:
-                vision_results = search_product_with_vision_api(photo_path)
-                if vision_results.get('images'):
-                    for img_url in vision_results['images']:
-                        if img_url and img_url.startswith('http') and img_url not in seen_urls:
-                            images.append({
-                                'url': img_url,
-                                'thumbnail': img_url,
-                                'title': vision_results.get('title', ''),
-                                'source': 'google_lens'
-                            })
-                            seen_urls.add(img_url)
-                            if len(images) >= 12:
-                                break
-            except Exception as e:
-                print(f"Error in Google Vision search: {e}")
-            
-            if len(images) >= 12:
-                break
-    
-    # 2. Google Custom Search API (если есть)
-    api_key = os.getenv('GOOGLE_CUSTOM_SEARCH_API_KEY')
-    search_engine_id = os.getenv('GOOGLE_CUSTOM_SEARCH_ENGINE_ID')
-    
-    if api_key and search_engine_id and len(images) < 12:
-        # Формируем несколько вариантов запросов
-        search_queries = [
-            query,
-            f'{query} product',
-            f'{query} official',
-            f'{query} brand',
-        ]
-        
-        for search_query in search_queries:
-            if len(images) >= 12:
-                break
-                
-            url = 'https://www.googleapis.com/customsearch/v1'
-            params = {
-                'key': api_key,
-                'cx': search_engine_id,
-                'q': search_query,
-                'searchType': 'image',
-                'num': 10,
-                'safe': 'active',
-                'imgSize': 'large',
-                'imgType': 'photo',
-            }
-            
-            try:
-                resp = requests.get(url, params=params, timeout=10)
-                if resp.ok:
-                    data = resp.json()
-                    for item in data.get('items', []):
-                        img_url = item.get('link', '')
-                        if img_url and img_url.startswith('http') and img_url not in seen_urls:
-                            images.append({
-                                'url': img_url,
-                                'thumbnail': item.get('image', {}).get('thumbnailLink', img_url),
-                                'title': item.get('title', ''),
-                                'source': 'google'
-                            })
-                            seen_urls.add(img_url)
-                            if len(images) >= 12:
-                                break
-            except Exception as e:
-                print(f"Error searching Google Images: {e}")
-    
-    # 3. Прямой поиск через Google Images (если Custom Search не работает)
-    if len(images) < 8:
-        try:
-            # Используем DuckDuckGo Image Search API (бесплатный)
-            ddg_url = 'https://api.duckduckgo.com/'
-            params = {
-                'q': f'{query} product',
-                'iax': 'images',
-                'ia': 'images',
-            }
-            resp = requests.get(ddg_url, params=params, timeout=10)
-            if resp.ok:
-                # DuckDuckGo возвращает HTML, парсим его
-                soup = BeautifulSoup(resp.text, 'html.parser')
-                for img in soup.find_all('img', limit=10):
-                    src = img.get('src')
-                    if src and src.startswith('http') and src not in seen_urls:
-                        images.append({
-                            'url': src,
-                            'thumbnail': src,
-                            'title': img.get('alt', ''),
-                            'source': 'duckduckgo'
-                        })
-                        seen_urls.add(src)
-                        if len(images) >= 12:
-                            break
-        except Exception as e:
-            print(f"Error searching DuckDuckGo: {e}")
-    
-    # 4. Bing Images (fallback)
-    if len(images) < 8:
-        try:
-            import urllib.parse
-            search_url = f'https://www.bing.com/images/search?q={urllib.parse.quote(query + " product")}&qft=+filterui:imagesize-large'
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            resp = requests.get(search_url, headers=headers, timeout=10)
-            if resp.ok:
-                soup = BeautifulSoup(resp.text, 'html.parser')
-                # Ищем изображения в data-src и src атрибутах
-                for img in soup.find_all('img', limit=20):
-                    src = img.get('data-src') or img.get('src')
-                    if src and src.startswith('http') and 'bing.com' not in src and src not in seen_urls:
-                        # Фильтруем маленькие иконки
-                        if 'icon' not in src.lower() and 'logo' not in src.lower():
-                            images.append({
-                                'url': src,
-                                'thumbnail': src,
-                                'title': img.get('alt', ''),
-                                'source': 'bing'
-                            })
-                            seen_urls.add(src)
-                            if len(images) >= 12:
-                                break
-        except Exception as e:
-            print(f"Error searching Bing Images: {e}")
-    
-    return images[:12]
+    return stock_photos.search(query, photo_paths)
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def search_stock_photos_api(request, card_id):
     """API для поиска стоковых фото товара."""
-    print(f"\n{'='*70}")
-    print(f"🚀 STOCK PHOTOS SEARCH STARTED for card_id={card_id}")
-    print(f"{'='*70}\n")
-    
+    print(f"\n🚀 STOCK PHOTOS SEARCH for card_id={card_id}")
+
     try:
         card = get_object_or_404(PhotoBatch, id=card_id)
         search_barcode = request.GET.get('barcode', None)
         barcodes = card.get_all_barcodes()
-        
-        print(f"📋 Card: title={card.title}, brand={card.brand}, barcodes={len(barcodes)}")
-        
-        # Шаг 1: Определяем товар через OpenAI Vision (анализ фото)
-        product_description = None
+
         photo_paths = []
-        
         for photo in card.photos.all()[:2]:
             if photo.image:
                 try:
@@ -1518,194 +1282,16 @@ def search_stock_photos_api(request, card_id):
                         photo_paths.append(photo_path)
                 except:
                     pass
-        
-        if photo_paths:
-            try:
-                import base64
-                api_key = os.getenv('OPENAI_API_KEY')
-                if api_key:
-                    print(f"🔍 Analyzing {len(photo_paths)} photos with OpenAI Vision...")
-                    
-                    with open(photo_paths[0], 'rb') as f:
-                        img_bytes = f.read()
-                        b64_img = base64.b64encode(img_bytes).decode('utf-8')
-                    
-                    vision_prompt = '''Определи товар на фото максимально точно для поиска стоковых фото.
 
-Верни: "Бренд тип_товара цвет особенности"
-Пример: "Stone Island crew neck sweater black logo patch"
+        result = stock_photos.search_card(
+            card.title, card.brand,
+            search_barcode or (barcodes[0].data if barcodes else None),
+            photo_paths,
+        )
+        print(f"✅ Final: {result['debug']['final_count']} images, sources {result['debug']['sources']}"
+              f"{' (cached)' if result['debug']['cached'] else ''}")
+        return JsonResponse({'success': True, **result})
 
-КРИТИЧНО:
-- Если Stone Island (компас) - ОБЯЗАТЕЛЬНО включи бренд
-- НЕ упоминай упаковку/пакет/barcode - опиши САМ ТОВАР
-- Фокус на продукте, а не на том, как он упакован'''
-                    
-                    resp = requests.post('https://api.openai.com/v1/chat/completions', 
-                        json={
-                            'model': 'gpt-4o',
-                            'messages': [{
-                                'role': 'user',
-                                'content': [
-                                    {'type': 'text', 'text': vision_prompt},
-                                    {'type': 'image_url', 'image_url': {'url': f'data:image/jpeg;base64,{b64_img}'}}
-                                ]
-                            }],
-                            'max_tokens': 80,
-                            'temperature': 0.2
-                        },
-                        headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
-                        timeout=15
-                    )
-                    
-                    if resp.ok:
-                        product_description = resp.json().get('choices', [{}])[0].get('message', {}).get('content', '').strip().strip('"').strip("'")
-                        print(f"✅ OpenAI Vision identified: '{product_description}'")
-            except Exception as e:
-                print(f"❌ Error in OpenAI Vision: {e}")
-        
-        # Шаг 2: Формируем поисковый запрос (убираем баркоды/цифры)
-        query = product_description or card.title or (card.brand + ' product' if card.brand else 'product')
-        
-        # Очищаем от баркодов и упаковочных слов
-        import re
-        query = re.sub(r'\b\d{8,}\b', '', query)  # Убираем длинные числа
-        query = re.sub(r'\b(packaged|packaging|package|plastic|bag|box|boxed|wrapped)\b', '', query, flags=re.IGNORECASE)
-        query = ' '.join(query.split())  # Убираем лишние пробелы
-        
-        print(f"📝 Search query (cleaned): '{query}'")
-        
-        # Шаг 3: Ищем фото из разных источников
-        all_images = []
-        
-        # 3.1. eBay (передаём результат Vision или card.title)
-        print(f"\n🛒 Searching eBay...")
-        try:
-            from .ai_helpers import search_products_on_ebay
-            ebay_result = search_products_on_ebay(
-                brand=card.brand,
-                title=query,  # Используем результат Vision
-                barcode=search_barcode or (barcodes[0].data if barcodes else None)
-            )
-            if ebay_result and ebay_result.get('images'):
-                for img_url in ebay_result['images']:
-                    all_images.append({
-                        'url': img_url,
-                        'thumbnail': img_url,
-                        'title': f"eBay ({ebay_result.get('price', 'N/A')} USD)",
-                        'source': 'ebay'
-                    })
-                print(f"✅ eBay: {len(ebay_result['images'])} images")
-            else:
-                print(f"⚠️ eBay: no results")
-        except Exception as e:
-            print(f"❌ eBay error: {e}")
-        
-        # 3.2. Google Lens (Vision Web Detection) - ТОЛЬКО fullMatchingImages
-        print(f"\n🔍 Searching Google Lens...")
-        if photo_paths:
-            try:
-                vision_results = search_product_with_vision_api(photo_paths[0])
-                if vision_results.get('images'):
-                    for img_url in vision_results['images'][:10]:
-                        all_images.append({
-                            'url': img_url,
-                            'thumbnail': img_url,
-                            'title': vision_results.get('title', ''),
-                            'source': 'google_lens'
-                        })
-                    print(f"✅ Google Lens: {len(vision_results['images'])} images")
-                else:
-                    print(f"⚠️ Google Lens: no results")
-            except Exception as e:
-                print(f"❌ Google Lens error: {e}")
-        
-        # 3.3. Google Custom Search
-        print(f"\n🔎 Searching Google Custom Search...")
-        api_key = os.getenv('GOOGLE_CUSTOM_SEARCH_API_KEY')
-        cx = os.getenv('GOOGLE_CUSTOM_SEARCH_ENGINE_ID')
-        
-        if api_key and cx:
-            try:
-                resp = requests.get('https://www.googleapis.com/customsearch/v1', params={
-                    'key': api_key,
-                    'cx': cx,
-                    'q': query,
-                    'searchType': 'image',
-                    'num': 10,
-                    'safe': 'active',
-                    'imgSize': 'large'
-                }, timeout=10)
-                
-                print(f"📡 CSE response: {resp.status_code}")
-                
-                if resp.ok:
-                    data = resp.json()
-                    items = data.get('items', [])
-                    print(f"✅ CSE: {len(items)} items")
-                    for item in items:
-                        all_images.append({
-                            'url': item.get('link'),
-                            'thumbnail': item.get('image', {}).get('thumbnailLink', item.get('link')),
-                            'title': item.get('title', ''),
-                            'source': 'google'
-                        })
-                else:
-                    error_text = resp.text[:200]
-                    print(f"❌ CSE error {resp.status_code}: {error_text}")
-            except Exception as e:
-                print(f"❌ CSE exception: {e}")
-        else:
-            print(f"⚠️ CSE: API key or CX missing")
-        
-        # Шаг 4: Фильтрация и дедупликация
-        print(f"\n🧹 Filtering {len(all_images)} total images...")
-        
-        excluded_domains = [
-            'instagram.com', 'facebook.com', 'fbsbx.com', 'linkedin.com',
-            'media.licdn.com', 'tiktok.com', 'twitter.com', 'pinterest.com',
-            'lookaside.instagram.com', 'lookaside.fbsbx.com'
-        ]
-        
-        seen_urls = set()
-        unique_images = []
-        filtered_count = 0
-        
-        for img in all_images:
-            url = img.get('url', '')
-            if not url or url in seen_urls:
-                continue
-            
-            # Фильтруем соцсети
-            is_social = any(domain in url.lower() for domain in excluded_domains)
-            if is_social:
-                filtered_count += 1
-                continue
-            
-            seen_urls.add(url)
-            unique_images.append(img)
-        
-        # Подсчёт источников
-        sources = {}
-        for img in unique_images:
-            src = img.get('source', 'unknown')
-            sources[src] = sources.get(src, 0) + 1
-        
-        print(f"✅ Final: {len(unique_images)} images (filtered {filtered_count})")
-        print(f"📊 Sources: {sources}")
-        
-        return JsonResponse({
-            'success': True,
-            'images': unique_images[:12],
-            'query': query,
-            'debug': {
-                'total_found': len(all_images),
-                'filtered_out': filtered_count,
-                'final_count': len(unique_images),
-                'sources': sources,
-                'version': 'v4.0_simplified'
-            }
-        })
-        
     except Exception as e:
         import traceback
         print(f"Error in search_stock_photos_api: {e}")
@@ -1953,6 +1539,7 @@ def delete_photo(request, photo_id):
         
         # Удаляем объект Photo (баркоды удалятся каскадно)
         photo.delete()
+        release_thumbnails(photo.thumbnails)
         
         return JsonResponse({
             'success': True,
@@ -2329,7 +1916,8 @@ def sorting_view(request):
     for p in photos:
         photos_data.append({
             'id': p.id,
-            'image_url': p.image.url if p.image else '',
+            'image_url': p.thumbnail_url('sm'),
+            'full_url': p.image.url if p.image else '',
             'gg_label': p.gg_label,
             'barcode': p.barcode,
             'group_id': p.group_id,
@@ -2453,7 +2041,7 @@ def detect_gg_in_buffer(request):
                 if not openai_key:
                     continue
                 
-                resp = sync_requests.post('https://api.openai.com/v1/chat/completions',
+                resp = sync_requests.post(OPENAI_CHAT_URL,
                     headers={'Authorization': f'Bearer {openai_key}'},
                     json={
                         'model': 'gpt-4o-mini',
@@ -2540,8 +2128,10 @@ def clear_buffer(request):
             except Exception as e:
                 print(f"Error deleting file for photo {photo.id}: {e}")
         
-        # Удаляем записи из БД
+        # Удаляем записи из БД (и превью, на которые больше никто не ссылается)
+        thumbnail_sets = list(photos.values_list('thumbnails', flat=True))
         photos.delete()
+        release_thumbnails(*thumbnail_sets)
         
         print(f"Cleared buffer: {deleted_count} records, {files_deleted} files")
         
@@ -2576,30 +2166,24 @@ def delete_card_by_correlation(request, correlation_id):
         
         # Проверяем есть ли соответствующие записи в PhotoBuffer
         # (если карточка была создана из буфера)
+        # Один запрос по индексам file_id/message_id вместо двух на каждое фото
         buffer_photos_returned = 0
-        for photo in card.photos.all():
-            try:
-                # Ищем в буфере по message_id или file_id (если есть в метаданных)
-                buffer_photo = PhotoBuffer.objects.filter(
-                    file_id=photo.file_id
-                ).first()
-                
-                if not buffer_photo:
-                    buffer_photo = PhotoBuffer.objects.filter(
-                        message_id=photo.message_id
-                    ).first()
-                
-                if buffer_photo:
-                    # Возвращаем в буфер
-                    buffer_photo.processed = False
-                    buffer_photo.sent_to_bot = False
-                    # Возвращаем в исходную группу если была, иначе оставляем как есть
-                    buffer_photo.group_id = None
-                    buffer_photo.group_order = 0
-                    buffer_photo.save(update_fields=['processed', 'sent_to_bot', 'group_id', 'group_order'])
-                    buffer_photos_returned += 1
-            except:
-                pass
+        try:
+            photos = list(card.photos.all())
+            by_file_id, by_message_id = {}, {}
+            for buffer_photo in PhotoBuffer.objects.filter(
+                Q(file_id__in=[p.file_id for p in photos]) | Q(message_id__in=[p.message_id for p in photos])
+            ):
+                by_file_id.setdefault(buffer_photo.file_id, buffer_photo.id)
+                by_message_id.setdefault(buffer_photo.message_id, buffer_photo.id)
+            returned = {by_file_id.get(p.file_id) or by_message_id.get(p.message_id) for p in photos} - {None}
+            
+            # Возвращаем в буфер (в исходную группу не возвращаем - группа сбрасывается)
+            buffer_photos_returned = PhotoBuffer.objects.filter(pk__in=returned).update(
+                processed=False, sent_to_bot=False, group_id=None, group_order=0
+            )
+        except Exception as e:
+            print(f"Error returning photos to buffer: {e}")
         
         # Удаляем физические файлы фото
         files_deleted = 0
@@ -2615,12 +2199,8 @@ def delete_card_by_correlation(request, correlation_id):
         try:
             from .pochtoy_integration import delete_from_pochtoy
             
-            # Собираем все трекинги
-            trackings = []
-            trackings.extend(card.get_gg_labels())
-            for bc in all_barcodes:
-                if bc.data not in trackings:
-                    trackings.append(bc.data)
+            # Все трекинги карточки (GG лейблы + баркоды)
+            trackings = list(card.trackings)
             
             if trackings:
                 pochtoy_result = delete_from_pochtoy(trackings)
@@ -2629,8 +2209,13 @@ def delete_card_by_correlation(request, correlation_id):
             print(f"Pochtoy delete error: {e}")
             # Не падаем если Pochtoy недоступен
         
-        # Удаляем карточку (каскадом удалятся Photo и BarcodeResult)
+        # Сообщения о статусе Pochtoy из outbox - бот удалит их вместе с карточкой
+        status_message_ids = list(card.pochtoy_outbox.exclude(message_id=None).values_list('message_id', flat=True))
+        
+        # Удаляем карточку (каскадом удалятся Photo, BarcodeResult и очередь Pochtoy)
+        thumbnail_sets = list(card.photos.values_list('thumbnails', flat=True))
         card.delete()
+        release_thumbnails(*thumbnail_sets)
         
         print(f"Deleted card {correlation_id}: {photos_count} photos, {barcodes_count} barcodes, {files_deleted} files, {buffer_photos_returned} returned to buffer")
         
@@ -2640,7 +2225,8 @@ def delete_card_by_correlation(request, correlation_id):
             'photos_deleted': photos_count,
             'barcodes_deleted': barcodes_count,
             'files_deleted': files_deleted,
-            'returned_to_buffer': buffer_photos_returned
+            'returned_to_buffer': buffer_photos_returned,
+            'message_ids': status_message_ids
         })
         
     except Exception as e:
@@ -2649,6 +2235,20 @@ def delete_card_by_correlation(request, correlation_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@staff_member_required
+@require_http_methods(["GET"])
+def lookup_cards(request):
+    """Найти карточки по баркоду, GG/Q лейблу, Telegram file_id или ID карточки."""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'q required'}, status=400)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 50)), 200))
+    except ValueError:
+        limit = 50
+    return JsonResponse(lookup(query, limit))
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_last_card(request):
@@ -2688,6 +2288,7 @@ def delete_buffer_photo(request, photo_id):
         
         # Удаляем запись
         photo.delete()
+        release_thumbnails(photo.thumbnails)
         
         return JsonResponse({'success': True})
     except Exception as e:
@@ -0,0 +1,85 @@
+"""
+Tests for album admission control and per-chat fairness.
+"""
+import asyncio
+import unittest
+
+from shoesbot.album_scheduler import AlbumScheduler
+
+
+class AlbumSchedulerTestCase(unittest.TestCase):
+    """Albums are admitted round-robin across chats under a global limit."""
+
+    def test_round_robin_across_chats(self):
+        async def run():
+            scheduler = AlbumScheduler(max_albums=1)
+            order = []
+            gate = asyncio.Event()
+
+            def album(chat_id, n):
+                async def process():
+                    if not order:
+                        await gate.wait()  # hold the only slot until everything is queued
+                    order.append((chat_id, n))
+                return process
+
+            jobs = [scheduler.run(1, album(1, n)) for n in range(4)]
+            jobs.append(scheduler.run(2, album(2, 0)))
+            jobs.append(scheduler.run(3, album(3, 0)))
+            tasks = [asyncio.create_task(j) for j in jobs]
+            await asyncio.sleep(0)
+            gate.set()
+            await asyncio.gather(*tasks)
+            return order
+
+        order = asyncio.run(run())
+        # chat 1 dumped four albums, yet chats 2 and 3 get the next turns
+        self.assertEqual(order[:4], [(1, 0), (1, 1), (2, 0), (3, 0)])
+        self.assertEqual(order[4:], [(1, 2), (1, 3)])
+
+    def test_concurrency_limit_and_positions(self):
+        async def run():
+            scheduler = AlbumScheduler(max_albums=2)
+            running = 0
+            peak = 0
+            positions = {}
+
+            def album():
+                async def process():
+                    nonlocal running, peak
+                    running += 1
+                    peak = max(peak, running)
+                    await asyncio.sleep(0.01)
+                    running -= 1
+                return process
+
+            def reporter(key):
+                async def report(position):
+                    positions.setdefault(key, []).append(position)
+                return report
+
+            await asyncio.gather(*(scheduler.run(1, album(), reporter(i)) for i in range(5)))
+            await asyncio.sleep(0)
+            return peak, positions, scheduler.running, scheduler.pending()
+
+        peak, positions, running, pending = asyncio.run(run())
+        self.assertEqual(peak, 2)
+        self.assertEqual((running, pending), (0, 0))
+        # the last queued album saw its position count down
+        self.assertEqual(positions[4], [3, 2, 1])
+
+    def test_failing_album_releases_slot(self):
+        async def run():
+            scheduler = AlbumScheduler(max_albums=1)
+            done = []
+
+            async def boom():
+                raise RuntimeError("boom")
+
+            async def ok():
+                done.append(True)
+
+            await asyncio.gather(scheduler.run(1, boom), scheduler.run(1, ok))
+            return done
+
+        self.assertEqual(asyncio.run(run()), [True])
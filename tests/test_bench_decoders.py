@@ -0,0 +1,75 @@
+"""
+Tests for the offline decoder benchmark (cassette replay and regression check).
+"""
+import io
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from tools.bench_decoders import CORPUS, Cassette, bench_mode, compare, main
+from shoesbot.pipeline import default_pipeline
+
+
+def _stats(**overrides):
+    stats = {
+        "e2e_p50_ms": 100.0, "e2e_p95_ms": 200.0, "cpu_ms_per_image": 50.0, "peak_mb": 40.0,
+        "hit_rate": 0.8, "false_gg": 0, "decoders": {"zbar": {"mean_ms": 10.0}},
+    }
+    stats.update(overrides)
+    return stats
+
+
+class BenchCompareTestCase(unittest.TestCase):
+    """Numbers within tolerance pass, regressions are reported."""
+
+    def test_within_tolerance(self):
+        self.assertEqual(compare({"debug": _stats(e2e_p50_ms=160.0)}, {"debug": _stats()}), [])
+
+    def test_regressions(self):
+        current = _stats(e2e_p95_ms=500.0, hit_rate=0.7, false_gg=1, peak_mb=80.0,
+                         decoders={"zbar": {"mean_ms": 100.0}})
+        failures = compare({"debug": current}, {"debug": _stats()})
+        self.assertEqual(
+            [f.split(":")[0] for f in failures],
+            ["debug.e2e_p95_ms", "debug.zbar.mean_ms", "debug.peak_mb", "debug.hit_rate", "debug.false_gg"],
+        )
+
+
+class BenchCheckInputsTestCase(unittest.TestCase):
+    """--check fails up front, with a reason, without a recorded cassette and baselines."""
+
+    def test_check_without_recordings(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cassette = Path(tmp) / "cassette.json"
+            cassette.write_text(json.dumps({"responses": {}}))  # not written by --record
+            out = io.StringIO()
+            with redirect_stdout(out):
+                code = main(["--check", "--cassette", str(cassette), "--baselines", str(Path(tmp) / "none.json")])
+        self.assertEqual(code, 1)
+        self.assertIn("was not recorded with --record", out.getvalue())
+        self.assertIn("no baselines at", out.getvalue())
+
+
+class BenchReplayTestCase(unittest.TestCase):
+    """Network decoders get recorded answers for the photo being decoded."""
+
+    def test_replay_sticker_photo(self):
+        with open(CORPUS) as f:
+            corpus = json.load(f)
+        corpus["images"] = [i for i in corpus["images"] if i["path"] == "04/90742230_3.jpg"]
+        cassette = Cassette({"04/90742230_3.jpg": {"vision": {"text": "GG743", "ms": 0}}}, latency_scale=0)
+        pipeline = default_pipeline()
+        pipeline.decoders = [d for d in pipeline.decoders if d.name != "gg-label-local"]
+        with cassette.install():
+            stats = bench_mode(pipeline, "parallel", corpus, cassette, measure_memory=False)
+
+        self.assertIn("GG743", stats["images"][0]["found"])
+        self.assertEqual(cassette.misses, 0)
+        # vision-ocr plus the improved GG variants (late ones may be skipped after a confident hit)
+        self.assertGreaterEqual(cassette.calls["vision"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+Tests for the persistent decoder output cache.
+"""
+import os
+import tempfile
+import unittest
+
+from shoesbot.decode_cache import DecodeCache, image_key
+from shoesbot.models import Barcode
+
+
+class DecodeCacheTestCase(unittest.TestCase):
+    """Entries round-trip per (photo, decoder) and expire with the TTL."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        cache = DecodeCache(self.path)
+        digest = image_key(b"photo")
+        self.assertIsNone(cache.get(digest, "vision-ocr"))
+
+        cache.put(digest, "vision-ocr", [Barcode("GG_LABEL", "GG743", "vision-ocr")], ms=812, cost=0.0015)
+        entry = DecodeCache(self.path).get(digest, "vision-ocr")  # another process / instance
+        self.assertEqual(entry.barcodes, [Barcode("GG_LABEL", "GG743", "vision-ocr")])
+        self.assertEqual((entry.ms, entry.cost), (812, 0.0015))
+        self.assertIsNone(cache.get(digest, "gg-label-improved"))
+        self.assertEqual(len(cache), 1)
+
+    def test_ttl(self):
+        DecodeCache(self.path).put("abc", "zbar", [], ms=5)
+        self.assertIsNotNone(DecodeCache(self.path, ttl=60).get("abc", "zbar"))
+        self.assertIsNone(DecodeCache(self.path, ttl=1e-9).get("abc", "zbar"))
+
+
+if __name__ == "__main__":
+    unittest.main()
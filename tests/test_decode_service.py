@@ -0,0 +1,84 @@
+"""
+Tests for the decode daemon and its client.
+"""
+import os
+import tempfile
+import threading
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from shoesbot.decode_cache import CachedDecoder, DecodeCache
+from shoesbot.decode_client import DecodeClient, DecodeServiceError
+from shoesbot.decode_service import DecodeService, cached_pipeline, make_server
+from shoesbot.decoders.base import Decoder
+from shoesbot.models import Barcode
+from shoesbot.pipeline import DecoderPipeline
+
+
+class _StubDecoder(Decoder):
+    def __init__(self, name, data, paid=False):
+        self.name = name
+        self.paid = paid
+        self.data = data
+        self.calls = 0
+
+    def decode(self, image, image_bytes):
+        self.calls += 1
+        return [Barcode("CODE128", self.data, self.name, bbox=(0.1, 0.2, 0.3, 0.4))]
+
+
+def _jpeg() -> bytes:
+    out = BytesIO()
+    Image.new("RGB", (40, 30), "white").save(out, "JPEG")
+    return out.getvalue()
+
+
+class DecodeServiceTestCase(unittest.TestCase):
+    """Decodes go over HTTP to warm decoders; paid ones are answered from the cache the second time."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.local = _StubDecoder("zbar", "111")
+        self.paid = _StubDecoder("vision-ocr", "222", paid=True)
+        pipeline = cached_pipeline(DecoderPipeline([self.local, self.paid]),
+                                   DecodeCache(os.path.join(self.tmp.name, "cache.db")))
+        self.service = DecodeService(pipeline, workers=2)
+        self.server = make_server(self.service, "127.0.0.1", 0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = DecodeClient("http://%s:%d" % self.server.server_address[:2])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.pool.shutdown()
+        self.tmp.cleanup()
+
+    def test_decode_roundtrip_and_cache(self):
+        raw = _jpeg()
+        results, timeline = self.client.decode(raw, photo_index=3)
+        self.assertEqual([(b.data, b.photo_index, b.bbox) for b in results],
+                         [("111", 3, (0.1, 0.2, 0.3, 0.4)), ("222", 3, (0.1, 0.2, 0.3, 0.4))])
+        self.assertEqual([t["decoder"] for t in timeline], ["zbar", "vision-ocr"])
+
+        self.client.decode(raw, mode="sequential")
+        self.assertEqual((self.local.calls, self.paid.calls), (2, 1))  # paid decoder answered from the cache
+        results, _ = self.client.decode(raw, exclude=["vision-ocr"])
+        self.assertEqual([b.data for b in results], ["111"])
+
+        metrics = self.service.metrics()
+        self.assertEqual((metrics["requests"], metrics["errors"], metrics["in_flight"]), (3, 0, 0))
+        self.assertEqual(metrics["cache"], {"vision-ocr": {"hits": 1, "misses": 1}})
+        self.assertTrue(isinstance(self.service.pipeline.decoders[1], CachedDecoder))
+        self.assertEqual(self.client.health()["decoders"], ["zbar", "vision-ocr"])
+
+    def test_errors(self):
+        with self.assertRaises(DecodeServiceError):
+            self.client.decode(_jpeg(), mode="bogus")
+        with self.assertRaises(DecodeServiceError):
+            DecodeClient("http://127.0.0.1:9", timeout=1).decode(_jpeg())
+
+
+if __name__ == "__main__":
+    unittest.main()
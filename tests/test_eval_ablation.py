@@ -0,0 +1,64 @@
+"""
+Tests for the decoder ablation scoring.
+"""
+import unittest
+
+from tools.eval_ablation import Matrix, ablation, pareto
+
+
+def _photo(path, **decoders):
+    return {"path": path, "decoders": {
+        name: {"codes": codes, "ms": ms, "cost": cost, "error": None} for name, (codes, ms, cost) in decoders.items()
+    }}
+
+
+PHOTOS = [
+    _photo("a.jpg", **{"gg-label-local": ([["GG_LABEL", "GG743"]], 40, 0.0),
+                       "gg-label-improved": ([["GG_LABEL", "GG743"], ["GG_LABEL", "Q2623004"]], 900, 0.003),
+                       "zbar": ([], 10, 0.0)}),
+    _photo("b.jpg", **{"gg-label-local": ([], 30, 0.0),
+                       "gg-label-improved": ([["GG_LABEL", "GG744"]], 1000, 0.003),
+                       "zbar": ([["EAN13", "785146640203"]], 10, 0.0)}),
+]
+TRUTH = {"a.jpg": ["GG743", "Q2623004"], "b.jpg": ["GG744", "785146640203"]}
+NAMES = ["zbar", "gg-label-local", "gg-label-improved"]
+
+
+class AblationTestCase(unittest.TestCase):
+    """Parallel, fallback and sequential configs are scored from one decoder pass."""
+
+    def setUp(self):
+        self.matrix = Matrix(PHOTOS, NAMES, TRUTH)
+
+    def test_parallel_and_fallback(self):
+        both = self.matrix.parallel(["gg-label-local", "gg-label-improved"])
+        self.assertEqual((both["hit_rate"], both["gg_rate"]), (0.75, 1.0))
+        self.assertEqual(both["mean_ms"], 950.0)
+        self.assertEqual(both["cost_per_1000"], 3.0)
+
+        # the improved OCR only runs on b.jpg, after the local reader, so Q2623004 is lost
+        fallback = self.matrix.parallel(["gg-label-local", "gg-label-improved"], fallback=True)
+        self.assertEqual((fallback["hit_rate"], fallback["cost_per_1000"]), (0.5, 1.5))
+        self.assertEqual(fallback["mean_ms"], (40 + 30 + 1000) / 2)
+
+    def test_sequential_stops_at_first_gg(self):
+        seq = self.matrix.sequential(["gg-label-local", "gg-label-improved", "zbar"])
+        self.assertEqual(seq["mean_ms"], (40 + 30 + 1000) / 2)  # zbar never runs: GG found before it
+        self.assertEqual(seq["hit_rate"], 0.5)
+
+    def test_pareto_front(self):
+        configs = ablation(self.matrix, max_order=3)
+        front = pareto(configs, "mean_ms")
+        hits = [c["hit_rate"] for c in front]
+        self.assertEqual(hits, sorted(hits))
+        self.assertEqual(front[-1]["hit_rate"], 1.0)
+        self.assertTrue(all(c["mean_ms"] <= front[-1]["mean_ms"] for c in front))
+
+    def test_union_truth_without_corpus(self):
+        matrix = Matrix(PHOTOS, NAMES)
+        self.assertEqual(matrix.parallel(NAMES)["hit_rate"], 1.0)
+        self.assertEqual(matrix.parallel(["zbar"])["hit_rate"], 0.25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests for the parallel variant search in ImprovedGGLabelDecoder.
+"""
+import base64
+import os
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from shoesbot.decoders.gg_label_decoder_improved import ImprovedGGLabelDecoder
+
+
+class _Response:
+    ok = True
+    status_code = 200
+
+    def __init__(self, text):
+        self._text = text
+
+    def json(self):
+        return {"responses": [{"fullTextAnnotation": {"text": self._text}}]}
+
+
+class ImprovedGGLabelDecoderTestCase(unittest.TestCase):
+    """Variants go out one by one; the first confident GG/Q label stops the rest."""
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"GOOGLE_VISION_API_KEY": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.image = Image.new("RGB", (400, 300), (240, 220, 40))
+
+    def test_confident_variant_stops_the_rest(self):
+        payloads = []
+
+        def fake_post(url, json, timeout):
+            request = json["requests"][0]
+            payloads.append(base64.b64decode(request["image"]["content"]))
+            features = [f["type"] for f in request["features"]]
+            self.assertEqual(features, ["DOCUMENT_TEXT_DETECTION", "TEXT_DETECTION"])
+            return _Response("GG12345\nQ2517646")
+
+        with mock.patch("requests.post", side_effect=fake_post):
+            results = ImprovedGGLabelDecoder().decode(self.image, b"")
+
+        self.assertEqual(len(payloads), 1)  # one paid call, not one per variant
+        self.assertEqual([b.data for b in results], ["GG12345", "Q2517646"])
+        self.assertTrue(all(b.symbology == "GG_LABEL" for b in results))
+        self.assertTrue(all(p.startswith(b"\xff\xd8") for p in payloads))  # JPEG, not PNG
+
+    def test_g_number_alone_is_not_confident(self):
+        with mock.patch("requests.post", return_value=_Response("G2548")) as post:
+            results = ImprovedGGLabelDecoder().decode(self.image, b"")
+        self.assertEqual(post.call_count, len(ImprovedGGLabelDecoder.VARIANTS))
+        self.assertEqual([b.data for b in results], ["G2548"])
+
+    def test_size_and_article_text_is_not_a_gg_label(self):
+        decoder = ImprovedGGLabelDecoder()
+        for text in ("size 753 G 10", "664200", "Art. 6612 34", "GO 1234", "OO747"):
+            self.assertEqual(decoder._extract_gg_labels(text), [], text)
+
+
+if __name__ == "__main__":
+    unittest.main()
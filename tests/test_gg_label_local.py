@@ -0,0 +1,70 @@
+"""
+Tests for the local GG sticker reader.
+"""
+import os
+import unittest
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from shoesbot.decoders.gg_label_local import LocalGGLabelDecoder, read_sticker
+
+PHOTOS = os.path.join(os.path.dirname(__file__), "..", "shoessite", "media", "photos", "2025", "11")
+
+
+def make_sticker_photo(text="GG752", angle=0):
+    """Dark background with a yellow sticker: barcode on top, big text below."""
+    sticker = np.full((180, 320, 3), (235, 245, 60), np.uint8)
+    x = 30
+    for i in range(60):
+        width = 2 + (i * 7) % 3
+        cv2.rectangle(sticker, (x, 15), (x + width - 1, 60), (0, 0, 0), -1)
+        x += width + 2 + i % 2
+        if x > 290:
+            break
+    cv2.putText(sticker, text, (30, 150), cv2.FONT_HERSHEY_TRIPLEX, 2.2, (0, 0, 0), 5, cv2.LINE_AA)
+    photo = np.full((900, 900, 3), 40, np.uint8)
+    photo[360:540, 290:610] = sticker
+    rotation = cv2.getRotationMatrix2D((450, 450), angle, 1.0)
+    return cv2.warpAffine(photo, rotation, (900, 900), borderValue=(40, 40, 40))
+
+
+class LocalGGLabelTestCase(unittest.TestCase):
+    """The sticker is found, deskewed and read in any orientation."""
+
+    def test_reads_rotated_and_upside_down_stickers(self):
+        for angle in (0, 17, 90, 180):
+            reading = read_sticker(make_sticker_photo("GG752", angle))
+            self.assertIsNotNone(reading, angle)
+            self.assertEqual(reading.text, "GG752", angle)
+            self.assertGreater(reading.confidence, 0.8)
+
+    def test_no_sticker_no_label(self):
+        photo = np.full((600, 800, 3), (90, 120, 200), np.uint8)
+        self.assertIsNone(read_sticker(photo))
+        self.assertEqual(LocalGGLabelDecoder().decode(Image.fromarray(photo), b""), [])
+
+    def test_low_confidence_is_left_to_network_ocr(self):
+        image = Image.fromarray(make_sticker_photo("GG752"))
+        self.assertEqual([b.data for b in LocalGGLabelDecoder().decode(image, b"")], ["GG752"])
+        self.assertEqual(LocalGGLabelDecoder(min_confidence=1.01).decode(image, b""), [])
+
+    @unittest.skipUnless(os.path.isdir(PHOTOS), "sample photos not available")
+    def test_sample_photos(self):
+        expected = {
+            "03/85c6f712_2.jpg": "GG747",
+            "04/26954990_0.jpg": "GG746",
+            "04/3618b8db_0.jpg": "GG745",
+            "04/90742230_0.jpg": "GG744",  # rotated 90 degrees
+            "04/90742230_3.jpg": "GG743",  # upside down
+            "04/3f61b1ca_0.jpg": None,  # yellow brand tag
+        }
+        decoder = LocalGGLabelDecoder()
+        for name, label in expected.items():
+            image = Image.open(os.path.join(PHOTOS, name)).convert("RGB")
+            self.assertEqual([b.data for b in decoder.decode(image, b"")], [label] if label else [], name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Tests for memory-bounded photo decoding.
+"""
+import asyncio
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from shoesbot.image_loader import ImageMemoryBudget, decoded_image, open_draft
+
+
+def _jpeg(size=(2400, 1800)) -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", size, (200, 180, 40)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class DraftDecodeTestCase(unittest.TestCase):
+    """Draft mode decodes straight to a reduced scale."""
+
+    def test_draft_reduces_scale(self):
+        img = open_draft(_jpeg(), max_side=1000)
+        # 1/2 scale is the smallest reduction that stays >= 1000 px
+        self.assertEqual(img.size, (1200, 900))
+
+    def test_no_draft_without_max_side(self):
+        img = open_draft(_jpeg(), max_side=None)
+        self.assertEqual(img.size, (2400, 1800))
+
+    def test_decoded_image_is_rgb(self):
+        async def run():
+            async with decoded_image(_jpeg((800, 600)), 2048, ImageMemoryBudget(10 * 1024 * 1024)) as img:
+                return img.mode, img.size
+        self.assertEqual(asyncio.run(run()), ("RGB", (800, 600)))
+
+
+class ImageMemoryBudgetTestCase(unittest.TestCase):
+    """Budget bounds how many decoded frames are alive at once."""
+
+    def test_budget_serializes_frames(self):
+        async def run():
+            budget = ImageMemoryBudget(100)
+            live = 0
+            max_live = 0
+
+            async def hold():
+                nonlocal live, max_live
+                async with budget.reserve(60):
+                    live += 1
+                    max_live = max(max_live, live)
+                    await asyncio.sleep(0.01)
+                    live -= 1
+
+            await asyncio.gather(*(hold() for _ in range(4)))
+            return max_live, budget.in_use, budget.peak
+
+        max_live, in_use, peak = asyncio.run(run())
+        self.assertEqual(max_live, 1)
+        self.assertEqual(in_use, 0)
+        self.assertEqual(peak, 60)
+
+    def test_oversized_frame_is_admitted_alone(self):
+        async def run():
+            budget = ImageMemoryBudget(10)
+            async with budget.reserve(1000):
+                return budget.in_use
+        self.assertEqual(asyncio.run(run()), 10)
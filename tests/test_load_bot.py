@@ -0,0 +1,35 @@
+"""
+Tests for the bot load generator helpers.
+"""
+import unittest
+
+from tools.load_bot import AlbumTracker, build_workload, corpus_albums
+
+
+class LoadBotTestCase(unittest.TestCase):
+    """Albums are paired with completed batches per chat, in order."""
+
+    def test_tracker_pairs_albums_in_order(self):
+        tracker = AlbumTracker()
+        tracker.start(1, 3)
+        tracker.start(1, 2)
+        tracker.start(2, 4)
+        self.assertFalse(tracker.idle.is_set())
+        tracker.done(1, 3)
+        tracker.done(2, 5)  # buffer merged an extra photo
+        tracker.done(1, 2)
+        self.assertTrue(tracker.idle.is_set())
+        self.assertEqual((len(tracker.latencies), tracker.photos, tracker.merged), (3, 10, 1))
+        tracker.done(3, 1)  # unknown chat is ignored
+        self.assertEqual(len(tracker.latencies), 3)
+
+    def test_workload_is_repeatable(self):
+        albums = corpus_albums()
+        self.assertTrue(all(len(a) > 1 for a in albums))
+        first = build_workload(4, 2, albums, seed=1)
+        self.assertEqual(sorted(first), [1000, 1001, 1002, 1003])
+        self.assertEqual(first, build_workload(4, 2, albums, seed=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
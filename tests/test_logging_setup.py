@@ -0,0 +1,95 @@
+"""
+Tests for the queued JSON logging setup.
+"""
+import asyncio
+import json
+import logging
+import queue
+import unittest
+from logging.handlers import QueueListener
+
+from shoesbot.logging_setup import (
+    ContextFilter, DebugSampler, JsonFormatter, LazyQueueHandler, bind_log_context, log_context,
+)
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self.setFormatter(JsonFormatter())
+
+    def emit(self, record):
+        self.lines.append(json.loads(self.format(record)))
+
+
+class QueuedJsonLoggingTestCase(unittest.TestCase):
+    """Records carry the emitting task's context and are formatted on the listener."""
+
+    def setUp(self):
+        self.capture = _Capture()
+        handler = LazyQueueHandler(queue.SimpleQueue())
+        handler.addFilter(DebugSampler(3))
+        handler.addFilter(ContextFilter())
+        self.listener = QueueListener(handler.queue, self.capture)
+        self.logger = logging.getLogger("test_logging_setup")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.handlers = [handler]
+        self.listener.start()
+
+    def tearDown(self):
+        self.logger.handlers = []
+
+    def test_context_fields_per_task(self):
+        async def album(chat_id, corr):
+            bind_log_context(corr=corr, chat_id=chat_id)
+            with log_context(stage="decoders"):
+                await asyncio.sleep(0)
+                self.logger.info("found %d codes", chat_id)
+            self.logger.info("done")
+
+        async def main():
+            with log_context(stage="outer"):
+                await asyncio.gather(album(1, "a"), album(2, "b"))
+            self.logger.info("idle", extra={"stage": "explicit"})
+
+        asyncio.run(main())
+        self.listener.stop()
+        lines = self.capture.lines
+        self.assertIn({"corr": "a", "chat_id": 1, "stage": "decoders", "msg": "found 1 codes"},
+                      [{k: line.get(k) for k in ("corr", "chat_id", "stage", "msg")} for line in lines])
+        done = [line for line in lines if line["msg"] == "done"]
+        self.assertEqual({(d["chat_id"], d["stage"]) for d in done}, {(1, "outer"), (2, "outer")})
+        self.assertEqual(lines[-1]["stage"], "explicit")
+        self.assertNotIn("corr", lines[-1])
+
+    def test_lazy_formatting_and_debug_sampling(self):
+        class Expensive:
+            calls = 0
+
+            def __str__(self):
+                Expensive.calls += 1
+                return "x"
+
+        self.logger.info("value %s", Expensive())
+        self.assertEqual(Expensive.calls, 0)  # not formatted by the caller
+
+        sampled = logging.getLogger("shoesbot.photo_buffer.test")
+        sampled.propagate = False
+        sampled.setLevel(logging.DEBUG)
+        sampled.handlers = self.logger.handlers
+        try:
+            for i in range(7):
+                sampled.debug("chatter %d", i)
+            sampled.warning("kept")
+        finally:
+            sampled.handlers = []
+        self.listener.stop()
+        self.assertEqual(Expensive.calls, 1)
+        msgs = [line["msg"] for line in self.capture.lines]
+        self.assertEqual(msgs, ["value x", "chatter 0", "chatter 3", "chatter 6", "kept"])
+
+
+if __name__ == "__main__":
+    unittest.main()
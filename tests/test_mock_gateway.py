@@ -0,0 +1,78 @@
+"""
+Tests for the local mock gateway (routing, replay, fault injection).
+"""
+import importlib
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from tools.mock_gateway import MockGateway
+
+
+class MockGatewayTestCase(unittest.TestCase):
+    """Synthetic answers, recorded fixtures and injected faults."""
+
+    def setUp(self):
+        self.fixtures = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        json.dump({"entries": [{
+            "method": "POST", "path": "/v1/chat/completions", "body_sha1": "-", "status": 200,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"choices": [{"message": {"content": "recorded"}}]}),
+        }]}, self.fixtures)
+        self.fixtures.close()
+        self.gateway = MockGateway(self.fixtures.name, seed=1)
+        self.url = self.gateway.start()
+
+    def tearDown(self):
+        self.gateway.stop()
+        os.unlink(self.fixtures.name)
+
+    def test_synthetic_and_recorded_answers(self):
+        resp = requests.post(f"{self.url}/v1/images:annotate?key=x", json={"requests": [{}, {}]}, timeout=5)
+        self.assertEqual(len(resp.json()["responses"]), 2)
+
+        resp = requests.post(f"{self.url}/bot123:abc/sendMessage", data={"chat_id": 42, "text": "hi"}, timeout=5)
+        self.assertEqual(resp.json()["result"]["chat"]["id"], 42)
+
+        resp = requests.post(f"{self.url}/v1/chat/completions", json={"model": "gpt-4o"}, timeout=5)
+        self.assertEqual(resp.json()["choices"][0]["message"]["content"], "recorded")
+
+    def test_latency_errors_and_rate_limit(self):
+        self.gateway.gateway.configure({"vision": {"latency_ms": 150}, "openai": {"error_rate": 1.0},
+                                        "pochtoy": {"rate_limit": 0.5, "burst": 2}})
+        started = time.perf_counter()
+        requests.post(f"{self.url}/v1/images:annotate", json={}, timeout=5)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.15)
+
+        resp = requests.post(f"{self.url}/v1/chat/completions", json={}, timeout=5)
+        self.assertIn(resp.status_code, (500, 503))
+
+        statuses = [requests.put(f"{self.url}/api/garage-tg/store", json={}, timeout=5).status_code for _ in range(3)]
+        self.assertEqual(statuses[:2], [200, 200])
+        self.assertEqual(statuses[2], 429)
+
+        stats = requests.get(f"{self.url}/__gateway/stats", timeout=5).json()["stats"]
+        self.assertEqual(stats["pochtoy"]["rate_limited"], 1)
+        self.assertEqual(stats["openai"]["errors"], 1)
+
+    def test_endpoints_follow_gateway_url(self):
+        import shoesbot.endpoints as endpoints
+        try:
+            with mock.patch.dict(os.environ, {"MOCK_GATEWAY_URL": self.url,
+                                              "POCHTOY_API_URL": "https://pochtoy.example/api/garage-tg/store"}):
+                importlib.reload(endpoints)
+                self.assertEqual(endpoints.vision_annotate_url("k"), f"{self.url}/v1/images:annotate?key=k")
+                self.assertEqual(endpoints.POCHTOY_STORE_URL, f"{self.url}/api/garage-tg/store")  # never production
+                resp = requests.put(endpoints.POCHTOY_STORE_URL, json={}, timeout=5)
+                self.assertEqual(resp.json(), {"status": "ok"})
+        finally:
+            importlib.reload(endpoints)
+
+
+if __name__ == "__main__":
+    unittest.main()
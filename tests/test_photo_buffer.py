@@ -0,0 +1,89 @@
+"""
+Tests for album boundary detection in PhotoBuffer.
+"""
+import asyncio
+import unittest
+from time import perf_counter
+
+from shoesbot.photo_buffer import GapEstimator, PhotoBuffer
+
+
+class PhotoBufferTestCase(unittest.TestCase):
+    """Albums close on their own boundary; loose photos keep the fixed window."""
+
+    def test_album_closes_on_group_change_and_size_limit(self):
+        async def run():
+            buf = PhotoBuffer(timeout=5.0)
+            first, album_a = buf.add(1, "a1", None, 1, "g1")
+            self.assertTrue(first)
+            self.assertFalse(buf.add(1, "a2", None, 2, "g1")[0])
+            first, album_b = buf.add(1, "b1", None, 3, "g2")  # next album: g1 is done
+            self.assertTrue(first)
+            for i in range(2, 11):
+                buf.add(1, f"b{i}", None, 3 + i, "g2")  # 10th photo closes g2
+
+            started = perf_counter()
+            items_a, items_b = await asyncio.gather(buf.collect(1, album_a), buf.collect(1, album_b))
+            self.assertLess(perf_counter() - started, 0.1)
+            self.assertEqual([p.file_id for p in items_a], ["a1", "a2"])
+            self.assertEqual(len(items_b), 10)
+            self.assertEqual(buf.albums, {})
+
+        asyncio.run(run())
+
+    def test_debounce_and_loose_timeout(self):
+        async def run():
+            buf = PhotoBuffer(timeout=0.6, gap_initial=0.05, gap_floor=0.05)
+            _, album = buf.add(1, "a1", None, 1, "g1")
+            _, loose = buf.add(2, "l1", None, 2)
+
+            async def late_photo():
+                await asyncio.sleep(0.1)
+                buf.add(1, "a2", None, 3, "g1")
+
+            started = perf_counter()
+            asyncio.create_task(late_photo())
+            items = await buf.collect(1, album)
+            waited = perf_counter() - started
+            self.assertEqual(len(items), 2)
+            self.assertGreater(waited, 0.1)
+            self.assertLess(waited, 0.5)  # closed by the learned debounce, not the timeout
+
+            self.assertEqual(len(await buf.collect(2, loose)), 1)
+            self.assertGreaterEqual(perf_counter() - started, 0.55)
+
+        asyncio.run(run())
+
+    def test_late_photo_joins_its_album(self):
+        async def run():
+            buf = PhotoBuffer(timeout=5.0)
+            _, album_a = buf.add(1, "a1", None, 1, "g1")
+            _, album_b = buf.add(1, "b1", None, 2, "g2")  # closes g1 ...
+            first, album = buf.add(1, "a2", None, 3, "g1")  # ... but its slow photo still belongs to it
+            self.assertFalse(first)
+            self.assertIs(album, album_a)
+            self.assertFalse(album_b.closed)
+            self.assertEqual([p.file_id for p in await buf.collect(1, album_a)], ["a1", "a2"])
+
+        asyncio.run(run())
+
+    def test_estimators_are_per_chat(self):
+        buf = PhotoBuffer()
+        self.assertEqual(buf.gaps_for(1).floor, 1.0)
+        for _ in range(40):
+            buf.gaps_for(1).observe(0.01)
+        self.assertEqual(buf.gaps_for(1).debounce(), 1.0)
+        self.assertGreater(buf.gaps_for(2).debounce(), 1.0)  # another chat's fast albums do not shorten this one
+
+    def test_gap_estimator_bounds(self):
+        gaps = GapEstimator(initial=0.4, floor=0.3, ceiling=3.0)
+        for _ in range(50):
+            gaps.observe(0.02)
+        self.assertEqual(gaps.debounce(), 0.3)
+        for _ in range(50):
+            gaps.observe(10.0)
+        self.assertEqual(gaps.debounce(), 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
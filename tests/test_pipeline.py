@@ -0,0 +1,126 @@
+"""
+Tests for DecoderPipeline scheduling options.
+"""
+import asyncio
+import unittest
+
+from PIL import Image
+
+from shoesbot.decoders.base import Decoder
+from shoesbot.models import Barcode
+from shoesbot.pipeline import DecoderPipeline
+
+
+class _StubDecoder(Decoder):
+    def __init__(self, name, data, paid=False):
+        self.name = name
+        self.paid = paid
+        self.data = data
+        self.calls = 0
+
+    def decode(self, image, image_bytes):
+        self.calls += 1
+        return [Barcode(symbology="CODE128", data=self.data, source=self.name)]
+
+
+class PipelineExcludeTestCase(unittest.TestCase):
+    """Excluded decoders are not called but still show up in the timeline."""
+
+    def test_exclude_paid_decoders(self):
+        local = _StubDecoder("zbar", "111")
+        paid = _StubDecoder("vision-ocr", "222", paid=True)
+        pipeline = DecoderPipeline([local, paid])
+        self.assertEqual(pipeline.paid_decoders, ["vision-ocr"])
+
+        img = Image.new("RGB", (10, 10))
+        results, timeline = asyncio.run(pipeline.run_parallel_debug(img, b"", exclude=pipeline.paid_decoders))
+        self.assertEqual([b.data for b in results], ["111"])
+        self.assertEqual(paid.calls, 0)
+        self.assertEqual([t['decoder'] for t in timeline], ["zbar", "vision-ocr"])
+        self.assertTrue(timeline[1]['skipped'])
+
+        results, timeline = pipeline.run_debug(img, b"", exclude=["zbar"])
+        self.assertEqual([b.data for b in results], ["222"])
+        self.assertEqual(local.calls, 1)
+
+
+class PipelineFallbackTestCase(unittest.TestCase):
+    """A fallback decoder only runs when its primary found nothing."""
+
+    def _pipeline(self, primary_data):
+        primary = _StubDecoder("gg-label-local", primary_data)
+        if not primary_data:
+            primary.decode = lambda image, image_bytes: []
+        network = _StubDecoder("gg-label-improved", "GG1", paid=True)
+        pipeline = DecoderPipeline([primary, network], fallbacks={"gg-label-improved": "gg-label-local"})
+        return pipeline, network
+
+    def test_fallback_skipped_when_primary_succeeds(self):
+        img = Image.new("RGB", (10, 10))
+        pipeline, network = self._pipeline("GG2")
+        results, timeline = asyncio.run(pipeline.run_parallel_debug(img, b""))
+        self.assertEqual([b.data for b in results], ["GG2"])
+        self.assertEqual(network.calls, 0)
+        self.assertTrue(timeline[1]['skipped'])
+
+        results, timeline = pipeline.run_debug(img, b"")
+        self.assertEqual(network.calls, 0)
+        self.assertTrue(timeline[1]['skipped'])
+
+    def test_fallback_runs_when_primary_empty(self):
+        img = Image.new("RGB", (10, 10))
+        pipeline, network = self._pipeline(None)
+        results, _ = asyncio.run(pipeline.run_parallel_debug(img, b""))
+        self.assertEqual([b.data for b in results], ["GG1"])
+        pipeline.run_debug(img, b"")
+        self.assertEqual(network.calls, 2)
+
+
+class PipelineSmartModeTestCase(unittest.TestCase):
+    """Smart mode skips slow decoders only for real barcodes and honours fallbacks."""
+
+    def _decoders(self, local_symbology):
+        local = _StubDecoder("gg-label-local", "GG747")
+        local.decode = lambda image, image_bytes: [Barcode(local_symbology, "GG747", "gg-label-local")]
+        vision = _StubDecoder("vision-ocr", "222", paid=True)
+        network = _StubDecoder("gg-label-improved", "GG1", paid=True)
+        pipeline = DecoderPipeline([local, vision, network], fallbacks={"gg-label-improved": "gg-label-local"})
+        return pipeline, vision, network
+
+    def test_gg_label_does_not_skip_slow_decoders(self):
+        pipeline, vision, network = self._decoders("GG_LABEL")
+        results, timeline = asyncio.run(pipeline.run_smart_parallel_debug(Image.new("RGB", (10, 10)), b""))
+        self.assertEqual([b.data for b in results], ["GG747", "222"])
+        self.assertEqual((vision.calls, network.calls), (1, 0))  # fallback not needed: the local reader succeeded
+        self.assertTrue(timeline[2]['skipped'])
+
+    def test_real_barcode_skips_slow_decoders(self):
+        pipeline, vision, network = self._decoders("EAN13")
+        results, _ = asyncio.run(pipeline.run_smart_parallel_debug(Image.new("RGB", (10, 10)), b""))
+        self.assertEqual([b.data for b in results], ["GG747"])
+        self.assertEqual((vision.calls, network.calls), (0, 0))
+
+
+class PipelineProvenanceTestCase(unittest.TestCase):
+    """Results name the photo they came from and survive the upload payload."""
+
+    def test_photo_index_bbox_and_payload(self):
+        from shoesbot.decoders.base import relative_bbox
+        from shoesbot.models import barcode_from_payload, barcode_to_payload
+
+        located = _StubDecoder("opencv-qr", "333")
+        bbox = relative_bbox([(10, 20), (30, 25), (20, 60)], 100, 200)
+        self.assertEqual(bbox, (0.1, 0.1, 0.2, 0.2))
+        located.decode = lambda image, image_bytes: [
+            Barcode("QRCODE", "333", "opencv-qr", bbox=bbox, confidence=0.9)]
+        pipeline = DecoderPipeline([_StubDecoder("zbar", "111"), located])
+        img = Image.new("RGB", (10, 10))
+
+        results, _ = asyncio.run(pipeline.run_smart_parallel_debug(img, b"", photo_index=3))
+        self.assertEqual([b.photo_index for b in results], [3, 3])
+        self.assertIsNone(pipeline.run(img, b"")[0].photo_index)
+
+        payload = barcode_to_payload(results[1])
+        self.assertEqual(payload["photo_index"], 3)
+        self.assertEqual(payload["bbox"], [0.1, 0.1, 0.2, 0.2])
+        self.assertEqual(barcode_from_payload(payload), results[1])
@@ -0,0 +1,71 @@
+"""
+Tests for the shared per-photo preprocessing cache.
+"""
+import threading
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from shoesbot.preprocess import PreparedImage, prepare
+
+
+def make_image(width=800, height=600):
+    gray = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    return Image.fromarray(np.stack([gray] * 3, axis=-1), "RGB")
+
+
+class PreprocessTestCase(unittest.TestCase):
+    """Variants are built once per photo and shared read-only."""
+
+    def test_prepare_returns_same_cache_for_same_frame(self):
+        image = make_image()
+        self.assertIs(prepare(image), prepare(image))
+        self.assertIsNot(prepare(image), prepare(make_image()))
+
+    def test_arrays_are_memoized_and_read_only(self):
+        prepared = PreparedImage(make_image())
+        gray = prepared.array("gray")
+        self.assertEqual(gray.shape, (600, 800))
+        self.assertIs(gray.base, prepared.array("gray").base)
+        with self.assertRaises(ValueError):
+            gray[0, 0] = 1
+        binarized = prepared.array("binarized")
+        self.assertEqual(set(np.unique(binarized)), {0, 255})
+        with self.assertRaises(KeyError):
+            prepared.array("nope")
+        # The RGB copy of the frame is not kept, only the one-byte planes
+        self.assertEqual(prepared.array("rgb").shape, (600, 800, 3))
+        self.assertEqual(sorted(prepared._cache), ["binarized", "gray"])
+
+    def test_recipes_encode_once_without_keeping_intermediates(self):
+        prepared = PreparedImage(make_image())
+        self.assertEqual(prepared.pil("high_contrast").width, 2000)
+        self.assertEqual(prepared.pil("vision_direct").width, 2000)
+        png = prepared.encoded("ocr", "PNG")
+        self.assertTrue(png.startswith(b"\x89PNG"))
+        self.assertIs(png, prepared.encoded("ocr", "png"))
+        self.assertTrue(prepared.encoded("ocr", "JPEG").startswith(b"\xff\xd8"))
+        # Only the encodings stay alive with the frame, not the upscaled images
+        self.assertEqual(sorted(prepared._cache), [("encoded", "ocr", "JPEG"), ("encoded", "ocr", "PNG")])
+
+    def test_concurrent_requests_build_once(self):
+        prepared = PreparedImage(make_image())
+        calls = []
+        original = prepared._gray
+
+        def counting_gray():
+            calls.append(1)
+            return original()
+
+        prepared._gray = counting_gray
+        threads = [threading.Thread(target=prepared.array, args=("gray",)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
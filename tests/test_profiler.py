@@ -0,0 +1,60 @@
+"""
+Tests for the single-album profiler behind /profile.
+"""
+import asyncio
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from shoesbot.profiler import AlbumProfiler, stage
+
+
+def busy_decoder(n):
+    return sum(i * i for i in range(n))
+
+
+class AlbumProfilerTestCase(unittest.TestCase):
+    """Only the armed chat is profiled and the report covers stages, threads and memory."""
+
+    def test_profiles_next_album_of_armed_chat(self):
+        profiler = AlbumProfiler()
+        profiler.arm(42)
+
+        async def album():
+            self.assertIsNone(profiler.begin(7))  # not armed
+            session = profiler.begin(42)
+            self.assertIsNotNone(session)
+            self.assertIsNone(profiler.begin(42))  # armed once
+            with stage("download"):
+                await asyncio.sleep(0.01)
+            with stage("decoders"):
+                await asyncio.gather(*(asyncio.to_thread(profiler.wrap_call(busy_decoder), 20000) for _ in range(3)))
+            time.sleep(0.12)  # blocks the loop: shows up as lag
+            await asyncio.sleep(0.06)
+            return await profiler.end(session)
+
+        report = asyncio.run(album())
+        self.assertIsNone(profiler.active)
+        self.assertIn("download:", report.text)
+        self.assertIn("decoders:", report.text)
+        self.assertIn("3 decoder calls", report.text)
+        self.assertIn("Память", report.text)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, report.filename)
+            with open(path, "wb") as fh:
+                fh.write(report.stats)
+            functions = {func for (_, _, func) in pstats.Stats(path).stats}
+        self.assertIn("busy_decoder", functions)
+
+    def test_no_overhead_outside_session(self):
+        profiler = AlbumProfiler()
+        with stage("download"):
+            pass
+        self.assertEqual(profiler.wrap_call(busy_decoder)(10), busy_decoder(10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests for the progressive card state machine.
+"""
+import asyncio
+import unittest
+
+from shoesbot.models import Barcode
+from shoesbot.progressive_card import CardState, ProgressiveCard
+
+
+class _Message:
+    def __init__(self, text):
+        self.text = text
+
+
+class ProgressiveCardTestCase(unittest.TestCase):
+    """Sent once ready, edited in place, finished exactly once."""
+
+    def _card(self, log):
+        async def send(html):
+            log.append(("send", html))
+            return _Message(html)
+
+        async def edit(message, html):
+            log.append(("edit", html))
+            message.text = html
+
+        return ProgressiveCard(
+            "corr1",
+            render=lambda codes: ",".join(b.data for b in codes),
+            ready=lambda codes: {"GG1", "Q1"} <= {b.data for b in codes},
+            send=send, edit=edit, edit_interval=0.01,
+        )
+
+    def test_shown_on_pair_then_edited_and_finished(self):
+        log = []
+
+        async def run():
+            card = self._card(log)
+            card.add([Barcode("GG_LABEL", "GG1", "gg-label-local")])
+            await asyncio.sleep(0.02)
+            self.assertEqual(card.state, CardState.WAITING)
+            card.add([Barcode("CODE39", "Q1", "zbar")])
+            await asyncio.sleep(0.02)
+            self.assertEqual(card.state, CardState.SHOWN)
+            card.add([Barcode("EAN13", "123", "vision-ocr"), Barcode("CODE39", "Q1", "zbar")])
+            card.add([Barcode("EAN13", "456", "vision-ocr")])
+            await asyncio.sleep(0.05)
+            message = await card.finish("final")
+            card.add([Barcode("EAN13", "789", "vision-ocr")])
+            await asyncio.sleep(0.02)
+            return card, message
+
+        card, message = asyncio.run(run())
+        self.assertEqual(card.state, CardState.FINAL)
+        self.assertEqual(message.text, "final")
+        self.assertEqual(log[0], ("send", "GG1,Q1"))
+        self.assertEqual(log[-1], ("edit", "final"))
+        self.assertEqual([kind for kind, _ in log].count("send"), 1)
+        self.assertIn(("edit", "GG1,Q1,123,456"), log)
+
+    def test_finish_sends_when_never_ready(self):
+        log = []
+
+        async def run():
+            card = self._card(log)
+            card.add([Barcode("EAN13", "123", "zbar")])
+            await asyncio.sleep(0.02)
+            return await card.finish("no pair")
+
+        message = asyncio.run(run())
+        self.assertEqual(log, [("send", "no pair")])
+        self.assertEqual(message.text, "no pair")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+"""
+Tests for the local image quality gate.
+"""
+import unittest
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from shoesbot.quality import assess
+
+
+def _texture(size=(960, 1280), seed=0) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    gray = rng.integers(40, 220, size=(size[1], size[0]), dtype=np.uint8)
+    return Image.fromarray(np.stack([gray] * 3, axis=-1), "RGB")
+
+
+class QualityGateTestCase(unittest.TestCase):
+    """Blur, exposure and sticker heuristics on synthetic frames."""
+
+    def test_sharp_frame_is_usable(self):
+        report = assess(_texture())
+        self.assertTrue(report.usable)
+        self.assertEqual(report.issues, ())
+
+    def test_blurred_frame_is_flagged(self):
+        report = assess(_texture().filter(ImageFilter.GaussianBlur(12)))
+        self.assertIn("blurry", report.issues)
+        self.assertFalse(report.usable)
+
+    def test_dark_and_overexposed_frames(self):
+        self.assertIn("dark", assess(Image.new("RGB", (640, 480), (5, 5, 5))).issues)
+        self.assertIn("overexposed", assess(Image.new("RGB", (640, 480), (255, 255, 255))).issues)
+
+    def test_sticker_presence(self):
+        img = _texture()
+        self.assertFalse(assess(img).has_sticker)
+        img.paste((235, 230, 40), (300, 500, 600, 650))
+        self.assertTrue(assess(img).has_sticker)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the decoder pipeline.
+
+Replays recorded Vision/OpenAI responses (a "cassette") for the checked-in
+image corpus, so decoder changes can be judged without API keys.  For each
+pipeline mode (run_debug, run_parallel_debug, run_smart_parallel_debug) it
+measures end-to-end latency, CPU time, peak traced memory, per-decoder
+latency and hit rate, and compares them with stored baselines.
+
+    python tools/bench_decoders.py --record            # record the cassette (live keys)
+    python tools/bench_decoders.py --update-baselines  # accept current numbers
+    python tools/bench_decoders.py --check             # fail on regressions
+
+No cassette or baselines are checked in yet: record both on a machine with
+live API keys and libzbar, then commit them together.  Until then --check
+exits 1 before benchmarking and says what is missing.  Baselines are only accepted
+from a recorded cassette, and --check refuses baselines taken with a
+different setup (latency scale, OpenAI decoder, zbar availability), so it
+never compares replay data against numbers it was not produced with.
+
+Cassette format: responses[<corpus path>][<service>] = {"text", "ms"}; one
+entry per photo and service ("vision", "openai"), replayed for every request
+made while that photo is being decoded, after sleeping ``ms * latency_scale``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional
+from unittest import mock
+
+# Add project root to path
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from PIL import Image
+
+from shoesbot.pipeline import DecoderPipeline, default_pipeline
+
+CORPUS = ROOT / "benchmarks" / "corpus.json"
+CASSETTE = ROOT / "benchmarks" / "cassettes" / "default.json"
+BASELINES = ROOT / "benchmarks" / "baselines.json"
+
+MODES = {
+    "debug": "run_debug",
+    "parallel": "run_parallel_debug",
+    "smart": "run_smart_parallel_debug",
+}
+
+# Allowed regression before --check fails: time/memory relative + absolute slack
+TOLERANCES = {
+    "time": 0.5,
+    "time_slack_ms": 25.0,
+    "memory": 0.25,
+    "memory_slack_mb": 2.0,
+}
+
+SERVICES = {
+    "vision.googleapis.com": "vision",
+    "api.openai.com": "openai",
+}
+
+
+def _service(url: str) -> Optional[str]:
+    for host, service in SERVICES.items():
+        if host in url:
+            return service
+    return None
+
+
+class _Response:
+    """Minimal stand-in for requests.Response."""
+
+    def __init__(self, payload: Dict[str, Any], status_code: int = 200):
+        self._payload = payload
+        self.status_code = status_code
+        self.ok = status_code == 200
+        self.text = json.dumps(payload)
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+
+def _vision_payload(request_json: Dict[str, Any], text: str) -> Dict[str, Any]:
+    annotation = {"fullTextAnnotation": {"text": text}, "textAnnotations": [{"description": text}]} if text else {}
+    return {"responses": [annotation for _ in request_json.get("requests", [{}])]}
+
+
+def _openai_payload(text: str) -> Dict[str, Any]:
+    return {"choices": [{"message": {"content": text}}]}
+
+
+def _response_text(service: str, payload: Dict[str, Any]) -> str:
+    try:
+        if service == "vision":
+            first = (payload.get("responses") or [{}])[0]
+            return first.get("fullTextAnnotation", {}).get("text", "")
+        return payload["choices"][0]["message"]["content"]
+    except Exception:
+        return ""
+
+
+class Cassette:
+    """Replays (or records) network responses for the photo currently decoded.
+
+    Photos are benchmarked one at a time, so ``current`` identifies the photo
+    for every request, including those made from decoder worker threads.
+    """
+
+    def __init__(self, responses: Dict[str, Dict[str, Dict[str, Any]]], latency_scale: float = 1.0,
+                 record: bool = False, meta: Optional[Dict[str, Any]] = None):
+        self.responses = responses
+        self.meta = meta or {}
+        self.latency_scale = latency_scale
+        self.record = record
+        self.current: Optional[str] = None
+        self.calls: Dict[str, int] = {}
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._real_post = None
+
+    @classmethod
+    def load(cls, path: Path, **kwargs) -> "Cassette":
+        data = json.loads(path.read_text()) if path.exists() else {}
+        return cls(data.get("responses", {}), meta=data.get("meta"), **kwargs)
+
+    @property
+    def recorded(self) -> bool:
+        """True for cassettes written by --record (live API answers)."""
+        return bool(self.meta.get("recorded_at"))
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"meta": {"recorded_at": time.strftime("%Y-%m-%d")}, "responses": self.responses}
+        path.write_text(json.dumps(data, indent=2, ensure_ascii=False) + "\n")
+
+    def post(self, url, *args, **kwargs):
+        service = _service(url)
+        if service is None:
+            raise RuntimeError(f"bench: unexpected network call to {url}")
+        with self._lock:
+            self.calls[service] = self.calls.get(service, 0) + 1
+        if self.record:
+            return self._record(service, url, *args, **kwargs)
+        entry = self.responses.get(self.current, {}).get(service)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            entry = {"text": "", "ms": 0}
+        time.sleep(entry.get("ms", 0) / 1000.0 * self.latency_scale)
+        if service == "vision":
+            return _Response(_vision_payload(kwargs.get("json") or {}, entry["text"]))
+        return _Response(_openai_payload(entry["text"]))
+
+    def _record(self, service: str, url: str, *args, **kwargs):
+        t0 = perf_counter()
+        resp = self._real_post(url, *args, **kwargs)
+        ms = int((perf_counter() - t0) * 1000)
+        text = _response_text(service, resp.json()) if resp.ok else ""
+        with self._lock:
+            slot = self.responses.setdefault(self.current, {})
+            # Keep the richest answer when a decoder sends several variants
+            if service not in slot or len(text) > len(slot[service]["text"]):
+                slot[service] = {"text": text, "ms": ms}
+        return resp
+
+    @contextmanager
+    def install(self) -> Iterator["Cassette"]:
+        """Route requests.post through the cassette (decoders need some API key set)."""
+        import requests
+        self._real_post = requests.post
+        keys = ("GOOGLE_VISION_API_KEY", "OPENAI_API_KEY")
+        env = {} if self.record else {k: os.environ.get(k) or "replay" for k in keys}
+        with mock.patch.dict(os.environ, env), mock.patch("requests.post", side_effect=self.post):
+            yield self
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _run_mode(pipeline: DecoderPipeline, mode: str, image: Image.Image, image_bytes: bytes):
+    method = getattr(pipeline, MODES[mode])
+    if mode == "debug":
+        return method(image, image_bytes)
+    return asyncio.run(method(image, image_bytes))
+
+
+def _load(root: Path, path: str):
+    image_bytes = (root / path).read_bytes()
+    image = Image.open(root / path).convert("RGB")
+    return image, image_bytes
+
+
+def bench_mode(pipeline: DecoderPipeline, mode: str, corpus: Dict[str, Any], cassette: Cassette,
+               measure_memory: bool = True) -> Dict[str, Any]:
+    """Benchmark one pipeline mode over the corpus."""
+    root = ROOT / corpus["root"]
+    images = corpus["images"]
+    wall_ms: List[float] = []
+    cpu_ms: List[float] = []
+    decoder_ms: Dict[str, List[float]] = {}
+    expected_total = found_total = false_gg = 0
+    per_image = []
+
+    for item in images:
+        image, image_bytes = _load(root, item["path"])
+        cassette.current = item["path"]
+        t0, c0 = perf_counter(), time.process_time()
+        results, timeline = _run_mode(pipeline, mode, image, image_bytes)
+        wall_ms.append((perf_counter() - t0) * 1000)
+        cpu_ms.append((time.process_time() - c0) * 1000)
+        for entry in timeline:
+            if not entry.get("skipped"):
+                decoder_ms.setdefault(entry["decoder"], []).append(entry["ms"])
+        found = {b.data for b in results}
+        expected = set(item["expected"])
+        expected_total += len(expected)
+        found_total += len(expected & found)
+        false_gg += len({d for d in found if d.startswith("GG")} - expected)
+        per_image.append({"image": item["path"], "found": sorted(found), "expected": sorted(expected),
+                          "ms": round(wall_ms[-1], 1)})
+
+    peak_mb = 0.0
+    if measure_memory:
+        # Separate pass: tracemalloc slows allocations down and would skew timings
+        tracemalloc.start()
+        try:
+            for item in images:
+                image, image_bytes = _load(root, item["path"])
+                cassette.current = item["path"]
+                tracemalloc.reset_peak()
+                _run_mode(pipeline, mode, image, image_bytes)
+                peak_mb = max(peak_mb, tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "e2e_p50_ms": round(_percentile(wall_ms, 50), 1),
+        "e2e_p95_ms": round(_percentile(wall_ms, 95), 1),
+        "cpu_ms_per_image": round(statistics.mean(cpu_ms), 1) if cpu_ms else 0.0,
+        "peak_mb": round(peak_mb, 1),
+        "hit_rate": round(found_total / expected_total, 3) if expected_total else 1.0,
+        "false_gg": false_gg,
+        "decoders": {
+            name: {"mean_ms": round(statistics.mean(ms), 1), "p95_ms": round(_percentile(ms, 95), 1), "runs": len(ms)}
+            for name, ms in decoder_ms.items()
+        },
+        "images": per_image,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerances: Dict[str, float] = TOLERANCES) -> List[str]:
+    """Regressions of ``current`` against ``baseline`` (both keyed by mode)."""
+    failures = []
+
+    def check_time(label, now, base):
+        limit = base * (1 + tolerances["time"]) + tolerances["time_slack_ms"]
+        if now > limit:
+            failures.append(f"{label}: {now:.1f}ms > {limit:.1f}ms (baseline {base:.1f}ms)")
+
+    for mode, base in baseline.items():
+        now = current.get(mode)
+        if now is None:
+            continue
+        for key in ("e2e_p50_ms", "e2e_p95_ms", "cpu_ms_per_image"):
+            check_time(f"{mode}.{key}", now[key], base[key])
+        for name, stats in base.get("decoders", {}).items():
+            if name in now["decoders"]:
+                check_time(f"{mode}.{name}.mean_ms", now["decoders"][name]["mean_ms"], stats["mean_ms"])
+        if base.get("peak_mb") and now.get("peak_mb"):
+            limit = base["peak_mb"] * (1 + tolerances["memory"]) + tolerances["memory_slack_mb"]
+            if now["peak_mb"] > limit:
+                failures.append(f"{mode}.peak_mb: {now['peak_mb']:.1f}MB > {limit:.1f}MB")
+        if now["hit_rate"] < base["hit_rate"]:
+            failures.append(f"{mode}.hit_rate: {now['hit_rate']} < {base['hit_rate']}")
+        if now["false_gg"] > base["false_gg"]:
+            failures.append(f"{mode}.false_gg: {now['false_gg']} > {base['false_gg']}")
+    return failures
+
+
+def _strip(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Baseline view of a report (no per-image details)."""
+    return {mode: {k: v for k, v in stats.items() if k != "images"} for mode, stats in report.items()}
+
+
+def check_inputs(cassette: Cassette, cassette_path: Path, baselines_path: Path) -> List[str]:
+    """Why --check cannot run (empty when it can): it needs a recorded cassette and baselines."""
+    problems = []
+    if not cassette_path.exists():
+        problems.append(f"no cassette at {cassette_path}")
+    elif not cassette.recorded:
+        problems.append(f"{cassette_path} was not recorded with --record")
+    if not baselines_path.exists():
+        problems.append(f"no baselines at {baselines_path}")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline decoder pipeline benchmark")
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--cassette", type=Path, default=CASSETTE)
+    parser.add_argument("--baselines", type=Path, default=BASELINES)
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated: " + ", ".join(MODES))
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for recorded API latency")
+    parser.add_argument("--with-openai", action="store_true", help="include the OpenAI barcode decoder")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--record", action="store_true", help="call live APIs and rewrite the cassette")
+    parser.add_argument("--check", action="store_true", help="exit 1 if numbers regress past baselines")
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("-o", "--output", type=Path, help="write the full JSON report")
+    args = parser.parse_args(argv)
+
+    corpus = json.loads(args.corpus.read_text())
+    cassette = Cassette.load(args.cassette, latency_scale=args.latency_scale, record=args.record)
+    if args.check and not args.record:
+        problems = check_inputs(cassette, args.cassette, args.baselines)
+        if problems:
+            for problem in problems:
+                print(f"❌ --check: {problem}")
+            print("   Record them first: --record --update-baselines (live API keys and libzbar)")
+            return 1
+    pipeline = default_pipeline(with_openai=args.with_openai)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+
+    report: Dict[str, Any] = {}
+    with cassette.install():
+        # Warm up lazy state (templates, imports) outside the measurements
+        first = corpus["images"][0]["path"]
+        cassette.current = first
+        _run_mode(pipeline, "debug", *_load(ROOT / corpus["root"], first))
+        for mode in modes:
+            print(f"⏱️  {mode} ({MODES[mode]}) on {len(corpus['images'])} images...")
+            report[mode] = bench_mode(pipeline, mode, corpus, cassette, measure_memory=not args.no_memory)
+            stats = report[mode]
+            print(f"  e2e p50 {stats['e2e_p50_ms']}ms, p95 {stats['e2e_p95_ms']}ms, "
+                  f"cpu {stats['cpu_ms_per_image']}ms/img, peak {stats['peak_mb']}MB, "
+                  f"hit rate {stats['hit_rate']}, false GG {stats['false_gg']}")
+            for name, d in stats["decoders"].items():
+                print(f"    • {name}: mean {d['mean_ms']}ms, p95 {d['p95_ms']}ms ({d['runs']} runs)")
+
+    if cassette.misses:
+        print(f"⚠️  {cassette.misses} requests had no recorded response (replayed as empty)")
+    if args.record:
+        cassette.save(args.cassette)
+        print(f"💾 Cassette saved to {args.cassette}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    from shoesbot.decoders.zbar_decoder import HAS_ZBAR
+    meta = {"latency_scale": args.latency_scale, "with_openai": args.with_openai, "zbar": HAS_ZBAR}
+    if args.update_baselines:
+        if not (args.record or cassette.recorded):
+            print(f"❌ {args.cassette} was not recorded with --record; baselines from it would prove nothing")
+            return 1
+        if not HAS_ZBAR:
+            print("❌ libzbar is not available; install it before taking baselines")
+            return 1
+        args.baselines.write_text(json.dumps({"meta": meta, "modes": _strip(report)}, indent=2) + "\n")
+        print(f"💾 Baselines saved to {args.baselines}")
+    if args.check:
+        stored = json.loads(args.baselines.read_text())
+        if stored.get("meta") != meta:
+            print(f"❌ Baselines were recorded with {stored.get('meta')}, current run uses {meta}")
+            return 1
+        failures = compare(report, stored["modes"])
+        for failure in failures:
+            print(f"❌ {failure}")
+        if failures:
+            return 1
+        print("✅ No regressions against baselines")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
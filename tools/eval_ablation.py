@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Decoder ablation over a large photo archive.
+
+Every decoder runs once per photo in a process pool; outputs of network
+decoders are kept in the shared decode cache (shoesbot/decode_cache.py) with
+their original latency and cost, so re-runs over thousands of photos cost
+nothing.  Every decoder subset is then scored analytically:
+
+- parallel: all decoders of the subset at once, latency = slowest decoder
+- parallel + fallback: the improved GG OCR only where the local GG reader
+  found nothing (what the bot runs)
+- sequential: every ordering of the subset, stopping at the first GG label
+
+and the latency-vs-hit-rate and cost-vs-hit-rate Pareto fronts are reported.
+Ground truth comes from a corpus file (benchmarks/corpus.json format); without
+one the union of all decoders' codes is used, so hit rate is recall relative
+to running everything.
+
+    python tools/eval_decoders.py shoessite/media/photos --ablation -o eval_results/ablation.json
+    python tools/eval_decoders.py --ablation --truth benchmarks/corpus.json --workers 4
+"""
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, permutations
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Add project root to path
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+DECODERS = ("zbar", "opencv-qr", "gg-label-local", "vision-ocr", "gg-label", "gg-label-improved", "openai-barcode")
+FALLBACKS = {"gg-label-improved": "gg-label-local"}
+MAX_CODES = 64  # codes tracked per photo (bitmask width)
+
+# USD per request feature (Vision) and per 1M tokens (OpenAI input, output)
+VISION_PRICE = 0.0015
+OPENAI_PRICES = {"gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00)}
+OPENAI_FALLBACK_COST = 0.0003  # when the response has no usage block
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def _make_decoder(name: str):
+    if name == "zbar":
+        from shoesbot.decoders.zbar_decoder import ZBarDecoder
+        return ZBarDecoder()
+    if name == "opencv-qr":
+        from shoesbot.decoders.cv_qr_decoder import OpenCvQrDecoder
+        return OpenCvQrDecoder()
+    if name == "gg-label-local":
+        from shoesbot.decoders.gg_label_local import LocalGGLabelDecoder
+        return LocalGGLabelDecoder()
+    if name == "vision-ocr":
+        from shoesbot.decoders.vision_decoder import VisionDecoder
+        return VisionDecoder()
+    if name == "gg-label":
+        from shoesbot.decoders.gg_label_decoder import GGLabelDecoder
+        return GGLabelDecoder()
+    if name == "gg-label-improved":
+        from shoesbot.decoders.gg_label_decoder_improved import ImprovedGGLabelDecoder
+        return ImprovedGGLabelDecoder()
+    if name == "openai-barcode":
+        from shoesbot.decoders.openai_barcode_decoder import OpenAIBarcodeDecoder
+        return OpenAIBarcodeDecoder()
+    raise ValueError(f"unknown decoder {name}")
+
+
+class CostMeter:
+    """Prices the paid API calls made through requests.post in this process.
+
+    A worker runs one decoder at a time, so a process-wide total is enough
+    (decoders may fan out to their own threads).
+    """
+
+    def __init__(self):
+        self.cost = 0.0
+        self.ok_calls = 0
+        self._lock = threading.Lock()
+
+    def install(self) -> None:
+        import requests
+        original = requests.post
+
+        def post(url, *args, **kwargs):
+            resp = original(url, *args, **kwargs)
+            self.record(str(url), kwargs.get("json") or {}, resp)
+            return resp
+
+        requests.post = post
+
+    def record(self, url: str, body: dict, resp) -> None:
+        if resp.status_code != 200:
+            return
+        if "images:annotate" in url:
+            cost = VISION_PRICE * sum(len(r.get("features", [])) for r in body.get("requests", []))
+        elif "chat/completions" in url:
+            try:
+                usage = resp.json().get("usage") or {}
+            except ValueError:
+                usage = {}
+            price_in, price_out = OPENAI_PRICES.get(body.get("model", ""), OPENAI_PRICES["gpt-4o"])
+            if usage:
+                cost = (usage.get("prompt_tokens", 0) * price_in + usage.get("completion_tokens", 0) * price_out) / 1e6
+            else:
+                cost = OPENAI_FALLBACK_COST
+        else:
+            cost = 0.0
+        with self._lock:
+            self.cost += cost
+            self.ok_calls += 1
+
+    def reset(self) -> Tuple[float, int]:
+        with self._lock:
+            out = (self.cost, self.ok_calls)
+            self.cost, self.ok_calls = 0.0, 0
+            return out
+
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(names: Sequence[str], cache_path: Optional[str]) -> None:
+    from shoesbot.decode_cache import DecodeCache
+    meter = CostMeter()
+    meter.install()
+    _worker.update(
+        decoders=[_make_decoder(n) for n in names],
+        cache=DecodeCache(cache_path) if cache_path else None,
+        meter=meter,
+    )
+
+
+def evaluate_photo(path: str) -> Dict[str, Any]:
+    """Run every decoder on one photo; paid decoders go through the cache."""
+    from PIL import Image
+    from shoesbot.decode_cache import image_key
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = image_key(raw)
+    out: Dict[str, Any] = {"path": path, "decoders": {}}
+    try:
+        img = Image.open(path).convert("RGB")
+    except Exception as e:
+        out["error"] = str(e)
+        return out
+
+    cache, meter = _worker["cache"], _worker["meter"]
+    for decoder in _worker["decoders"]:
+        paid = getattr(decoder, "paid", False)
+        cached = cache.get(digest, decoder.name) if (cache and paid) else None
+        if cached is not None:
+            out["decoders"][decoder.name] = {
+                "codes": [[b.symbology, b.data] for b in cached.barcodes],
+                "ms": cached.ms, "cost": cached.cost, "cached": True,
+            }
+            continue
+        meter.reset()
+        t0 = perf_counter()
+        error = None
+        try:
+            barcodes = decoder.decode(img, raw)
+        except Exception as e:
+            barcodes, error = [], str(e)
+        ms = int((perf_counter() - t0) * 1000)
+        cost, calls = meter.reset()
+        if paid and calls == 0:
+            # no key / quota / network error: unusable for the ablation, never cached
+            error = error or "no successful API call"
+        elif cache and paid and error is None:
+            cache.put(digest, decoder.name, barcodes, ms, cost)
+        out["decoders"][decoder.name] = {
+            "codes": [[b.symbology, b.data] for b in barcodes],
+            "ms": ms, "cost": cost, "cached": False, "error": error,
+        }
+    return out
+
+
+def list_photos(test_dir: Path, limit: Optional[int] = None) -> List[str]:
+    photos = sorted(str(p) for p in test_dir.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    return photos[:limit] if limit else photos
+
+
+def run_photos(paths: Sequence[str], names: Sequence[str], workers: int,
+               cache_path: Optional[str], progress: bool = True) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(tuple(names), cache_path)) as pool:
+        for n, result in enumerate(pool.map(evaluate_photo, paths, chunksize=4), 1):
+            results.append(result)
+            if progress and (n % 50 == 0 or n == len(paths)):
+                print(f"  {n}/{len(paths)} photos")
+    return results
+
+
+def _is_gg(code: Tuple[str, str]) -> bool:
+    return code[0] == "GG_LABEL" or code[1].startswith("GG")
+
+
+class Matrix:
+    """Per photo and decoder: found-code bitmasks, latency and cost as arrays."""
+
+    def __init__(self, photos: List[Dict[str, Any]], names: Sequence[str],
+                 truth: Optional[Dict[str, List[str]]] = None):
+        photos = [p for p in photos if "error" not in p]
+        self.names = list(names)
+        n = len(photos)
+        self.found = {d: np.zeros(n, np.uint64) for d in names}
+        self.ms = {d: np.zeros(n) for d in names}
+        self.cost = {d: np.zeros(n) for d in names}
+        self.truth = np.zeros(n, np.uint64)
+        self.gg_truth = np.zeros(n, np.uint64)
+        self.gg_any = np.zeros(n, np.uint64)
+        self.unavailable: Dict[str, int] = {d: 0 for d in names}
+
+        for i, photo in enumerate(photos):
+            universe: Dict[Tuple[str, str], int] = {}
+
+            def bit(code: Tuple[str, str]) -> int:
+                if code not in universe:
+                    universe[code] = len(universe)
+                return universe[code]
+
+            expected = truth.get(photo["path"]) if truth is not None else None
+            expected_bits = 0
+            for data in expected or []:
+                b = bit(("*", data))
+                if b < MAX_CODES:
+                    expected_bits |= 1 << b
+            for d in names:
+                res = photo["decoders"].get(d)
+                if res is None or res.get("error"):
+                    self.unavailable[d] += 1
+                    continue
+                mask = 0
+                for sym, data in res["codes"]:
+                    # codes match expected by data regardless of symbology
+                    b = bit(("*", data)) if expected is not None else bit((sym, data))
+                    if b < MAX_CODES:
+                        mask |= 1 << b
+                        if _is_gg((sym, data)):
+                            self.gg_any[i] |= np.uint64(1 << b)
+                self.found[d][i] = np.uint64(mask)
+                self.ms[d][i] = res["ms"]
+                self.cost[d][i] = res["cost"]
+            if expected is None:  # union of everything found
+                expected_bits = 0
+                for d in names:
+                    expected_bits |= int(self.found[d][i])
+            self.truth[i] = np.uint64(expected_bits)
+            gg_bits = 0
+            for code, b in universe.items():
+                if b < MAX_CODES and (expected_bits >> b) & 1 and code[1].startswith("GG"):
+                    gg_bits |= 1 << b
+            self.gg_truth[i] = np.uint64(gg_bits)
+        self.photos = n
+
+    def score(self, found: np.ndarray, ms: np.ndarray, cost: np.ndarray) -> Dict[str, float]:
+        hits = _popcount(found & self.truth).sum()
+        total = _popcount(self.truth).sum()
+        gg_photos = self.gg_truth != 0
+        return {
+            "hit_rate": round(float(hits / total), 4) if total else 0.0,
+            "gg_rate": round(float(((found & self.gg_truth) != 0)[gg_photos].mean()), 4) if gg_photos.any() else 0.0,
+            "false_codes": int(_popcount(found & ~self.truth).sum()),
+            "mean_ms": round(float(ms.mean()), 1) if len(ms) else 0.0,
+            "p95_ms": round(float(np.percentile(ms, 95)), 1) if len(ms) else 0.0,
+            "cost_per_1000": round(float(cost.mean() * 1000), 3) if len(cost) else 0.0,
+        }
+
+    def parallel(self, subset: Sequence[str], fallback: bool = False) -> Dict[str, float]:
+        found = np.zeros(self.photos, np.uint64)
+        ms = np.zeros(self.photos)
+        cost = np.zeros(self.photos)
+        for d in subset:
+            primary = FALLBACKS.get(d) if fallback else None
+            if primary in subset:
+                runs = self.found[primary] == 0
+                found |= np.where(runs, self.found[d], np.uint64(0))
+                ms = np.maximum(ms, self.ms[primary] + np.where(runs, self.ms[d], 0))
+                cost += np.where(runs, self.cost[d], 0)
+            else:
+                found |= self.found[d]
+                ms = np.maximum(ms, self.ms[d])
+                cost += self.cost[d]
+        return self.score(found, ms, cost)
+
+    def sequential(self, order: Sequence[str]) -> Dict[str, float]:
+        found = np.zeros(self.photos, np.uint64)
+        ms = np.zeros(self.photos)
+        cost = np.zeros(self.photos)
+        for d in order:
+            runs = (found & self.gg_any) == 0  # stop at the first GG label
+            found |= np.where(runs, self.found[d], np.uint64(0))
+            ms += np.where(runs, self.ms[d], 0)
+            cost += np.where(runs, self.cost[d], 0)
+        return self.score(found, ms, cost)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def ablation(matrix: Matrix, max_order: int = 4, names: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Score every subset in parallel (with and without fallback) and every ordering up to max_order."""
+    configs = []
+    names = list(names or matrix.names)
+    for k in range(1, len(names) + 1):
+        for subset in combinations(names, k):
+            configs.append({"mode": "parallel", "decoders": list(subset), **matrix.parallel(subset)})
+            if any(FALLBACKS.get(d) in subset for d in subset):
+                configs.append({"mode": "fallback", "decoders": list(subset), **matrix.parallel(subset, True)})
+            if 1 < k <= max_order:
+                for order in permutations(subset):
+                    configs.append({"mode": "sequential", "decoders": list(order), **matrix.sequential(order)})
+    return configs
+
+
+def pareto(configs: List[Dict[str, Any]], cost_key: str) -> List[Dict[str, Any]]:
+    """Configs no other config beats on both cost_key (lower) and hit_rate (higher)."""
+    front, best = [], -1.0
+    for c in sorted(configs, key=lambda c: (c[cost_key], -c["hit_rate"], -c["gg_rate"])):
+        if c["hit_rate"] > best:
+            front.append(c)
+            best = c["hit_rate"]
+    return front
+
+
+def _label(config: Dict[str, Any]) -> str:
+    sep = " > " if config["mode"] == "sequential" else " + "
+    return f"{config['mode']}: {sep.join(config['decoders'])}"
+
+
+def load_truth(path: Path) -> Tuple[List[str], Dict[str, List[str]]]:
+    corpus = json.loads(path.read_text())
+    root = ROOT / corpus["root"]
+    truth = {str(root / item["path"]): list(item.get("expected", [])) for item in corpus["images"]}
+    return list(truth), truth
+
+
+def run_ablation(test_dir: Optional[str], output_file: Optional[str] = None, truth_file: Optional[str] = None,
+                 workers: Optional[int] = None, limit: Optional[int] = None, with_openai: bool = True,
+                 cache_path: Optional[str] = None, max_order: int = 4) -> Dict[str, Any]:
+    from shoesbot.decode_cache import DECODE_CACHE_PATH
+
+    if truth_file:
+        paths, truth = load_truth(Path(truth_file))
+        paths = paths[:limit] if limit else paths
+    else:
+        paths, truth = list_photos(Path(test_dir), limit), None
+    if not paths:
+        print(f"❌ No images found in {test_dir}")
+        return {}
+    names = [d for d in DECODERS if with_openai or d != "openai-barcode"]
+    workers = workers or os.cpu_count() or 2
+    print(f"📸 {len(paths)} photos, {len(names)} decoders, {workers} workers")
+
+    t0 = perf_counter()
+    photos = run_photos(paths, names, workers, cache_path or DECODE_CACHE_PATH)
+    print(f"⏱️  decoded in {perf_counter() - t0:.1f}s")
+
+    matrix = Matrix(photos, names, truth)
+    # decoders without a single usable answer would look free and useless
+    available = [d for d in names if matrix.unavailable[d] < matrix.photos]
+    configs = ablation(matrix, max_order, available)
+    fronts = {"latency": pareto(configs, "mean_ms"), "cost": pareto(configs, "cost_per_1000")}
+
+    for axis, key, unit in (("latency", "mean_ms", "ms"), ("cost", "cost_per_1000", "$/1000")):
+        print(f"\n📈 Pareto front, {axis} vs hit rate")
+        for c in fronts[axis]:
+            print(f"  {c[key]:>9} {unit:<6} hit {c['hit_rate']:.3f}  GG {c['gg_rate']:.3f}  {_label(c)}")
+    missing = {d: n for d, n in matrix.unavailable.items() if n}
+    if missing:
+        print(f"\n⚠️  decoder output unavailable (no key / API error) for: {missing}")
+
+    report = {
+        "photos": matrix.photos,
+        "truth": truth_file or "union of all decoders",
+        "decoders": names,
+        "unavailable": matrix.unavailable,
+        "pareto": fronts,
+        "configs": configs,
+    }
+    if output_file:
+        output_path = Path(output_file)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(json.dumps(report, indent=1))
+        print(f"\n💾 Saved ablation report to {output_path}")
+    return report
@@ -229,15 +229,31 @@ if __name__ == '__main__':
     import argparse
     
     parser = argparse.ArgumentParser(description='Evaluate decoder pipeline performance')
-    parser.add_argument('test_dir', help='Directory containing test images')
+    parser.add_argument('test_dir', nargs='?', help='Directory containing test images (searched recursively with --ablation)')
     parser.add_argument('-o', '--output', help='Output file (JSON or CSV)')
     parser.add_argument('--baseline', action='store_true', help='Save as baseline for comparison')
+    ablation_args = parser.add_argument_group('ablation (every decoder subset and ordering, see tools/eval_ablation.py)')
+    ablation_args.add_argument('--ablation', action='store_true', help='Run the ablation matrix instead of one pipeline')
+    ablation_args.add_argument('--truth', help='Corpus JSON with expected codes (default: union of all decoders)')
+    ablation_args.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    ablation_args.add_argument('--limit', type=int, help='Evaluate only the first N photos')
+    ablation_args.add_argument('--no-openai', action='store_true', help='Leave the OpenAI barcode decoder out')
+    ablation_args.add_argument('--cache', help='Decode cache path (default: DECODE_CACHE_PATH)')
+    ablation_args.add_argument('--max-order', type=int, default=4, help='Longest subset whose orderings are scored')
     
     args = parser.parse_args()
     
     output_file = args.output
+    if args.ablation:
+        if not args.test_dir and not args.truth:
+            parser.error('test_dir or --truth is required')
+        from tools.eval_ablation import run_ablation
+        run_ablation(args.test_dir, output_file, truth_file=args.truth, workers=args.workers, limit=args.limit,
+                     with_openai=not args.no_openai, cache_path=args.cache, max_order=args.max_order)
+        sys.exit(0)
+    if not args.test_dir:
+        parser.error('test_dir is required')
     if args.baseline and not output_file:
         output_file = 'eval_results/baseline.json'
     
     run_evaluation(args.test_dir, output_file)
-
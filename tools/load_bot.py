@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the Telegram bot.
+
+N simulated chats send albums through the real Application
+(handle_photo -> PhotoBuffer -> album_scheduler -> process_photo_batch ->
+upload_batch_to_django).  Everything outside the process is played by the
+local mock gateway (tools/mock_gateway): the Bot API including get_file and
+file downloads, send_*/edit/delete, Vision, OpenAI and the Django upload
+endpoint, with optional latency/error/rate-limit injection.
+
+Reported: album latency percentiles (first photo sent -> batch processed),
+throughput, RSS, event loop lag and per-service request counts.
+
+    python tools/load_bot.py --chats 20 --albums 3
+    python tools/load_bot.py --synthetic --photos 8 --latency vision=400 --latency openai=1500
+    python tools/load_bot.py --ramp 5,10,20,40 -o load.json   # find the scaling limit
+
+Albums are recorded ones from the benchmark corpus (photos grouped by their
+album prefix) or, with --synthetic, generated noise photos with a GG sticker.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from io import BytesIO
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Add project root to path
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from PIL import Image, ImageDraw
+
+from tools.mock_gateway import MockGateway, ServiceConfig
+from tools.mock_gateway.__main__ import _per_service
+
+CORPUS = ROOT / "benchmarks" / "corpus.json"
+BOT_TOKEN = "123456:load-test"
+LAG_INTERVAL = 0.02  # event loop lag sampling period, seconds
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+def _rss_mb() -> Tuple[float, float]:
+    """Current and peak resident set size of this process."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak, peak
+
+
+def corpus_albums() -> List[List[bytes]]:
+    """Recorded albums: corpus photos grouped by album prefix (85c6f712_0, 85c6f712_1, ...)."""
+    corpus = json.loads(CORPUS.read_text())
+    albums: Dict[str, List[bytes]] = defaultdict(list)
+    for item in corpus["images"]:
+        album = item["path"].rsplit("_", 1)[0]
+        albums[album].append((ROOT / corpus["root"] / item["path"]).read_bytes())
+    return [photos for photos in albums.values() if len(photos) > 1]
+
+
+def synthetic_album(rng: random.Random, photos: int, label: str) -> List[bytes]:
+    """Phone-sized noise photos, the first one with a yellow GG sticker."""
+    out = []
+    for idx in range(photos):
+        img = Image.effect_noise((1280, 960), 40).convert("RGB")
+        if idx == 0:
+            draw = ImageDraw.Draw(img)
+            x, y = rng.randint(100, 700), rng.randint(100, 500)
+            draw.rectangle((x, y, x + 320, y + 180), fill=(235, 245, 60))
+            draw.text((x + 30, y + 100), label, fill=(0, 0, 0))
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=85)
+        out.append(buf.getvalue())
+    return out
+
+
+class AlbumTracker:
+    """Pairs album starts with process_photo_batch completions, per chat in order."""
+
+    def __init__(self):
+        self.started: Dict[int, Deque[Tuple[float, int]]] = defaultdict(deque)
+        self.latencies: List[float] = []
+        self.photos = 0  # photos in completed batches
+        self.merged = 0  # batches whose size differs from the album sent (buffer split/merge)
+        self.pending = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def start(self, chat_id: int, photos: int) -> None:
+        self.started[chat_id].append((perf_counter(), photos))
+        self.pending += 1
+        self.idle.clear()
+
+    def done(self, chat_id: int, photos: int) -> None:
+        if not self.started[chat_id]:
+            return
+        t0, sent = self.started[chat_id].popleft()
+        self.latencies.append((perf_counter() - t0) * 1000)
+        self.photos += photos
+        if sent != photos:
+            self.merged += 1
+        self.pending -= 1
+        if self.pending <= 0:
+            self.idle.set()
+
+
+async def _sample_lag(samples: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        t0 = perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, (perf_counter() - t0 - LAG_INTERVAL) * 1000))
+
+
+class LoadRun:
+    """One bot Application wired to the gateway; run() can be called per load level."""
+
+    def __init__(self, gateway: MockGateway, tracker: AlbumTracker):
+        from telegram import Update
+        import shoesbot.telegram_bot as bot_module
+
+        self.gateway = gateway
+        self.tracker = tracker
+        self.Update = Update
+        self.app = bot_module.build_app()
+        self._ids = iter(range(1, 10 ** 9))
+
+        original = bot_module.process_photo_batch
+
+        async def traced(chat_id, photo_items, context, status_msg=None):
+            try:
+                await original(chat_id, photo_items, context, status_msg)
+            finally:
+                tracker.done(chat_id, len(photo_items))
+
+        bot_module.process_photo_batch = traced
+
+    def photo_update(self, chat_id: int, photo: bytes, media_group_id: str):
+        file_id = f"load-{next(self._ids)}"
+        self.gateway.gateway.synthetic.files[file_id] = photo
+        width, height = Image.open(BytesIO(photo)).size
+        update_id = next(self._ids)
+        return self.Update.de_json({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id, "date": int(time.time()), "media_group_id": media_group_id,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": f"chat{chat_id}"},
+                "photo": [{"file_id": file_id, "file_unique_id": file_id, "width": width, "height": height,
+                           "file_size": len(photo)}],
+            },
+        }, self.app.bot)
+
+    async def chat(self, chat_id: int, albums: List[List[bytes]], delay: float,
+                   photo_gap: float, album_interval: float) -> None:
+        await asyncio.sleep(delay)
+        for n, photos in enumerate(albums):
+            started = perf_counter()
+            self.tracker.start(chat_id, len(photos))
+            for photo in photos:
+                await self.app.update_queue.put(self.photo_update(chat_id, photo, f"{chat_id}-{n}"))
+                await asyncio.sleep(photo_gap)
+            await asyncio.sleep(max(0.0, album_interval - (perf_counter() - started)))
+
+    async def run(self, workload: Dict[int, List[List[bytes]]], spread: float, photo_gap: float,
+                  album_interval: float, timeout: float, seed: int) -> Dict[str, Any]:
+        rng = random.Random(seed)
+        self.gateway.gateway.reset()
+        lag: List[float] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(_sample_lag(lag, stop))
+        done_before, photos_before = len(self.tracker.latencies), self.tracker.photos
+        rss_before, _ = _rss_mb()
+
+        started = perf_counter()
+        await asyncio.gather(*(
+            self.chat(chat_id, albums, rng.uniform(0, spread), photo_gap, album_interval)
+            for chat_id, albums in workload.items()
+        ))
+        try:
+            await asyncio.wait_for(self.tracker.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        wall = perf_counter() - started
+        stop.set()
+        await sampler
+
+        latencies = self.tracker.latencies[done_before:]
+        albums = sum(len(a) for a in workload.values())
+        rss, rss_peak = _rss_mb()
+        return {
+            "chats": len(workload),
+            "albums": albums,
+            "completed": len(latencies),
+            "timed_out": self.tracker.pending,
+            "merged_or_split": self.tracker.merged,
+            "album_p50_ms": _percentile(latencies, 0.5),
+            "album_p95_ms": _percentile(latencies, 0.95),
+            "album_max_ms": round(max(latencies, default=0.0), 1),
+            "albums_per_min": round(len(latencies) / wall * 60, 1),
+            "photos_per_s": round((self.tracker.photos - photos_before) / wall, 2),
+            "wall_s": round(wall, 1),
+            "rss_mb": round(rss, 1),
+            "rss_growth_mb": round(rss - rss_before, 1),
+            "rss_peak_mb": round(rss_peak, 1),
+            "loop_lag_p50_ms": _percentile(lag, 0.5),
+            "loop_lag_p95_ms": _percentile(lag, 0.95),
+            "loop_lag_max_ms": round(max(lag, default=0.0), 1),
+            "gateway": self.gateway.gateway.stats,
+        }
+
+
+def build_workload(chats: int, albums: int, source: List[List[bytes]], seed: int,
+                   first_chat: int = 1000) -> Dict[int, List[List[bytes]]]:
+    """Each chat sends `albums` albums drawn from `source`."""
+    rng = random.Random(seed + first_chat)
+    return {first_chat + c: [rng.choice(source) for _ in range(albums)] for c in range(chats)}
+
+
+def _print(level: str, stats: Dict[str, Any]) -> None:
+    print(f"  {level}: {stats['completed']}/{stats['albums']} albums, "
+          f"p50 {stats['album_p50_ms']}ms, p95 {stats['album_p95_ms']}ms, "
+          f"{stats['albums_per_min']} albums/min, {stats['photos_per_s']} photos/s, "
+          f"RSS {stats['rss_mb']}MB (+{stats['rss_growth_mb']}), "
+          f"loop lag p95 {stats['loop_lag_p95_ms']}ms max {stats['loop_lag_max_ms']}ms")
+    if stats["timed_out"]:
+        print(f"  ⚠️  {stats['timed_out']} albums did not finish in time")
+
+
+async def run(args: argparse.Namespace, config: Dict[str, ServiceConfig]) -> Dict[str, Any]:
+    gateway = MockGateway(args.fixtures, config, seed=args.seed)
+    url = gateway.start()
+    tmp = tempfile.mkdtemp(prefix="shoesbot-load-")
+    os.environ.update({
+        "MOCK_GATEWAY_URL": url, "BOT_TOKEN": BOT_TOKEN,
+        "DJANGO_API_URL": f"{url}/photos/api/upload-batch/",
+        "GOOGLE_VISION_API_KEY": os.getenv("GOOGLE_VISION_API_KEY") or "load-test",
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "load-test",
+    })
+    for name in ("TELEGRAM_API_BASE", "VISION_API_BASE", "OPENAI_API_BASE"):
+        os.environ.pop(name, None)  # everything goes to the gateway
+
+    # Imported only now: endpoints and the bot read their URLs at import time
+    import shoesbot.django_upload as django_upload
+    import shoesbot.metrics as metrics
+    from shoesbot.photo_queue import PhotoUploadQueue
+    metrics.METRICS_FILE = os.path.join(tmp, "metrics.jsonl")
+    django_upload._photo_queue = PhotoUploadQueue(os.path.join(tmp, "photo_queue.db"))
+
+    rng = random.Random(args.seed)
+    if args.synthetic:
+        # a small pool of generated albums, reused: encoding photos is not what we measure
+        source = [synthetic_album(rng, args.photos, f"GG{700 + i}") for i in range(4)]
+    else:
+        source = corpus_albums()
+
+    tracker = AlbumTracker()
+    load = LoadRun(gateway, tracker)
+    report: Dict[str, Any] = {"config": {k: v.__dict__ for k, v in config.items()}, "levels": {}}
+    try:
+        await load.app.initialize()
+        await load.app.start()
+        levels = [int(x) for x in args.ramp.split(",")] if args.ramp else [args.chats]
+        first_chat = 1000
+        for chats in levels:
+            workload = build_workload(chats, args.albums, source, args.seed, first_chat)
+            first_chat += chats
+            print(f"⏱️  {chats} chats x {args.albums} albums...")
+            stats = await load.run(workload, args.spread, args.photo_gap, args.album_interval,
+                                   args.timeout, args.seed)
+            report["levels"][str(chats)] = stats
+            _print(f"{chats} chats", stats)
+            if stats["timed_out"]:
+                break  # past the limit, higher levels only pile up
+    finally:
+        await load.app.stop()
+        await load.app.shutdown()
+        gateway.stop()
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end bot load test against the mock gateway")
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--albums", type=int, default=2, help="albums per chat")
+    parser.add_argument("--ramp", help="comma separated chat counts, run one after another")
+    parser.add_argument("--synthetic", action="store_true", help="generated photos instead of the corpus albums")
+    parser.add_argument("--photos", type=int, default=6, help="photos per synthetic album")
+    parser.add_argument("--spread", type=float, default=2.0, help="chats start within this many seconds")
+    parser.add_argument("--photo-gap", type=float, default=0.05, help="seconds between photos of an album")
+    parser.add_argument("--album-interval", type=float, default=5.0,
+                        help="seconds between albums of one chat (keep above the 3.2s buffer window)")
+    parser.add_argument("--timeout", type=float, default=180.0, help="max wait for albums after the last send")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", help="mock gateway fixtures (recorded API answers)")
+    parser.add_argument("--latency", action="append", default=[], metavar="[SERVICE=]MS")
+    parser.add_argument("--jitter", action="append", default=[], metavar="[SERVICE=]MS")
+    parser.add_argument("--error-rate", action="append", default=[], metavar="[SERVICE=]SHARE")
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="[SERVICE=]RPS")
+    parser.add_argument("-o", "--output", type=Path, help="write the full JSON report")
+    args = parser.parse_args(argv)
+
+    config: Dict[str, ServiceConfig] = {}
+    for option, field in (("latency", "latency_ms"), ("jitter", "jitter_ms"),
+                          ("error_rate", "error_rate"), ("rate_limit", "rate_limit")):
+        for service, number in _per_service(getattr(args, option), f"--{option.replace('_', '-')}").items():
+            setattr(config.setdefault(service, ServiceConfig()), field, number)
+
+    report = asyncio.run(run(args, config))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"📄 Report: {args.output}")
+    return 1 if any(level["timed_out"] for level in report["levels"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+"""Local stand-in for the external APIs (Vision, OpenAI, eBay, Pochtoy, FASHN, Telegram)."""
+from tools.mock_gateway.server import MockGateway, ServiceConfig
+
+__all__ = ["MockGateway", "ServiceConfig"]
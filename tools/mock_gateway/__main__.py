@@ -0,0 +1,57 @@
+"""python -m tools.mock_gateway [--port 8765] [--fixtures f.json] [--latency vision=300] ..."""
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from tools.mock_gateway.server import MockGateway, ServiceConfig  # noqa: E402
+
+
+def _per_service(values: List[str], option: str) -> Dict[str, float]:
+    """["vision=300", "250"] -> {"vision": 300.0, "*": 250.0}"""
+    out = {}
+    for value in values:
+        service, _, number = value.rpartition("=")
+        try:
+            out[service or "*"] = float(number)
+        except ValueError:
+            raise SystemExit(f"{option}: expected [service=]number, got {value!r}")
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Local stand-in for the external APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", help="JSON file with recorded answers")
+    parser.add_argument("--record", action="store_true", help="proxy unknown requests to the real APIs and store them")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", action="append", default=[], metavar="[SERVICE=]MS")
+    parser.add_argument("--jitter", action="append", default=[], metavar="[SERVICE=]MS")
+    parser.add_argument("--error-rate", action="append", default=[], metavar="[SERVICE=]SHARE")
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="[SERVICE=]RPS")
+    parser.add_argument("--burst", action="append", default=[], metavar="[SERVICE=]N")
+    args = parser.parse_args(argv)
+
+    config: Dict[str, ServiceConfig] = {}
+    for option, field in (("latency", "latency_ms"), ("jitter", "jitter_ms"), ("error_rate", "error_rate"),
+                          ("rate_limit", "rate_limit"), ("burst", "burst")):
+        for service, number in _per_service(getattr(args, option), f"--{option.replace('_', '-')}").items():
+            cfg = config.setdefault(service, ServiceConfig())
+            setattr(cfg, field, int(number) if field == "burst" else number)
+
+    gateway = MockGateway(args.fixtures, config, seed=args.seed, record=args.record, host=args.host, port=args.port)
+    print(f"Mock gateway on {gateway.url}")
+    print(f"  export MOCK_GATEWAY_URL={gateway.url}")
+    try:
+        gateway.serve_forever()
+    except KeyboardInterrupt:
+        gateway.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,468 @@
+"""Stand-in HTTP server for every external API the bot and the site call.
+
+All services share one port and are told apart by path, so pointing
+MOCK_GATEWAY_URL (see shoesbot/endpoints.py) at the gateway is enough.
+
+Answers come from, in order:
+1. a recorded fixture for the same method, path and body (sha1)
+2. a recorded fixture for the same method and path
+3. a synthetic minimal valid response for the service
+In record mode requests without a fixture are proxied to the real service
+and the answer is stored.
+
+Per service faults can be injected: latency (+ jitter), a share of 500/503
+errors and a token-bucket rate limit answered with 429 + Retry-After.
+A seeded RNG keeps runs repeatable.  Admin endpoints:
+GET /__gateway/stats, POST /__gateway/config, POST /__gateway/reset.
+"""
+from __future__ import annotations
+import base64
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# (service, path regex); first match wins
+ROUTES: List[Tuple[str, re.Pattern]] = [
+    ("vision", re.compile(r"^/v1/images:annotate$")),
+    ("openai", re.compile(r"^/v1/chat/completions$")),
+    ("customsearch", re.compile(r"^/customsearch/v1$")),
+    ("ebay-finding", re.compile(r"^/services/search/FindingService/v1$")),
+    ("ebay-auth", re.compile(r"^/(identity/v1/oauth2/token|oauth2/authorize)$")),
+    ("ebay-sell", re.compile(r"^/sell/")),
+    ("pochtoy", re.compile(r"^/api/garage-tg/")),
+    ("fashn", re.compile(r"^/v1/(run|status/[^/]+)$")),
+    ("telegram", re.compile(r"^/(file/)?bot[^/]+/")),
+    ("django", re.compile(r"^/photos/api/")),
+]
+
+# Where record mode forwards to
+UPSTREAMS = {
+    "vision": "https://vision.googleapis.com",
+    "openai": "https://api.openai.com",
+    "customsearch": "https://www.googleapis.com",
+    "ebay-finding": "https://svcs.ebay.com",
+    "ebay-auth": "https://auth.ebay.com",
+    "ebay-sell": "https://api.ebay.com",
+    "pochtoy": "https://pochtoy-test.pochtoy3.ru",
+    "fashn": "https://api.fashn.ai",
+    "telegram": "https://api.telegram.org",
+    "django": "http://127.0.0.1:8000",
+}
+
+# Query parameters that carry secrets: dropped from fixture keys and recordings
+SECRET_PARAMS = {"key", "api_key", "SECURITY-APPNAME", "cx"}
+TELEGRAM_TOKEN_RE = re.compile(r"^/(file/)?bot[^/]+/")
+
+
+@dataclass
+class ServiceConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0  # share of requests answered with 500/503
+    rate_limit: float = 0.0  # requests per second, 0 = unlimited
+    burst: int = 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self) -> float:
+        """0 if a token was taken, otherwise seconds until the next one."""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def route(path: str) -> Optional[str]:
+    for service, pattern in ROUTES:
+        if pattern.match(path):
+            return service
+    return None
+
+
+def normalize_path(path: str) -> str:
+    """Path without the bot token so fixtures work for any bot."""
+    return TELEGRAM_TOKEN_RE.sub(lambda m: f"/{m.group(1) or ''}bot<token>/", path)
+
+
+def fixture_key(method: str, path: str, query: str, body: bytes) -> Tuple[str, str, str]:
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k not in SECRET_PARAMS]
+    digest = hashlib.sha1(urlencode(sorted(params)).encode() + b"\n" + body).hexdigest()
+    return method, normalize_path(path), digest
+
+
+class Fixtures:
+    """Recorded answers, stored as {"entries": [{method, path, body_sha1, status, headers, body}]}."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: List[dict] = []
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f).get("entries", [])
+            except FileNotFoundError:
+                pass
+
+    def find(self, method: str, path: str, digest: str) -> Optional[dict]:
+        loose = None
+        for entry in self.entries:
+            if entry["method"] == method and entry["path"] == path:
+                if entry.get("body_sha1") == digest:
+                    return entry
+                loose = loose or entry
+        return loose
+
+    def add(self, method: str, path: str, digest: str, status: int, headers: dict, body: bytes) -> None:
+        try:
+            text, encoding = body.decode("utf-8"), "text"
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(body).decode(), "base64"
+        entry = {"method": method, "path": path, "body_sha1": digest, "status": status,
+                 "headers": {k: v for k, v in headers.items() if k.lower() == "content-type"},
+                 "body": text, "encoding": encoding}
+        with self._lock:
+            self.entries.append(entry)
+            if self.path:
+                with open(self.path, "w") as f:
+                    json.dump({"entries": self.entries}, f, ensure_ascii=False, indent=1)
+
+
+def fixture_body(entry: dict) -> bytes:
+    if entry.get("encoding") == "base64":
+        return base64.b64decode(entry["body"])
+    body = entry.get("body", "")
+    return body.encode() if isinstance(body, str) else json.dumps(body).encode()
+
+
+def parse_form(content_type: str, body: bytes) -> dict:
+    """JSON, urlencoded or multipart request parameters (files become their size)."""
+    if not body:
+        return {}
+    if "json" in content_type:
+        try:
+            return json.loads(body)
+        except ValueError:
+            return {}
+    if "multipart/form-data" in content_type:
+        message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        fields = {}
+        for part in message.get_payload() if message.is_multipart() else []:
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            fields[name] = len(payload) if part.get_filename() else payload.decode("utf-8", "replace")
+        return fields
+    return dict(parse_qsl(body.decode("utf-8", "replace")))
+
+
+class Synthetic:
+    """Minimal valid answers, enough for the callers to go down their happy path."""
+
+    def __init__(self):
+        self._ids = iter(range(1, 10 ** 9))
+        self._lock = threading.Lock()
+        self.files: Dict[str, bytes] = {}  # telegram file_id -> content served by getFile/download
+
+    def next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def respond(self, service: str, method: str, path: str, query: dict, params: dict) -> Tuple[int, dict, bytes]:
+        handler = getattr(self, service.replace("-", "_"))
+        result = handler(method, path, query, params)
+        if isinstance(result, tuple):
+            return result
+        return 200, {"Content-Type": "application/json"}, json.dumps(result).encode()
+
+    def vision(self, method, path, query, params):
+        count = len(params.get("requests", [])) or 1
+        return {"responses": [{"textAnnotations": [], "fullTextAnnotation": {"text": ""}} for _ in range(count)]}
+
+    def openai(self, method, path, query, params):
+        return {
+            "id": f"chatcmpl-mock-{self.next_id()}", "object": "chat.completion", "created": int(time.time()),
+            "model": params.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "{}"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def customsearch(self, method, path, query, params):
+        return {"kind": "customsearch#search", "items": []}
+
+    def ebay_finding(self, method, path, query, params):
+        operation = query.get("OPERATION-NAME", "findItemsAdvanced")
+        return {f"{operation}Response": [{"ack": ["Success"], "searchResult": [{"@count": "0", "item": []}]}]}
+
+    def ebay_auth(self, method, path, query, params):
+        if path.endswith("/authorize"):
+            target = f"{query.get('redirect_uri', '/')}?{urlencode({'code': 'mock-code', 'state': query.get('state', '')})}"
+            return 302, {"Location": target}, b""
+        return {"access_token": f"mock-token-{self.next_id()}", "expires_in": 7200,
+                "refresh_token": "mock-refresh", "refresh_token_expires_in": 47304000,
+                "token_type": "User Access Token"}
+
+    def ebay_sell(self, method, path, query, params):
+        if path.endswith("/publish") or path.endswith("/withdraw"):
+            return {"listingId": str(110000000000 + self.next_id())}
+        if method == "POST" and path.endswith("/offer"):
+            return 201, {"Content-Type": "application/json"}, json.dumps({"offerId": str(self.next_id())}).encode()
+        if method in ("PUT", "DELETE"):
+            return 204, {}, b""
+        return {}
+
+    def pochtoy(self, method, path, query, params):
+        return {"status": "ok"}
+
+    def fashn(self, method, path, query, params):
+        if path.endswith("/run"):
+            return {"id": f"mock-{self.next_id()}", "error": None}
+        return {"id": path.rsplit("/", 1)[-1], "status": "completed",
+                "output": ["https://example.com/fashn-mock.jpg"], "error": None}
+
+    def telegram(self, method, path, query, params):
+        if path.startswith("/file/"):
+            file_id = path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+            return 200, {"Content-Type": "image/jpeg"}, self.files.get(file_id) or _placeholder_jpeg()
+        api_method = path.rsplit("/", 1)[-1]
+        params = {**query, **params}
+        chat = {"id": int(params.get("chat_id", 1) or 1), "type": "private"}
+
+        def message(**extra):
+            return {"message_id": self.next_id(), "date": int(time.time()), "chat": chat, **extra}
+
+        def photo():
+            file_id = f"mock-photo-{self.next_id()}"
+            return [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}]
+
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Mock", "username": "mock_bot"}
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = message(text=params.get("text", ""))
+        elif api_method == "sendPhoto":
+            result = message(photo=photo(), caption=params.get("caption"))
+        elif api_method == "sendMediaGroup":
+            media = params.get("media", "[]")
+            media = json.loads(media) if isinstance(media, str) else media
+            group = str(self.next_id())
+            result = [message(photo=photo(), media_group_id=group) for _ in media]
+        elif api_method == "getFile":
+            file_id = params.get("file_id", "mock")
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.files.get(file_id) or _placeholder_jpeg()),
+                      "file_path": f"photos/{file_id}.jpg"}
+        elif api_method == "getUpdates":
+            result = []
+        else:  # deleteMessage, answerCallbackQuery, setMyCommands, deleteWebhook, ...
+            result = True
+        return {"ok": True, "result": result}
+
+    def django(self, method, path, query, params):
+        return {"status": "ok", "batch_id": self.next_id(), "photos": len(params.get("photos", []))}
+
+
+_JPEG: Optional[bytes] = None
+
+
+def _placeholder_jpeg() -> bytes:
+    global _JPEG
+    if _JPEG is None:
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", (64, 48), (200, 200, 200)).save(buf, format="JPEG")
+        _JPEG = buf.getvalue()
+    return _JPEG
+
+
+class Gateway:
+    """State shared by the request handler threads."""
+
+    def __init__(self, fixtures: Fixtures, config: Optional[Dict[str, ServiceConfig]] = None,
+                 seed: int = 0, record: bool = False):
+        self.fixtures = fixtures
+        self.config: Dict[str, ServiceConfig] = dict(config or {})
+        self.record = record
+        self.synthetic = Synthetic()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def service_config(self, service: str) -> ServiceConfig:
+        return self.config.get(service) or self.config.get("*") or ServiceConfig()
+
+    def configure(self, changes: Dict[str, dict]) -> None:
+        with self._lock:
+            for service, values in changes.items():
+                current = asdict(self.config.get(service, ServiceConfig()))
+                current.update(values)
+                self.config[service] = ServiceConfig(**current)
+                self._buckets.pop(service, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats.clear()
+            self._buckets.clear()
+
+    def fault(self, service: str) -> Tuple[float, Optional[Tuple[int, dict, bytes]]]:
+        """Injected delay (seconds) and an error response, if this request gets one."""
+        cfg = self.service_config(service)
+        with self._lock:
+            if cfg.rate_limit > 0:
+                bucket = self._buckets.get(service)
+                if bucket is None:
+                    bucket = self._buckets[service] = TokenBucket(cfg.rate_limit, cfg.burst)
+                wait = bucket.take()
+                if wait:
+                    body = json.dumps({"error": {"code": 429, "message": "rate limited by mock gateway"}}).encode()
+                    return 0.0, (429, {"Content-Type": "application/json",
+                                       "Retry-After": str(max(1, round(wait)))}, body)
+            delay = max(0.0, cfg.latency_ms + self._rng.uniform(-cfg.jitter_ms, cfg.jitter_ms)) / 1000.0
+            if cfg.error_rate and self._rng.random() < cfg.error_rate:
+                status = self._rng.choice((500, 503))
+                body = json.dumps({"error": {"code": status, "message": "injected by mock gateway"}}).encode()
+                return delay, (status, {"Content-Type": "application/json"}, body)
+        return delay, None
+
+    def count(self, service: str, status: int, elapsed: float) -> None:
+        with self._lock:
+            s = self.stats.setdefault(service, {"requests": 0, "errors": 0, "rate_limited": 0, "total_ms": 0.0})
+            s["requests"] += 1
+            s["total_ms"] += elapsed * 1000
+            if status == 429:
+                s["rate_limited"] += 1
+            elif status >= 500:
+                s["errors"] += 1
+
+    def forward(self, service: str, method: str, path: str, query: str, headers: dict, body: bytes):
+        import requests
+        url = f"{UPSTREAMS[service]}{path}" + (f"?{query}" if query else "")
+        keep = {k: v for k, v in headers.items() if k.lower() not in ("host", "content-length", "accept-encoding")}
+        resp = requests.request(method, url, headers=keep, data=body, timeout=120)
+        return resp.status_code, dict(resp.headers), resp.content
+
+    def handle(self, method: str, path: str, query: str, headers: dict, body: bytes) -> Tuple[int, dict, bytes]:
+        started = time.perf_counter()
+        service = route(path)
+        if service is None:
+            return 404, {"Content-Type": "application/json"}, b'{"error": "no such service"}'
+
+        delay, error = self.fault(service)
+        if delay:
+            time.sleep(delay)
+        if error:
+            status, out_headers, out_body = error
+        else:
+            key = fixture_key(method, path, query, body)
+            entry = self.fixtures.find(*key)
+            if entry is not None and not (self.record and entry["body_sha1"] != key[2]):
+                status, out_headers, out_body = entry["status"], dict(entry.get("headers", {})), fixture_body(entry)
+            elif self.record:
+                status, out_headers, out_body = self.forward(service, method, path, query, headers, body)
+                self.fixtures.add(*key, status, out_headers, out_body)
+            else:
+                params = parse_form(headers.get("Content-Type", ""), body)
+                status, out_headers, out_body = self.synthetic.respond(
+                    service, method, path, dict(parse_qsl(query)), params)
+        self.count(service, status, time.perf_counter() - started)
+        return status, out_headers, out_body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    gateway: Gateway  # set on the subclass made per server
+
+    def log_message(self, format, *args):  # noqa: A002 - keep test output quiet
+        pass
+
+    def _serve(self):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if parts.path.startswith("/__gateway/"):
+            status, headers, out = self._admin(parts.path, body)
+        else:
+            status, headers, out = self.gateway.handle(
+                self.command, parts.path, parts.query, dict(self.headers.items()), body)
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() not in ("content-length", "transfer-encoding", "connection", "content-encoding"):
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(out)
+
+    def _admin(self, path: str, body: bytes):
+        gw = self.gateway
+        if path == "/__gateway/config" and self.command == "POST":
+            gw.configure(json.loads(body or b"{}"))
+        elif path == "/__gateway/reset" and self.command == "POST":
+            gw.reset()
+        elif path not in ("/__gateway/stats", "/__gateway/config"):
+            return 404, {}, b""
+        payload = {"stats": gw.stats, "config": {k: asdict(v) for k, v in gw.config.items()}}
+        return 200, {"Content-Type": "application/json"}, json.dumps(payload).encode()
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_HEAD = _serve
+
+
+class MockGateway:
+    """Run the gateway in a background thread; start() returns its base URL.
+
+        with MockGateway(config={"vision": ServiceConfig(latency_ms=300)}) as url:
+            os.environ["MOCK_GATEWAY_URL"] = url
+    """
+
+    def __init__(self, fixtures: Optional[str] = None, config: Optional[Dict[str, ServiceConfig]] = None,
+                 seed: int = 0, record: bool = False, host: str = "127.0.0.1", port: int = 0):
+        self.gateway = Gateway(Fixtures(fixtures), config, seed=seed, record=record)
+        self.host, self.port = host, port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> str:
+        handler = type("Handler", (_Handler,), {"gateway": self.gateway})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-gateway", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self) -> None:
+        self.start()
+        self._thread.join()
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> str:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()